@@ -1,4 +1,20 @@
-from cadastro_paciente import patient_registration
-from gerenciamento_medicamentos import medication_management
-from diario_diario import daily_diary
-from visualizar_dados import view_data
\ No newline at end of file
+import importlib
+
+# As páginas são importadas sob demanda (PEP 562): importar o pacote não
+# carrega pandas, plotly, pyarrow nem openpyxl.
+_PAGES = {
+    "patient_registration": "cadastro_paciente",
+    "medication_management": "gerenciamento_medicamentos",
+    "daily_diary": "diario_diario",
+    "view_data": "visualizar_dados",
+}
+
+__all__ = list(_PAGES)
+
+
+def __getattr__(name):
+    if name not in _PAGES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    valor = getattr(importlib.import_module(_PAGES[name]), name)
+    globals()[name] = valor
+    return valor
@@ -0,0 +1,403 @@
+"""
+Adesão à medicação da ala: doses esperadas (medicamentos.frequencia) x doses
+tomadas (doses_tomadas), por medicamento e dia.
+
+Os resultados ficam em `adesao_diaria`. Cada dia novo é calculado uma única
+vez para todos os medicamentos; depois disso, só os dias marcados em
+`adesao_pendente` pelos gatilhos de doses_tomadas e medicamentos são
+recalculados. Todo o cálculo é feito no banco, em comandos sobre conjuntos.
+
+As páginas calculam na hora só os dias pendentes e até DIAS_NA_PAGINA dias
+novos. Um atraso maior, como o histórico inteiro numa instalação nova, é
+calculado por uma thread em segundo plano; para não esperar por ela, rode
+`python adesao.py` depois de aplicar as migrações.
+
+    python adesao.py                                   # atualização incremental
+    python adesao.py --reconstruir --inicio 2024-01-01 # recalcula um período
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from cache import cached_fetchall, invalidate
+from db import connection, get_connection
+
+
+ADESAO_LOCK_ID = 7264001
+# Intervalo mínimo, em segundos, entre atualizações disparadas pelas páginas
+ADESAO_INTERVALO = float(os.environ.get("MEDTRACK_ADESAO_INTERVALO", 60.0))
+# Dias calculados por transação ao processar períodos longos
+DIAS_POR_BLOCO = 31
+# Dias novos que uma atualização disparada pela página calcula; mais que isso fica em segundo plano
+DIAS_NA_PAGINA = int(os.environ.get("MEDTRACK_ADESAO_DIAS_NA_PAGINA", 3))
+
+# Recalcula os pares (medicamento, dia) de `alvos`, que deve expor
+# medicamento_id, paciente_id, esperadas e data
+_RECALCULO_SQL = """
+    WITH {ctes}alvos AS ({alvos}),
+    tomadas AS (
+        SELECT a.medicamento_id, a.data, count(DISTINCT t.dose) AS tomadas
+        FROM alvos a
+        JOIN doses_tomadas t
+          ON t.medicamento_id = a.medicamento_id
+         AND t.data_hora >= a.data AND t.data_hora < a.data + 1
+        WHERE t.dose BETWEEN 1 AND a.esperadas
+        GROUP BY a.medicamento_id, a.data
+    )
+    INSERT INTO adesao_diaria (medicamento_id, data, paciente_id, esperadas, tomadas)
+    SELECT a.medicamento_id, a.data, a.paciente_id, a.esperadas, coalesce(t.tomadas, 0)
+    FROM alvos a
+    LEFT JOIN tomadas t ON t.medicamento_id = a.medicamento_id AND t.data = a.data
+    ON CONFLICT (medicamento_id, data) DO UPDATE
+    SET paciente_id = EXCLUDED.paciente_id, esperadas = EXCLUDED.esperadas,
+        tomadas = EXCLUDED.tomadas, atualizado_em = now();
+"""
+
+# Todos os medicamentos já prescritos em cada dia do período
+_ALVOS_PERIODO = """
+    SELECT m.id AS medicamento_id, m.paciente_id, m.frequencia AS esperadas, d::date AS data
+    FROM medicamentos m
+    CROSS JOIN generate_series(%(inicio)s::date, %(fim)s::date, interval '1 day') AS d
+    WHERE d::date >= m.criado_em::date
+"""
+
+# Dias marcados pelos gatilhos, removidos no mesmo comando que os recalcula.
+# Uma marcação refeita por outra transação durante o comando muda de versão e
+# não é removida; fica para a próxima atualização.
+_PENDENTES_CTES = """
+    pendentes AS (SELECT medicamento_id, data, versao FROM adesao_pendente),
+    removidas AS (
+        DELETE FROM adesao_pendente a
+        USING pendentes p
+        WHERE a.medicamento_id = p.medicamento_id AND a.data = p.data AND a.versao = p.versao
+    ),
+"""
+
+# Doses registradas antes da prescrição também contam
+_ALVOS_PENDENTES = """
+    SELECT m.id AS medicamento_id, m.paciente_id, m.frequencia AS esperadas, p.data
+    FROM pendentes p
+    JOIN medicamentos m ON m.id = p.medicamento_id
+"""
+
+_ultima_atualizacao = 0.0
+_atualizacao_lock = threading.Lock()
+
+
+def _blocks(inicio, fim):
+    """
+    Divide o período [inicio, fim] em blocos de DIAS_POR_BLOCO dias.
+    """
+    while inicio <= fim:
+        fim_bloco = min(inicio + timedelta(days=DIAS_POR_BLOCO - 1), fim)
+        yield inicio, fim_bloco
+        inicio = fim_bloco + timedelta(days=1)
+
+
+def _recalculate_period(conn, inicio, fim, verbose=False):
+    """
+    Recalcula todos os medicamentos no período, um bloco por transação. Retorna as linhas gravadas.
+    """
+    total = 0
+    for inicio_bloco, fim_bloco in _blocks(inicio, fim):
+        with conn.cursor() as cursor:
+            cursor.execute(
+                _RECALCULO_SQL.format(ctes="", alvos=_ALVOS_PERIODO), {"inicio": inicio_bloco, "fim": fim_bloco}
+            )
+            total += cursor.rowcount
+            cursor.execute(
+                """
+                UPDATE adesao_controle
+                SET calculado_ate = greatest(coalesce(calculado_ate, %(fim)s), %(fim)s);
+                """,
+                {"fim": fim_bloco}
+            )
+        conn.commit()
+        if verbose:
+            print(f"Adesão calculada de {inicio_bloco} a {fim_bloco}")
+    return total
+
+
+def _recalculate_pending(conn):
+    """
+    Recalcula os dias marcados como pendentes e remove as marcações lidas.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(_RECALCULO_SQL.format(ctes=_PENDENTES_CTES, alvos=_ALVOS_PENDENTES))
+        total = cursor.rowcount
+    conn.commit()
+    return total
+
+
+def _first_uncalculated_day(conn):
+    """
+    Primeiro dia ainda não calculado (None se não há medicamentos).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT coalesce(c.calculado_ate + 1, (SELECT min(criado_em)::date FROM medicamentos)) AS inicio
+            FROM adesao_controle c;
+            """
+        )
+        inicio = cursor.fetchone()['inicio']
+    conn.commit()
+    return inicio
+
+
+def refresh_adherence(conn, verbose=False, max_dias=None):
+    """
+    Atualiza adesao_diaria: calcula os dias ainda não calculados até hoje e
+    recalcula os dias pendentes. Com `max_dias`, os dias novos só são
+    calculados se forem no máximo `max_dias`. Retorna as linhas gravadas, ou
+    None se outra atualização já estiver em andamento.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s) AS obtido;", (ADESAO_LOCK_ID,))
+        if not cursor.fetchone()['obtido']:
+            conn.rollback()
+            return None
+    try:
+        inicio = _first_uncalculated_day(conn)
+        total = 0
+        hoje = date.today()
+        if inicio is not None and inicio <= hoje and (max_dias is None or (hoje - inicio).days < max_dias):
+            total += _recalculate_period(conn, inicio, hoje, verbose)
+        total += _recalculate_pending(conn)
+        return total
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (ADESAO_LOCK_ID,))
+        conn.commit()
+
+
+def rebuild_adherence(conn, inicio, fim=None, verbose=False):
+    """
+    Recalcula todos os medicamentos no período, por exemplo após correções em massa.
+    """
+    return _recalculate_period(conn, inicio, fim or date.today(), verbose)
+
+
+_recuperacao = None
+_recuperacao_lock = threading.Lock()
+
+
+def _catch_up():
+    global _recuperacao
+    try:
+        conn = get_connection()
+        if conn is None:
+            return
+        try:
+            total = refresh_adherence(conn)
+            if total is not None:
+                print(f"Histórico da adesão calculado: {total} linhas.")
+        except Exception as e:
+            conn.rollback()
+            print(f"Erro ao calcular o histórico da adesão: {e}")
+        finally:
+            conn.close()
+        invalidate(("adesao",))
+    finally:
+        # Uma próxima atualização da página pode tentar de novo
+        with _recuperacao_lock:
+            _recuperacao = None
+
+
+def start_catch_up():
+    """
+    Inicia, se ainda não estiver rodando, a thread que calcula os dias novos
+    que passam de DIAS_NA_PAGINA.
+    """
+    global _recuperacao
+    with _recuperacao_lock:
+        if _recuperacao is None:
+            _recuperacao = threading.Thread(target=_catch_up, name="medtrack-adesao", daemon=True)
+            _recuperacao.start()
+    return _recuperacao
+
+
+def refresh_if_due():
+    """
+    Atualização incremental disparada pelas páginas, no máximo uma vez a cada
+    ADESAO_INTERVALO segundos por processo. Calcula os dias pendentes e até
+    DIAS_NA_PAGINA dias novos; um atraso maior vai para start_catch_up. Quem
+    chega durante uma atualização espera por ela, para não ler a tabela antiga.
+    """
+    global _ultima_atualizacao
+    with _atualizacao_lock:
+        if time.monotonic() - _ultima_atualizacao < ADESAO_INTERVALO:
+            return
+        _ultima_atualizacao = time.monotonic()
+
+        with connection() as conn:
+            if conn is None:
+                return
+            try:
+                inicio = _first_uncalculated_day(conn)
+                if inicio is not None and (date.today() - inicio).days >= DIAS_NA_PAGINA:
+                    start_catch_up()
+                refresh_adherence(conn, max_dias=DIAS_NA_PAGINA)
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Erro ao atualizar adesão: {e}")
+                return
+    # Outros processos também consomem as marcações pendentes
+    invalidate(("adesao",))
+
+
+def fetch_ward_adherence(inicio, fim):
+    """
+    Doses esperadas e tomadas por paciente no período, da menor para a maior adesão.
+    """
+    try:
+        return cached_fetchall(
+            """
+            SELECT p.id, p.nome, sum(a.esperadas) AS esperadas, sum(a.tomadas) AS tomadas,
+                   round(100.0 * sum(a.tomadas) / nullif(sum(a.esperadas), 0), 1) AS adesao
+            FROM adesao_diaria a
+            JOIN pacientes p ON p.id = a.paciente_id
+            WHERE a.data BETWEEN %s AND %s
+            GROUP BY p.id, p.nome
+            ORDER BY adesao NULLS LAST, p.nome;
+            """,
+            (inicio, fim),
+            tags=[("adesao",), ("pacientes",)]
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar adesão da ala: {e}")
+    return []
+
+
+def fetch_patient_adherence(paciente_id, inicio, fim):
+    """
+    Doses esperadas e tomadas por medicamento de um paciente no período.
+    """
+    try:
+        return cached_fetchall(
+            """
+            SELECT m.nome, sum(a.esperadas) AS esperadas, sum(a.tomadas) AS tomadas,
+                   round(100.0 * sum(a.tomadas) / nullif(sum(a.esperadas), 0), 1) AS adesao
+            FROM adesao_diaria a
+            JOIN medicamentos m ON m.id = a.medicamento_id
+            WHERE a.paciente_id = %s AND a.data BETWEEN %s AND %s
+            GROUP BY m.id, m.nome
+            ORDER BY m.nome;
+            """,
+            (paciente_id, inicio, fim),
+            tags=[("adesao",), ("medicamentos", paciente_id)]
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar adesão do paciente: {e}")
+    return []
+
+
+def _adherence_frame(registros, colunas):
+    df = pd.DataFrame(registros)
+    df = df.rename(columns={
+        "nome": colunas, "esperadas": "Esperadas", "tomadas": "Tomadas", "adesao": "Adesão (%)"
+    })
+    return df[[colunas, "Esperadas", "Tomadas", "Adesão (%)"]]
+
+
+def period_input(key):
+    """
+    Seletor do período das tabelas de adesão; None enquanto o período estiver incompleto.
+    """
+    hoje = datetime.now().date()
+    periodo = st.date_input("Período", value=(hoje - timedelta(days=6), hoje), key=key)
+    if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+        st.info("Selecione a data inicial e a final.")
+        return None
+    return periodo
+
+
+def ward_adherence(inicio, fim):
+    """
+    Atualiza a adesão, se for a hora, e lê a da ala no período.
+    """
+    refresh_if_due()
+    return fetch_ward_adherence(inicio, fim)
+
+
+def patient_adherence(paciente_id, inicio, fim):
+    """
+    Atualiza a adesão, se for a hora, e lê a de um paciente no período.
+    """
+    refresh_if_due()
+    return fetch_patient_adherence(paciente_id, inicio, fim)
+
+
+def render_ward_adherence(periodo=None, registros=None):
+    """
+    Tabela de adesão de todos os pacientes da ala no período. `periodo` e
+    `registros` podem vir já lidos, quando a página faz as leituras em paralelo.
+    """
+    if periodo is None:
+        periodo = period_input("adesao_ala_periodo")
+        if periodo is None:
+            return
+    if registros is None:
+        registros = ward_adherence(*periodo)
+    if registros:
+        st.dataframe(_adherence_frame(registros, "Paciente"), hide_index=True)
+    else:
+        st.info("Nenhuma dose esperada no período.")
+
+
+def render_patient_adherence(paciente_id, periodo=None, registros=None):
+    """
+    Tabela de adesão por medicamento de um paciente no período. `periodo` e
+    `registros` podem vir já lidos, quando a página faz as leituras em paralelo.
+    """
+    if periodo is None:
+        periodo = period_input("adesao_paciente_periodo")
+        if periodo is None:
+            return
+    if registros is None:
+        registros = patient_adherence(paciente_id, *periodo)
+    if registros:
+        st.dataframe(_adherence_frame(registros, "Medicamento"), hide_index=True)
+    else:
+        st.info("Nenhuma dose esperada no período.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Atualiza a tabela de adesão à medicação.")
+    parser.add_argument("--reconstruir", action="store_true", help="Recalcula todo o período informado.")
+    parser.add_argument("--inicio", type=date.fromisoformat, help="Data inicial da reconstrução (AAAA-MM-DD).")
+    parser.add_argument("--fim", type=date.fromisoformat, help="Data final da reconstrução (padrão: hoje).")
+    args = parser.parse_args(argv)
+    if args.reconstruir and args.inicio is None:
+        parser.error("--reconstruir exige --inicio")
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        if args.reconstruir:
+            total = rebuild_adherence(conn, args.inicio, args.fim, verbose=True)
+        else:
+            total = refresh_adherence(conn, verbose=True)
+            if total is None:
+                print("Outra atualização da adesão está em andamento.")
+                return 0
+        print(f"Adesão atualizada: {total} linhas.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao atualizar a adesão: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
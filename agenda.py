@@ -0,0 +1,237 @@
+"""
+Agenda de doses: horários previstos de cada dose dos medicamentos.
+
+Cada medicamento tem o horário da primeira dose do dia (`horario_inicio`) e o
+intervalo entre doses (`intervalo_horas`; sem intervalo, as `frequencia` doses
+são distribuídas igualmente pelas 24 horas). A tabela `agenda_doses` guarda os
+horários já calculados de DIAS_RETIDOS dias atrás até HORIZONTE_DIAS à
+frente, com `tomada_em` mantida pelos gatilhos de doses_tomadas. Assim, as
+doses pendentes da ala numa janela de horário saem de uma única varredura do
+índice parcial agenda_doses_pendentes_idx.
+
+    python agenda.py                  # estende o horizonte e remove dias antigos
+    python agenda.py --reconstruir    # refaz a agenda de ontem até o horizonte
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import streamlit as st
+
+from cache import cached_fetchall, invalidate
+from db import connection, get_connection
+from metricas import metrics
+
+
+AGENDA_LOCK_ID = 7264002
+HORIZONTE_DIAS = int(os.environ.get("MEDTRACK_AGENDA_HORIZONTE", 7))
+DIAS_RETIDOS = int(os.environ.get("MEDTRACK_AGENDA_DIAS_RETIDOS", 7))
+# Intervalo mínimo, em segundos, entre verificações do horizonte disparadas pelas páginas
+AGENDA_INTERVALO = float(os.environ.get("MEDTRACK_AGENDA_INTERVALO", 600.0))
+# Quantas doses a visão da ala mostra no máximo
+LIMITE_DOSES = 500
+# Opções da janela da visão da ala, em horas, e os índices padrão
+ATRASOS = [1, 2, 4, 8, 12, 24]
+PROXIMAS = [1, 2, 4, 8]
+ATRASO_PADRAO = 2
+PROXIMAS_PADRAO = 0
+
+
+def expected_time(data, horario_inicio, frequencia, intervalo_horas, dose):
+    """
+    Horário previsto da dose `dose` (1..frequencia) no dia `data`; mesma regra
+    de agenda_doses_gerar() na migração 0009.
+    """
+    intervalo = timedelta(hours=float(intervalo_horas)) if intervalo_horas else timedelta(hours=24) / frequencia
+    return datetime.combine(data, horario_inicio) + (dose - 1) * intervalo
+
+
+def extend_schedule(conn, horizonte=HORIZONTE_DIAS, dias_retidos=DIAS_RETIDOS, verbose=False):
+    """
+    Gera a agenda dos dias ainda não gerados até hoje + `horizonte` e remove
+    os dias anteriores a hoje - `dias_retidos`. Retorna as linhas geradas, ou
+    None se outra atualização já estiver em andamento.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s) AS obtido;", (AGENDA_LOCK_ID,))
+        if not cursor.fetchone()['obtido']:
+            conn.rollback()
+            return None
+    try:
+        hoje = date.today()
+        fim = hoje + timedelta(days=horizonte)
+        with conn.cursor() as cursor:
+            # A trava faz os gatilhos de medicamentos esperarem o novo horizonte
+            cursor.execute("SELECT gerado_ate FROM agenda_controle FOR UPDATE;")
+            gerado_ate = cursor.fetchone()['gerado_ate']
+            inicio = hoje - timedelta(days=1)
+            if gerado_ate is not None:
+                inicio = max(inicio, gerado_ate + timedelta(days=1))
+
+            gerados = 0
+            if inicio <= fim:
+                cursor.execute("SELECT agenda_doses_gerar(%s, %s) AS gerados;", (inicio, fim))
+                gerados = cursor.fetchone()['gerados']
+                cursor.execute("UPDATE agenda_controle SET gerado_ate = %s;", (fim,))
+                if verbose:
+                    print(f"Agenda de {inicio} a {fim}: {gerados} doses.")
+
+            cursor.execute("DELETE FROM agenda_doses WHERE data < %s;", (hoje - timedelta(days=dias_retidos),))
+            if verbose and cursor.rowcount:
+                print(f"{cursor.rowcount} doses anteriores a {hoje - timedelta(days=dias_retidos)} removidas.")
+        conn.commit()
+        return gerados
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (AGENDA_LOCK_ID,))
+        conn.commit()
+
+
+def rebuild_schedule(conn, horizonte=HORIZONTE_DIAS, verbose=False):
+    """
+    Refaz a agenda de todos os medicamentos, de ontem até hoje + `horizonte`.
+    """
+    hoje = date.today()
+    fim = hoje + timedelta(days=horizonte)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT gerado_ate FROM agenda_controle FOR UPDATE;")
+        cursor.execute("SELECT agenda_doses_gerar(%s, %s) AS gerados;", (hoje - timedelta(days=1), fim))
+        gerados = cursor.fetchone()['gerados']
+        cursor.execute("UPDATE agenda_controle SET gerado_ate = greatest(gerado_ate, %s);", (fim,))
+    conn.commit()
+    if verbose:
+        print(f"Agenda refeita até {fim}: {gerados} doses.")
+    return gerados
+
+
+_ultima_extensao = float("-inf")
+_extensao_lock = threading.Lock()
+
+
+def extend_if_due():
+    """
+    Extensão do horizonte disparada pelas páginas, no máximo uma vez a cada
+    AGENDA_INTERVALO segundos por processo.
+    """
+    global _ultima_extensao
+    with _extensao_lock:
+        if time.monotonic() - _ultima_extensao < AGENDA_INTERVALO:
+            return
+        _ultima_extensao = time.monotonic()
+
+    with connection() as conn:
+        if conn is None:
+            return
+        try:
+            gerados = extend_schedule(conn)
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Erro ao estender a agenda de doses: {e}")
+            return
+    if gerados:
+        invalidate(("agenda",))
+
+
+def fetch_due_doses(inicio, fim, limite=LIMITE_DOSES):
+    """
+    Doses ainda não tomadas da ala previstas entre `inicio` e `fim`, em ordem de horário.
+    """
+    try:
+        return cached_fetchall(
+            """
+            SELECT a.previsto_para, a.paciente_id, p.nome AS paciente, m.nome AS medicamento, a.dose
+            FROM agenda_doses a
+            JOIN medicamentos m ON m.id = a.medicamento_id
+            JOIN pacientes p ON p.id = a.paciente_id
+            WHERE a.tomada_em IS NULL AND a.previsto_para >= %s AND a.previsto_para < %s
+            ORDER BY a.previsto_para
+            LIMIT %s;
+            """,
+            (inicio, fim, limite),
+            tags=[("agenda",), ("pacientes",)]
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar doses previstas: {e}")
+    return []
+
+
+def due_window(agora=None):
+    """
+    Janela (início, fim) da visão da ala com as opções escolhidas na sessão.
+    """
+    # Arredondado ao minuto para que reexecuções no mesmo minuto usem o cache
+    agora = agora or datetime.now().replace(second=0, microsecond=0)
+    atraso = st.session_state.get("agenda_atraso", ATRASOS[ATRASO_PADRAO])
+    proximas = st.session_state.get("agenda_proximas", PROXIMAS[PROXIMAS_PADRAO])
+    return agora - timedelta(hours=atraso), agora + timedelta(hours=proximas)
+
+
+def prefetch_due_doses():
+    """
+    Lê as doses da janela atual para o cache, antes de render_due_doses; as
+    páginas chamam junto com as outras leituras (concorrencia.fetch_concurrently).
+    """
+    extend_if_due()
+    fetch_due_doses(*due_window())
+
+
+@metrics.fragment(run_every=60)
+def render_due_doses():
+    """
+    Doses atrasadas e previstas da ala, atualizadas a cada minuto sem reexecutar a página.
+    """
+    import pandas as pd
+
+    col_atraso, col_proximas = st.columns(2)
+    with col_atraso:
+        st.selectbox("Atrasadas há até (horas)", ATRASOS, index=ATRASO_PADRAO, key="agenda_atraso")
+    with col_proximas:
+        st.selectbox("Previstas nas próximas (horas)", PROXIMAS, index=PROXIMAS_PADRAO, key="agenda_proximas")
+
+    extend_if_due()
+    agora = datetime.now().replace(second=0, microsecond=0)
+    doses = fetch_due_doses(*due_window(agora))
+    if not doses:
+        st.info("Nenhuma dose pendente na janela.")
+        return
+
+    df = pd.DataFrame(doses)
+    df["Situação"] = ["Atrasada" if d < agora else "Prevista" for d in df["previsto_para"]]
+    df = df.rename(columns={"previsto_para": "Previsto para", "paciente": "Paciente",
+                            "medicamento": "Medicamento", "dose": "Dose"})
+    atrasadas = int((df["Situação"] == "Atrasada").sum())
+    st.caption(f"{atrasadas} atrasada(s), {len(df) - atrasadas} prevista(s)"
+               + (f" (mostrando as {LIMITE_DOSES} primeiras)" if len(df) >= LIMITE_DOSES else ""))
+    st.dataframe(df[["Previsto para", "Situação", "Paciente", "Medicamento", "Dose"]], hide_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantém a agenda de doses previstas.")
+    parser.add_argument("--reconstruir", action="store_true", help="Refaz a agenda de todos os medicamentos.")
+    parser.add_argument("--horizonte", type=int, default=HORIZONTE_DIAS, help="Dias gerados à frente.")
+    parser.add_argument("--reter", type=int, default=DIAS_RETIDOS, help="Dias passados mantidos.")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        if args.reconstruir:
+            rebuild_schedule(conn, args.horizonte, verbose=True)
+        elif extend_schedule(conn, args.horizonte, args.reter, verbose=True) is None:
+            print("Outra atualização da agenda está em andamento.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao atualizar a agenda: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
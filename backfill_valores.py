@@ -0,0 +1,85 @@
+"""
+Preenche a coluna `diario.valores` a partir do texto de `detalhes` dos registros antigos.
+
+Percorre a tabela em blocos ordenados por id (paginação por chave), de modo
+que a memória usada não depende do tamanho do diário. Cada bloco é gravado
+em sua própria transação, então o processo pode ser interrompido e retomado.
+
+    python backfill_valores.py --bloco 5000
+"""
+import argparse
+import sys
+import time
+
+from psycopg2.extras import Json, execute_values
+
+from db import get_connection
+from diario_valores import parse_detalhes
+
+
+def backfill(conn, tamanho_bloco=5000, verbose=True):
+    """
+    Converte os registros sem `valores`, bloco a bloco. Retorna quantos foram atualizados.
+    """
+    total = 0
+    ultimo_id = 0
+    inicio = time.monotonic()
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, tipo, detalhes
+                FROM diario
+                WHERE valores IS NULL AND id > %s
+                ORDER BY id
+                LIMIT %s;
+                """,
+                (ultimo_id, tamanho_bloco)
+            )
+            bloco = cursor.fetchall()
+            if not bloco:
+                break
+
+            execute_values(
+                cursor,
+                """
+                UPDATE diario AS d
+                SET valores = v.valores::jsonb
+                FROM (VALUES %s) AS v (id, valores)
+                WHERE d.id = v.id;
+                """,
+                [(r['id'], Json(parse_detalhes(r['tipo'], r['detalhes']))) for r in bloco],
+                page_size=len(bloco)
+            )
+        conn.commit()
+
+        total += len(bloco)
+        ultimo_id = bloco[-1]['id']
+        if verbose:
+            taxa = total / max(time.monotonic() - inicio, 1e-9)
+            print(f"{total} registros convertidos (até id {ultimo_id}, {taxa:.0f}/s)")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preenche diario.valores a partir de diario.detalhes.")
+    parser.add_argument("--bloco", type=int, default=5000, help="Registros por transação.")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        total = backfill(conn, args.bloco)
+        print(f"Backfill concluído: {total} registros.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro durante o backfill: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
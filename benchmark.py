@@ -0,0 +1,360 @@
+"""
+Mede a latência e a quantidade de consultas das funções de dados e das páginas.
+
+Roda sobre um banco preenchido por dados_sinteticos.py. Cada leitura que as
+páginas fazem (resumo do paciente por painel, adesão, tendências, agenda,
+busca) e cada função de gravação e remoção é executada várias vezes com
+pacientes sorteados (leituras com o cache vazio e com o cache aquecido), e
+cada página é renderizada pelo AppTest do Streamlit. As gravações usam
+pacientes criados pelo próprio benchmark, removidos no fim mesmo se uma
+medição falhar. As consultas são contadas pelas métricas de metricas.py,
+registradas por todas as conexões do aplicativo.
+
+O resultado (percentis de latência em ms e consultas por chamada) é salvo em
+JSON; --comparar aponta regressões em relação a uma execução anterior.
+
+    python benchmark.py --iteracoes 50
+    python benchmark.py --comparar benchmarks/base.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import db
+from cache import query_cache
+from metricas import metrics
+
+
+BENCHMARK_DIR = Path(os.environ.get("MEDTRACK_BENCHMARK_DIR", "benchmarks"))
+PERCENTIS = (50, 90, 95, 99)
+# Aumento relativo do p50 ou do p95 considerado regressão
+LIMITE_REGRESSAO = 0.20
+PAGINAS = ["Cadastro de Paciente", "Gerenciamento de Medicamentos", "Diário Diário", "Visualizar Dados"]
+
+
+def summarize(latencias, consultas):
+    latencias = np.asarray(latencias) * 1000.0
+    resumo = {"n": int(latencias.size), "media_ms": round(float(latencias.mean()), 3)}
+    for p in PERCENTIS:
+        resumo[f"p{p}_ms"] = round(float(np.percentile(latencias, p)), 3)
+    resumo["max_ms"] = round(float(latencias.max()), 3)
+    resumo["consultas_media"] = round(float(np.mean(consultas)), 2)
+    resumo["consultas_max"] = int(np.max(consultas))
+    return resumo
+
+
+class Benchmark:
+    def __init__(self, iteracoes, semente):
+        self.iteracoes = iteracoes
+        self.rng = random.Random(semente)
+        self.resultados = {}
+
+    def measure(self, nome, funcao, argumentos, cache_frio=True):
+        """
+        Executa `funcao` uma vez para cada tupla de `argumentos` e guarda o resumo.
+        Com `cache_frio`, o cache de consultas é esvaziado antes de cada chamada.
+        """
+        latencias, consultas = [], []
+        for args in argumentos:
+            if cache_frio:
+                query_cache.clear()
+            antes = metrics.statement_count()
+            inicio = time.perf_counter()
+            funcao(*args)
+            latencias.append(time.perf_counter() - inicio)
+            consultas.append(metrics.statement_count() - antes)
+        if latencias:
+            self.resultados[nome] = summarize(latencias, consultas)
+            print(f"{nome}: p50 {self.resultados[nome]['p50_ms']} ms, "
+                  f"p95 {self.resultados[nome]['p95_ms']} ms, {self.resultados[nome]['consultas_media']} consultas")
+
+    def measure_reads(self, nome, funcao, argumentos):
+        argumentos = list(argumentos)
+        self.measure(f"{nome} [frio]", funcao, argumentos, cache_frio=True)
+        self.measure(f"{nome} [quente]", funcao, argumentos, cache_frio=False)
+
+    def sample_patients(self):
+        """
+        Pacientes sorteados entre os que têm diário, com o último dia de registros de cada um.
+        """
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT paciente_id, max(data) AS ultimo_dia FROM diario_resumo GROUP BY paciente_id;")
+                pacientes = [(r['paciente_id'], r['ultimo_dia']) for r in cursor.fetchall()]
+        if not pacientes:
+            raise ValueError("O banco não tem registros no diário; gere dados com dados_sinteticos.py.")
+        return [self.rng.choice(pacientes) for _ in range(self.iteracoes)]
+
+    def run_reads(self):
+        """
+        Mede as leituras que as páginas fazem, com os argumentos que elas usam.
+        """
+        import adesao
+        import agenda
+        import busca
+        import cadastro_paciente
+        import diretorio_pacientes
+        import particoes
+        import resumo_paciente
+        import tendencias
+
+        amostra = self.sample_patients()
+        ids = [(pid,) for pid, _ in amostra]
+        dias = [(pid, dia) for pid, dia in amostra]
+        poucas = ids[:max(3, self.iteracoes // 10)]
+        snapshot = resumo_paciente.fetch_patient_snapshot
+
+        # Cadastro de Paciente
+        self.measure_reads("cadastro_paciente.fetch_patients_page", cadastro_paciente.fetch_patients_page,
+                           [("", None, 25)] * self.iteracoes)
+        self.measure_reads("cadastro_paciente.fetch_patients_page (busca)", cadastro_paciente.fetch_patients_page,
+                           [(str(pid), None, 25) for pid, in ids])
+        diretorio = diretorio_pacientes.get_directory()
+        prefixos = [(nome[:3],) for nome in self.rng.sample(list(diretorio.nomes.values()), min(self.iteracoes, len(diretorio)))]
+        self.measure("diretorio_pacientes.search", diretorio.search, prefixos, cache_frio=False)
+
+        # Gerenciamento de Medicamentos: a grade
+        self.measure_reads("resumo_paciente.fetch_patient_snapshot (grade de medicamentos)", snapshot,
+                           [(pid, None, 1, ("medicamentos",)) for pid, in ids])
+
+        # Diário Diário: painel de doses e lista do dia
+        self.measure_reads("resumo_paciente.fetch_patient_snapshot (painel de doses)", snapshot,
+                           [(pid, dia, 1, ("medicamentos", "doses")) for pid, dia in dias])
+        self.measure_reads("resumo_paciente.fetch_patient_snapshot (diário do dia)", snapshot,
+                           [(pid, dia, 1, ("diario", "resumo_dia")) for pid, dia in dias])
+
+        # Visualizar Dados: paciente, adesão, tendências e a visão da ala
+        self.measure_reads("resumo_paciente.fetch_patient_snapshot (30 dias)", snapshot,
+                           [(pid, dia, 30) for pid, dia in dias])
+        self.measure_reads("particoes.fetch_archived_diary (30 dias)", particoes.fetch_archived_diary,
+                           [(pid, dia - timedelta(days=29), dia) for pid, dia in dias])
+        self.measure_reads("adesao.fetch_patient_adherence (7 dias)", adesao.fetch_patient_adherence,
+                           [(pid, dia - timedelta(days=6), dia) for pid, dia in dias])
+        self.measure_reads("tendencias.fetch_daily_summary (30 dias)", tendencias.fetch_daily_summary,
+                           [(pid, dia - timedelta(days=30), dia) for pid, dia in dias])
+        self.measure_reads("adesao.fetch_ward_adherence (7 dias)", adesao.fetch_ward_adherence,
+                           [(dia - timedelta(days=6), dia) for (_, dia) in dias[:len(poucas)]])
+        agora = datetime.now().replace(second=0, microsecond=0)
+        self.measure_reads("agenda.fetch_due_doses (4 h atrasadas, 1 h previstas)", agenda.fetch_due_doses,
+                           [(agora - timedelta(hours=4), agora + timedelta(hours=1))] * len(poucas))
+
+        # Busca
+        termos = ["confusão", "dor ou tontura", '"falta de ar"', "queda", "febre"]
+        self.measure_reads("busca.search_diary (ala, 30 dias)", busca.search_diary,
+                           [(termos[i % len(termos)], dia - timedelta(days=29), dia) for i, (_, dia) in enumerate(dias)])
+        self.measure_reads("busca.search_diary (paciente, 1 ano)", busca.search_diary,
+                           [(termos[i % len(termos)], dia - timedelta(days=364), dia, pid)
+                            for i, (pid, dia) in enumerate(dias)])
+        self.measure_reads("busca.search_medications", busca.search_medications,
+                           [(termos[i % len(termos)],) for i in range(len(poucas))])
+
+    def _remove_patients(self, marca):
+        """
+        Remove os pacientes (e, em cascata, seus dados) criados pelo benchmark com a marca.
+        """
+        with db.connection() as conn:
+            if conn is None:
+                return
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM pacientes WHERE nome LIKE %s;", (f"{marca} %",))
+                removidos = cursor.rowcount
+            conn.commit()
+        if removidos:
+            print(f"{removidos} paciente(s) do benchmark removido(s) na limpeza.")
+            query_cache.clear()
+
+    def _find(self, sql, params):
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return [r['id'] for r in cursor.fetchall()]
+
+    @staticmethod
+    def _medication(nome, frequencia=2):
+        """
+        Linha da grade de medicamentos, no formato de apply_medication_changes.
+        """
+        return {"nome": nome, "frequencia": frequencia, "horario_inicio": dtime(8, 0), "intervalo_horas": None,
+                "categoria": "Benchmark", "observacoes": ""}
+
+    def run_writes(self):
+        """
+        Grava e remove dados de pacientes criados pelo benchmark.
+        """
+        import cadastro_paciente
+        import diario_diario
+        import gerenciamento_medicamentos
+
+        n = self.iteracoes
+        marca = f"Benchmark {datetime.now():%Y%m%d%H%M%S}"
+        try:
+            self.measure("cadastro_paciente.save_patient", cadastro_paciente.save_patient,
+                         [(f"{marca} {i}", 50, "Outro", 170, 70) for i in range(n)])
+            pacientes = self._find("SELECT id FROM pacientes WHERE nome LIKE %s ORDER BY id;", (f"{marca} %",))
+            self.measure("cadastro_paciente.update_patient", cadastro_paciente.update_patient,
+                         [(pid, f"{marca} {i}", 51, "Outro", 170, 71) for i, pid in enumerate(pacientes)])
+
+            paciente_id = pacientes[0]
+            # Uma gravação da grade por chamada: um medicamento novo ou, depois, todos alterados de uma vez
+            self.measure("gerenciamento_medicamentos.apply_medication_changes (inserir)",
+                         gerenciamento_medicamentos.apply_medication_changes,
+                         [(paciente_id, [self._medication(f"Medicamento {i}")], [], []) for i in range(n)])
+            medicamentos = self._find("SELECT id FROM medicamentos WHERE paciente_id = %s ORDER BY id;", (paciente_id,))
+            medicamento_id = medicamentos[0]
+            self.measure("gerenciamento_medicamentos.apply_medication_changes (atualizar todos)",
+                         gerenciamento_medicamentos.apply_medication_changes,
+                         [(paciente_id, [], [{**self._medication(f"Medicamento {i}", 2 + k % 2), "id": m}
+                                             for i, m in enumerate(medicamentos)], [])
+                          for k in range(max(1, n // 5))])
+
+            hoje = date.today()
+            dias = [hoje - timedelta(days=i) for i in range(n)]
+            self.measure("diario_diario.register_dose", diario_diario.register_dose,
+                         [(paciente_id, medicamento_id, 1, dtime(8, 0)) for _ in range(n)])
+            self.measure("diario_diario.register_doses", diario_diario.register_doses,
+                         [(paciente_id, [(m, d, datetime.combine(dia, dtime(8 + d))) for m in medicamentos[:4] for d in (1, 2)])
+                          for dia in dias])
+            self.measure("diario_diario.delete_dose", diario_diario.delete_dose,
+                         [(paciente_id, medicamento_id, 1, dia) for dia in dias])
+
+            horas = [dtime(6 + i // 60 % 18, i % 60) for i in range(n)]
+            self.measure("diario_diario.save_diary_entry", diario_diario.save_diary_entry, [
+                (paciente_id, "Sinais Vitais", datetime.combine(hoje, hora),
+                 "O2: 96, PA: 120/80, HR: 72, TEMP: 36.5, GLIC: 100")
+                for hora in horas
+            ])
+            self.measure("diario_diario.delete_diary_entry", diario_diario.delete_diary_entry,
+                         [(paciente_id, hoje, hora) for hora in horas])
+
+            self.measure("gerenciamento_medicamentos.apply_medication_changes (remover)",
+                         gerenciamento_medicamentos.apply_medication_changes,
+                         [(paciente_id, [], [], [m]) for m in medicamentos])
+            self.measure("cadastro_paciente.delete_patient", cadastro_paciente.delete_patient,
+                         [(pid,) for pid in pacientes])
+        finally:
+            # Se alguma medição falhar no meio, não deixa pacientes do benchmark no banco
+            self._remove_patients(marca)
+
+    def run_pages(self, script):
+        """
+        Renderiza cada página pelo AppTest: a primeira vez com o cache vazio e
+        as seguintes como reexecuções da mesma sessão.
+        """
+        from streamlit.testing.v1 import AppTest
+
+        for pagina in PAGINAS:
+            latencias = {"frio": [], "quente": []}
+            consultas = {"frio": [], "quente": []}
+            erros = 0
+            for i in range(max(1, self.iteracoes // 5)):
+                app = AppTest.from_file(script, default_timeout=120)
+                app.session_state["authenticated"] = True
+                app.session_state["username"] = "admin"
+                app.run()
+                app.sidebar.selectbox[0].set_value(pagina)
+                for estado in ("frio", "quente"):
+                    if estado == "frio":
+                        query_cache.clear()
+                    antes = metrics.statement_count()
+                    inicio = time.perf_counter()
+                    app.run()
+                    latencias[estado].append(time.perf_counter() - inicio)
+                    consultas[estado].append(metrics.statement_count() - antes)
+                    erros += len(app.exception)
+            for estado in ("frio", "quente"):
+                nome = f"pagina: {pagina} [{estado}]"
+                self.resultados[nome] = summarize(latencias[estado], consultas[estado])
+                self.resultados[nome]["erros"] = erros
+                print(f"{nome}: p50 {self.resultados[nome]['p50_ms']} ms, "
+                      f"{self.resultados[nome]['consultas_media']} consultas")
+
+
+def environment():
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version;")
+            versao = cursor.fetchone()['server_version']
+            cursor.execute(
+                """
+                SELECT (SELECT count(*) FROM pacientes) AS pacientes,
+                       (SELECT count(*) FROM medicamentos) AS medicamentos,
+                       (SELECT count(*) FROM diario) AS diario,
+                       (SELECT count(*) FROM doses_tomadas) AS doses_tomadas;
+                """
+            )
+            contagens = dict(cursor.fetchone())
+    return {"python": platform.python_version(), "postgres": versao, "plataforma": platform.platform(),
+            "linhas": contagens}
+
+
+def compare(atual, base, limite=LIMITE_REGRESSAO):
+    """
+    Compara dois resultados e devolve as regressões como (nome, métrica, antes, depois).
+    """
+    regressoes = []
+    for nome, metricas in atual["resultados"].items():
+        anterior = base["resultados"].get(nome)
+        if not anterior:
+            continue
+        for metrica in ("p50_ms", "p95_ms", "consultas_media"):
+            antes, depois = anterior[metrica], metricas[metrica]
+            if depois > antes * (1 + limite) and (metrica == "consultas_media" or depois - antes > 1.0):
+                regressoes.append((nome, metrica, antes, depois))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das funções de dados e páginas do MedTrack.")
+    parser.add_argument("--iteracoes", type=int, default=50, help="Chamadas por função.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", type=Path, help="Arquivo JSON do resultado.")
+    parser.add_argument("--comparar", type=Path, help="Resultado anterior para comparação.")
+    parser.add_argument("--limite", type=float, default=LIMITE_REGRESSAO, help="Aumento relativo tolerado.")
+    parser.add_argument("--sem-paginas", action="store_true", help="Não renderiza as páginas.")
+    parser.add_argument("--sem-gravacoes", action="store_true", help="Não mede as funções de gravação.")
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(args.iteracoes, args.semente)
+    try:
+        benchmark.run_reads()
+        if not args.sem_gravacoes:
+            benchmark.run_writes()
+        if not args.sem_paginas:
+            benchmark.run_pages(str(Path(__file__).resolve().with_name("medtrack.py")))
+        ambiente = environment()
+    except Exception as e:
+        print(f"Erro durante o benchmark: {e}")
+        return 1
+
+    resultado = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "parametros": {"iteracoes": args.iteracoes, "semente": args.semente},
+        "ambiente": ambiente,
+        "resultados": benchmark.resultados,
+    }
+    saida = args.saida or BENCHMARK_DIR / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultado salvo em {saida}")
+
+    if args.comparar:
+        base = json.loads(args.comparar.read_text(encoding="utf-8"))
+        regressoes = compare(resultado, base, args.limite)
+        for nome, metrica, antes, depois in regressoes:
+            print(f"REGRESSÃO {nome} {metrica}: {antes} -> {depois}")
+        if regressoes:
+            return 1
+        print("Nenhuma regressão em relação a", args.comparar)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Busca textual em português nos registros do diário e nas observações dos medicamentos.
+
+As consultas usam as colunas tsvector `busca` da migração 0012 e seus índices
+GIN. A sintaxe é a de websearch_to_tsquery: palavras são combinadas com E,
+"ou" separa alternativas, "-palavra" exclui e "entre aspas" busca a frase.
+Os resultados vêm ordenados por relevância (ts_rank_cd), em páginas; a busca
+no diário sempre tem um período, para que só as partições dos meses pedidos
+sejam lidas.
+
+    python busca.py --preencher     # preenche a coluna busca dos registros antigos
+"""
+import argparse
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+import streamlit as st
+
+from cache import cached_fetchall
+from db import get_connection
+from diretorio_pacientes import patient_selector
+from metricas import metrics
+
+
+POR_PAGINA = 25
+PERIODO_PADRAO = 30
+TIPOS = ["Fisiologia", "Sinais Vitais", "Ocorrência", "Alimentação", "Líquidos"]
+# Resultados ficam em cache até uma gravação no diário, nos medicamentos ou nos pacientes
+TAGS_BUSCA = [("busca",), ("pacientes",)]
+_OU = re.compile(r"\s+ou\s+", re.IGNORECASE)
+
+
+def _query(consulta):
+    """
+    Aceita "ou" além do "or" de websearch_to_tsquery.
+    """
+    return _OU.sub(" or ", consulta.strip())
+
+
+def search_diary(consulta, inicio, fim, paciente_id=None, tipos=None, pagina=1, por_pagina=POR_PAGINA):
+    """
+    Registros do diário entre `inicio` e `fim` que casam com a consulta, dos
+    mais relevantes para os menos. Retorna (registros, há_próxima_página).
+    """
+    if not consulta.strip():
+        return [], False
+    try:
+        registros = cached_fetchall(
+            """
+            SELECT r.id, r.paciente_id, p.nome AS paciente, r.data, r.hora, r.tipo, r.relevancia,
+                   ts_headline('portuguese', coalesce(r.detalhes, ''), r.q,
+                               'StartSel=«, StopSel=», MaxFragments=2, MinWords=5, MaxWords=20') AS trecho
+            FROM (
+                SELECT d.id, d.paciente_id, d.data, d.hora, d.tipo, d.detalhes, q.q,
+                       ts_rank_cd(d.busca, q.q) AS relevancia
+                FROM diario d, websearch_to_tsquery('portuguese', %(consulta)s) AS q (q)
+                WHERE d.busca @@ q.q
+                  AND d.data BETWEEN %(inicio)s AND %(fim)s
+                  AND (%(paciente_id)s::integer IS NULL OR d.paciente_id = %(paciente_id)s)
+                  AND (%(tipos)s::text[] IS NULL OR d.tipo = ANY (%(tipos)s))
+                ORDER BY relevancia DESC, d.data DESC, d.hora DESC, d.id DESC
+                LIMIT %(limite)s OFFSET %(deslocamento)s
+            ) r
+            JOIN pacientes p ON p.id = r.paciente_id
+            ORDER BY r.relevancia DESC, r.data DESC, r.hora DESC, r.id DESC;
+            """,
+            {"consulta": _query(consulta), "inicio": inicio, "fim": fim, "paciente_id": paciente_id,
+             "tipos": list(tipos) if tipos else None,
+             # Uma linha a mais indica se existe a próxima página, sem contar todos os resultados
+             "limite": por_pagina + 1, "deslocamento": (pagina - 1) * por_pagina},
+            tags=TAGS_BUSCA
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar no diário: {e}")
+        return [], False
+    return registros[:por_pagina], len(registros) > por_pagina
+
+
+def search_medications(consulta, paciente_id=None, pagina=1, por_pagina=POR_PAGINA):
+    """
+    Medicamentos cujo nome ou observações casam com a consulta, dos mais
+    relevantes para os menos. Retorna (medicamentos, há_próxima_página).
+    """
+    if not consulta.strip():
+        return [], False
+    try:
+        medicamentos = cached_fetchall(
+            """
+            SELECT m.id, m.paciente_id, p.nome AS paciente, m.nome, m.frequencia, m.categoria,
+                   ts_rank_cd(m.busca, q.q) AS relevancia,
+                   ts_headline('portuguese', coalesce(m.observacoes, ''), q.q,
+                               'StartSel=«, StopSel=», MaxFragments=2, MinWords=5, MaxWords=20') AS trecho
+            FROM medicamentos m
+            JOIN pacientes p ON p.id = m.paciente_id,
+                 websearch_to_tsquery('portuguese', %(consulta)s) AS q (q)
+            WHERE m.busca @@ q.q
+              AND (%(paciente_id)s::integer IS NULL OR m.paciente_id = %(paciente_id)s)
+            ORDER BY relevancia DESC, m.id DESC
+            LIMIT %(limite)s OFFSET %(deslocamento)s;
+            """,
+            {"consulta": _query(consulta), "paciente_id": paciente_id,
+             "limite": por_pagina + 1, "deslocamento": (pagina - 1) * por_pagina},
+            tags=TAGS_BUSCA
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar medicamentos: {e}")
+        return [], False
+    return medicamentos[:por_pagina], len(medicamentos) > por_pagina
+
+
+def fill_search_column(conn, tamanho_bloco=5000, verbose=True):
+    """
+    Preenche `diario.busca` dos registros antigos, bloco a bloco, cada um em
+    sua transação. Retorna quantos registros foram atualizados.
+    """
+    total = 0
+    inicio = time.monotonic()
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE diario d
+                SET busca = diario_busca_vetor(d.tipo, d.detalhes)
+                FROM (SELECT id, data FROM diario WHERE busca IS NULL ORDER BY id LIMIT %s) b
+                WHERE d.id = b.id AND d.data = b.data;
+                """,
+                (tamanho_bloco,)
+            )
+            atualizados = cursor.rowcount
+        conn.commit()
+        if not atualizados:
+            break
+        total += atualizados
+        if verbose:
+            print(f"{total} registros preenchidos ({time.monotonic() - inicio:.0f}s)")
+    return total
+
+
+def _current_page(chave, filtros):
+    """
+    Página atual da busca; volta à primeira quando a consulta ou os filtros mudam.
+    """
+    if st.session_state.get(f"{chave}_filtros") != filtros:
+        st.session_state[f"{chave}_filtros"] = filtros
+        st.session_state[f"{chave}_pagina"] = 1
+    return st.session_state[f"{chave}_pagina"]
+
+
+def _page_buttons(chave, pagina, ha_proxima):
+    col_anterior, col_pagina, col_proxima = st.columns([0.2, 0.6, 0.2])
+    with col_anterior:
+        if st.button("Anterior", key=f"{chave}_anterior", disabled=pagina <= 1):
+            st.session_state[f"{chave}_pagina"] = pagina - 1
+            st.rerun(scope="fragment")
+    with col_pagina:
+        st.caption(f"Página {pagina}")
+    with col_proxima:
+        if st.button("Próxima", key=f"{chave}_proxima", disabled=not ha_proxima):
+            st.session_state[f"{chave}_pagina"] = pagina + 1
+            st.rerun(scope="fragment")
+
+
+@metrics.fragment
+def search_page():
+    """
+    Página de busca no diário e nos medicamentos.
+    """
+    import pandas as pd
+
+    st.subheader("Busca")
+    consulta = st.text_input("Buscar", key="busca_consulta",
+                             placeholder='Ex.: confusão ou queda, "falta de ar", dor -cabeça')
+    onde = st.radio("Buscar em", ["Diário", "Medicamentos"], horizontal=True, key="busca_onde")
+
+    paciente_id = None
+    if st.checkbox("Filtrar por paciente", key="busca_filtrar_paciente"):
+        paciente_id = patient_selector("busca_paciente")
+
+    if onde == "Diário":
+        col_tipos, col_periodo = st.columns(2)
+        with col_tipos:
+            tipos = st.multiselect("Tipos", TIPOS, key="busca_tipos")
+        with col_periodo:
+            hoje = date.today()
+            periodo = st.date_input("Período", value=(hoje - timedelta(days=PERIODO_PADRAO - 1), hoje),
+                                    key="busca_periodo")
+        if len(periodo) != 2:
+            st.info("Selecione o início e o fim do período.")
+            return
+        inicio, fim = periodo
+        filtros = (consulta, paciente_id, tuple(tipos), inicio, fim)
+        pagina = _current_page("busca_diario", filtros)
+        resultados, ha_proxima = search_diary(consulta, inicio, fim, paciente_id, tipos, pagina)
+        colunas = {"data": "Data", "hora": "Hora", "paciente": "Paciente", "tipo": "Tipo", "trecho": "Trecho"}
+    else:
+        filtros = (consulta, paciente_id)
+        pagina = _current_page("busca_medicamentos", filtros)
+        resultados, ha_proxima = search_medications(consulta, paciente_id, pagina)
+        colunas = {"paciente": "Paciente", "nome": "Medicamento", "frequencia": "Frequência",
+                   "categoria": "Categoria", "trecho": "Observações"}
+
+    if not consulta.strip():
+        return
+    if not resultados:
+        st.info("Nenhum resultado encontrado.")
+        return
+    df = pd.DataFrame(resultados).rename(columns=colunas)
+    st.dataframe(df[list(colunas.values())], hide_index=True)
+    _page_buttons("busca_diario" if onde == "Diário" else "busca_medicamentos", pagina, ha_proxima)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção da busca textual.")
+    parser.add_argument("--preencher", action="store_true", help="Preenche a busca dos registros antigos do diário.")
+    parser.add_argument("--bloco", type=int, default=5000, help="Registros por transação.")
+    args = parser.parse_args(argv)
+    if not args.preencher:
+        parser.print_help()
+        return 0
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        total = fill_search_column(conn, args.bloco)
+        print(f"{total} registros preenchidos.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao preencher a busca: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
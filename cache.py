@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from db import READ_YOUR_WRITES_WINDOW, read_connection
+
+
+CACHE_TTL = float(os.environ.get("MEDTRACK_CACHE_TTL", 300.0))
+CACHE_MAX_ENTRIES = int(os.environ.get("MEDTRACK_CACHE_MAX_ENTRIES", 2048))
+# Acima disso, as versões das tags sem entradas em cache são esquecidas
+CACHE_MAX_TAGS = int(os.environ.get("MEDTRACK_CACHE_MAX_TAGS", 10000))
+
+# Seções de dados de um paciente; cada uma vira uma tag ("secao", paciente_id)
+PATIENT_SECTIONS = ("paciente", "medicamentos", "doses", "diario")
+
+_MISSING = object()
+
+
+def _freeze(value):
+    """
+    Converte listas e dicionários em estruturas imutáveis para compor a chave do cache.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def patient_tags(paciente_id):
+    """
+    Todas as tags de dados associados a um paciente.
+    """
+    return [(secao, paciente_id) for secao in PATIENT_SECTIONS]
+
+
+class QueryCache:
+    """
+    Cache LRU com TTL para resultados de consultas, invalidado por tags.
+
+    Cada entrada é registrada com as tags dos dados que leu, por exemplo
+    ("medicamentos", 7). As funções de escrita invalidam só as tags que afetam.
+
+    As versões das tags vêm de um único contador crescente. Uma tag sem versão
+    própria (nunca invalidada, ou esquecida para limitar a memória) vale a
+    maior entre a versão base e a da sua seção; como a base sobe ao esquecer
+    versões, nenhuma tag volta a um valor já observado. Invalidações mais
+    antigas que `janela` também são esquecidas.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_tags=CACHE_MAX_TAGS,
+                 janela=READ_YOUR_WRITES_WINDOW):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_tags = max_tags
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chave -> (expira_em, valor, tags)
+        self._keys_by_tag = defaultdict(set)
+        self._version = 0
+        self._base_version = 0
+        self._tag_versions = {}
+        self._section_versions = {}  # seção -> versão da última invalidação da seção inteira
+        # tag, seção ou None (cache inteiro) -> instante da última invalidação
+        self._invalidated_at = {}
+        self._pruned_at = time.monotonic()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def _tag_version(self, tag):
+        return max(self._tag_versions.get(tag, self._base_version), self._section_versions.get(tag[0], 0))
+
+    def _next_version(self):
+        self._version += 1
+        return self._version
+
+    def _prune(self, agora):
+        """
+        No máximo uma vez por `janela`: esquece as invalidações mais antigas que
+        ela e, acima de max_tags, as versões das tags sem entradas em cache.
+        """
+        if agora - self._pruned_at < self.janela:
+            return
+        self._pruned_at = agora
+        limite = agora - self.janela
+        self._invalidated_at = {t: instante for t, instante in self._invalidated_at.items() if instante > limite}
+        if len(self._tag_versions) > self.max_tags:
+            # A base passa de todas as versões esquecidas: leituras em andamento
+            # dessas tags não são guardadas, em vez de guardadas desatualizadas
+            self._base_version = self._version
+            self._tag_versions = {t: v for t, v in self._tag_versions.items() if t in self._keys_by_tag}
+
+    def get(self, key):
+        """
+        Retorna o valor em cache ou `_MISSING`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return _MISSING
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self._misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def versions(self, tags):
+        """
+        Versões atuais das tags, para detectar invalidações durante uma leitura.
+        """
+        with self._lock:
+            return tuple(self._tag_version(tag) for tag in tags)
+
+    def recently_invalidated(self, tags, janela):
+        """
+        Se alguma das tags foi invalidada há menos de `janela` segundos.
+        """
+        limite = time.monotonic() - janela
+        with self._lock:
+            ultimas = [self._invalidated_at.get(chave, float("-inf")) for tag in tags for chave in (tag, tag[0])]
+            return max(ultimas + [self._invalidated_at.get(None, float("-inf"))]) > limite
+
+    def set(self, key, value, tags=(), versions=None):
+        """
+        Guarda um valor. Se `versions` for informado e alguma tag tiver sido
+        invalidada desde então, o valor (possivelmente desatualizado) é descartado.
+        """
+        tags = tuple(tags)
+        with self._lock:
+            if versions is not None and versions != tuple(self._tag_version(tag) for tag in tags):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, *tags):
+        """
+        Remove todas as entradas associadas a qualquer uma das tags.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._next_version()
+                self._invalidated_at[tag] = agora
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self._invalidations += 1
+            self._prune(agora)
+
+    def invalidate_section(self, secao):
+        """
+        Invalida todas as tags de uma seção, de qualquer paciente (ex.: "diario"),
+        inclusive as que ainda não têm versão própria.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            self._section_versions[secao] = self._next_version()
+            self._invalidated_at[secao] = agora
+            for tag in [t for t in self._keys_by_tag if t[0] == secao]:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self._invalidations += 1
+            self._prune(agora)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            # Uma base acima de todas as versões invalida todas as tags de uma vez
+            self._base_version = self._next_version()
+            self._tag_versions.clear()
+            self._section_versions.clear()
+            self._invalidated_at = {None: time.monotonic()}
+
+    def stats(self):
+        """
+        Retorna os contadores de acertos e falhas do cache.
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / total if total else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+query_cache = QueryCache()
+
+
+def cached_fetchall(sql, params=(), tags=(), cursor_factory=None):
+    """
+    Executa uma consulta de leitura passando pelo cache compartilhado.
+
+    A chave é a própria consulta com seus parâmetros. Erros de banco são
+    propagados e nunca ficam em cache. `cursor_factory` permite obter
+    tuplas em vez de dicionários (ex.: para montar DataFrames).
+
+    A leitura vai para uma réplica, exceto se alguma das tags foi invalidada
+    há pouco: quem acabou de gravar (ou recebeu a notificação da gravação de
+    outro processo) lê do primário, e o cache não guarda o dado antigo de uma
+    réplica ainda atrasada.
+    """
+    key = (sql, _freeze(params), cursor_factory)
+    rows = query_cache.get(key)
+    if rows is not _MISSING:
+        return rows
+
+    versions = query_cache.versions(tags)
+    primario = query_cache.recently_invalidated(tags, READ_YOUR_WRITES_WINDOW)
+    with read_connection(primario=primario) as conn:
+        if not conn:
+            return []
+        with conn.cursor(cursor_factory=cursor_factory) as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    query_cache.set(key, rows, tags, versions)
+    return rows
+
+
+def invalidate(*tags):
+    """
+    Invalida as consultas em cache que dependem das tags informadas.
+    """
+    query_cache.invalidate(*tags)
@@ -1,94 +1,141 @@
 import streamlit as st
-from db import get_connection  # Função para conectar ao banco
+from db import connection  # Função para conectar ao banco
+from cache import cached_fetchall, invalidate, patient_tags
+from importacao import render_import
+from metricas import metrics
 
 def save_patient(nome, idade, sexo, altura, peso):
     """
     Salva um paciente no banco de dados PostgreSQL.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO pacientes (nome, idade, sexo, altura, peso)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id;
-                    """,
-                    (nome, idade, sexo, altura, peso)
-                )
-                conn.commit()
-                st.success(f"Paciente '{nome}' cadastrado com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao salvar paciente: {e}")
-        finally:
-            conn.close()
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO pacientes (nome, idade, sexo, altura, peso)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id;
+                        """,
+                        (nome, idade, sexo, altura, peso)
+                    )
+                    conn.commit()
+                    invalidate(("pacientes",))
+                    st.success(f"Paciente '{nome}' cadastrado com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao salvar paciente: {e}")
 
 def update_patient(paciente_id, nome, idade, sexo, altura, peso):
     """
     Atualiza os dados de um paciente no banco de dados PostgreSQL.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    UPDATE pacientes
-                    SET nome = %s, idade = %s, sexo = %s, altura = %s, peso = %s
-                    WHERE id = %s;
-                    """,
-                    (nome, idade, sexo, altura, peso, paciente_id)
-                )
-                conn.commit()
-                st.success(f"Paciente '{nome}' atualizado com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao atualizar paciente: {e}")
-        finally:
-            conn.close()
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        UPDATE pacientes
+                        SET nome = %s, idade = %s, sexo = %s, altura = %s, peso = %s
+                        WHERE id = %s;
+                        """,
+                        (nome, idade, sexo, altura, peso, paciente_id)
+                    )
+                    conn.commit()
+                    invalidate(("pacientes",), ("paciente", paciente_id))
+                    st.success(f"Paciente '{nome}' atualizado com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao atualizar paciente: {e}")
 
 def delete_patient(paciente_id):
     """
     Remove um paciente do banco de dados PostgreSQL.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM pacientes WHERE id = %s;", (paciente_id,))
-                conn.commit()
-                st.success(f"Paciente removido com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao remover paciente: {e}")
-        finally:
-            conn.close()
-
-def fetch_patients():
-    """
-    Obtém a lista de pacientes do banco de dados PostgreSQL.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT id, nome, idade, sexo, altura, peso FROM pacientes;")
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar pacientes: {e}")
-        finally:
-            conn.close()
-    return []
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM pacientes WHERE id = %s;", (paciente_id,))
+                    conn.commit()
+                    # Medicamentos, doses e diário do paciente são removidos em cascata
+                    invalidate(("pacientes",), ("busca",), *patient_tags(paciente_id))
+                    st.success(f"Paciente removido com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao remover paciente: {e}")
 
-def patient_registration():
+PAGE_SIZES = [10, 25, 50, 100]
+
+def _like_pattern(busca):
     """
-    Interface para cadastro, edição e remoção de pacientes.
+    Monta o padrão ILIKE para buscar o termo em qualquer parte do nome.
     """
-    st.header("Cadastro de Pacientes")
+    escapado = busca.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escapado}%"
+
+def fetch_patients_page(busca="", depois_de=None, limite=25):
+    """
+    Obtém uma página de pacientes ordenada por nome, usando paginação por chave.
+
+    `depois_de` é o par (nome, id) do último paciente da página anterior.
+    Retorna a página e um indicador de que existem mais pacientes depois dela.
+    """
+    condicoes = []
+    parametros = []
+    if busca.strip():
+        condicoes.append("nome ILIKE %s")
+        parametros.append(_like_pattern(busca.strip()))
+    if depois_de is not None:
+        condicoes.append("(nome, id) > (%s, %s)")
+        parametros.extend(depois_de)
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    parametros.append(limite + 1)
+
+    try:
+        pacientes = cached_fetchall(
+            f"""
+            SELECT id, nome, idade, sexo, altura, peso
+            FROM pacientes
+            {where}
+            ORDER BY nome, id
+            LIMIT %s;
+            """,
+            tuple(parametros),
+            tags=[("pacientes",)]
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar pacientes: {e}")
+        return [], False
+    return pacientes[:limite], len(pacientes) > limite
+
+@metrics.fragment
+def patient_list():
+    """
+    Lista paginada de pacientes com edição e remoção. Buscar, paginar, editar
+    ou remover reexecuta só este fragmento.
+    """
+    # Exibe a lista de pacientes, uma página por vez
+    st.subheader("Pacientes Cadastrados")
+    col_busca, col_tamanho = st.columns([0.8, 0.2])
+    with col_busca:
+        busca = st.text_input("Buscar por nome", key="pacientes_busca")
+    with col_tamanho:
+        limite = st.selectbox("Por página", PAGE_SIZES, index=1, key="pacientes_por_pagina")
+
+    # Pilha com a chave inicial de cada página visitada; reinicia quando o filtro muda
+    filtro = (busca.strip(), limite)
+    if st.session_state.get("pacientes_filtro") != filtro:
+        st.session_state["pacientes_filtro"] = filtro
+        st.session_state["pacientes_paginas"] = [None]
+    paginas = st.session_state["pacientes_paginas"]
+
+    pacientes, tem_proxima = fetch_patients_page(busca, paginas[-1], limite)
+    if not pacientes and len(paginas) > 1:
+        # A página atual ficou vazia (ex.: após remoções); volta para a anterior
+        paginas.pop()
+        pacientes, tem_proxima = fetch_patients_page(busca, paginas[-1], limite)
 
-    # Exibe a lista de pacientes
-    pacientes = fetch_patients()
     if pacientes:
-        st.subheader("Pacientes Cadastrados")
         for paciente in pacientes:
             with st.expander(f"{paciente['nome']}"):
                 st.write(f"**Idade:** {paciente['idade']}")
@@ -96,43 +143,73 @@ def patient_registration():
                 st.write(f"**Altura:** {paciente['altura']} cm")
                 st.write(f"**Peso:** {paciente['peso']} kg")
 
-        # Botão para editar paciente
-        if st.button("Editar", key=f"editar_{paciente['id']}"):
-            with st.form(f"editar_form_{paciente['id']}"):
-                nome = st.text_input("Nome", value=paciente['nome'])
-                idade = st.number_input("Idade", min_value=0, step=1, value=paciente['idade'])
-                sexo = st.selectbox("Sexo", ["Masculino", "Feminino", "Outro"], index=["Masculino", "Feminino", "Outro"].index(paciente['sexo']))
-                altura = st.number_input("Altura (cm)", min_value=0.0, step=0.1, value=float(paciente['altura']))
-                peso = st.number_input("Peso (kg)", min_value=0.0, step=0.1, value=float(paciente['peso']))
-                submit = st.form_submit_button("Salvar Alterações")
-
-                if submit:
-                    if not nome.strip():
-                        st.error("O campo 'Nome' é obrigatório.")
-                    else:
-                        update_patient(paciente['id'], nome, idade, sexo, altura, peso)
-                        st.rerun()
-
-        # Botão para remover paciente
-        remove_key = f"remover_{paciente['id']}"
-        confirm_key = f"confirmar_remocao_{paciente['id']}"
-        
-        # Exibir botão de remoção
-        if st.button("Remover", key=remove_key):
-            st.session_state[confirm_key] = True  # Ativa a confirmação
-
-        # Exibir confirmação se o botão de remoção foi clicado
-        if st.session_state.get(confirm_key, False):
-            st.warning(f"Você tem certeza de que deseja remover o paciente '{paciente['nome']}'?")
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Sim, remover", key=f"confirmar_{paciente['id']}"):
-                    delete_patient(paciente['id'])
-                    st.session_state[confirm_key] = False  # Reseta a confirmação
-            with col2:
-                if st.button("Cancelar", key=f"cancelar_{paciente['id']}"):
-                    st.session_state[confirm_key] = False  # Reseta a confirmação
+                # Botão para editar paciente
+                edit_key = f"editando_{paciente['id']}"
+                if st.button("Editar", key=f"editar_{paciente['id']}"):
+                    st.session_state[edit_key] = not st.session_state.get(edit_key, False)
+
+                if st.session_state.get(edit_key, False):
+                    with st.form(f"editar_form_{paciente['id']}"):
+                        nome = st.text_input("Nome", value=paciente['nome'])
+                        idade = st.number_input("Idade", min_value=0, step=1, value=paciente['idade'])
+                        sexo = st.selectbox("Sexo", ["Masculino", "Feminino", "Outro"], index=["Masculino", "Feminino", "Outro"].index(paciente['sexo']))
+                        altura = st.number_input("Altura (cm)", min_value=0.0, step=0.1, value=float(paciente['altura']))
+                        peso = st.number_input("Peso (kg)", min_value=0.0, step=0.1, value=float(paciente['peso']))
+                        submit = st.form_submit_button("Salvar Alterações")
 
+                        if submit:
+                            if not nome.strip():
+                                st.error("O campo 'Nome' é obrigatório.")
+                            else:
+                                update_patient(paciente['id'], nome, idade, sexo, altura, peso)
+                                st.session_state[edit_key] = False
+                                st.rerun(scope="fragment")
+
+                # Botão para remover paciente
+                remove_key = f"remover_{paciente['id']}"
+                confirm_key = f"confirmar_remocao_{paciente['id']}"
+
+                # Exibir botão de remoção
+                if st.button("Remover", key=remove_key):
+                    st.session_state[confirm_key] = True  # Ativa a confirmação
+
+                # Exibir confirmação se o botão de remoção foi clicado
+                if st.session_state.get(confirm_key, False):
+                    st.warning(f"Você tem certeza de que deseja remover o paciente '{paciente['nome']}'?")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.button("Sim, remover", key=f"confirmar_{paciente['id']}"):
+                            delete_patient(paciente['id'])
+                            st.session_state[confirm_key] = False  # Reseta a confirmação
+                            st.rerun(scope="fragment")
+                    with col2:
+                        if st.button("Cancelar", key=f"cancelar_{paciente['id']}"):
+                            st.session_state[confirm_key] = False  # Reseta a confirmação
+
+        # Navegação entre páginas
+        col_anterior, col_pagina, col_proxima = st.columns([0.2, 0.6, 0.2])
+        with col_anterior:
+            if st.button("Anterior", key="pacientes_anterior", disabled=len(paginas) == 1):
+                paginas.pop()
+                st.rerun(scope="fragment")
+        with col_pagina:
+            st.caption(f"Página {len(paginas)}")
+        with col_proxima:
+            if st.button("Próxima", key="pacientes_proxima", disabled=not tem_proxima):
+                ultimo = pacientes[-1]
+                paginas.append((ultimo['nome'], ultimo['id']))
+                st.rerun(scope="fragment")
+    elif busca.strip():
+        st.info("Nenhum paciente encontrado para a busca.")
+    else:
+        st.info("Nenhum paciente cadastrado.")
+
+@metrics.fragment
+def new_patient_form():
+    """
+    Formulário de cadastro. Após cadastrar, a página inteira é reexecutada para
+    a lista mostrar o novo paciente.
+    """
     # Formulário para adicionar novo paciente
     st.subheader("Adicionar Novo Paciente")
     with st.form("cadastro_paciente"):
@@ -149,3 +226,16 @@ def patient_registration():
             else:
                 save_patient(nome, idade, sexo, altura, peso)
                 st.rerun()
+
+def patient_registration():
+    """
+    Interface para cadastro, edição e remoção de pacientes.
+    """
+    st.header("Cadastro de Pacientes")
+
+    patient_list()
+    new_patient_form()
+
+    # Importação de arquivos (pacientes, medicamentos, diário e doses)
+    with st.expander("Importação em Massa"):
+        render_import()
@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+def fetch_concurrently(*chamadas):
+    """
+    Executa leituras independentes em paralelo e devolve os resultados na ordem das chamadas.
+
+    Cada chamada é uma tupla (função, *argumentos). As funções usam conexões
+    do pool, então a latência total se aproxima da consulta mais lenta. As
+    threads herdam o contexto da sessão do Streamlit, de modo que mensagens
+    como st.error continuam aparecendo na página. Uma exceção é propagada
+    como na execução sequencial, cancelando as chamadas que ainda não começaram.
+    """
+    if len(chamadas) <= 1:
+        return [funcao(*args) for funcao, *args in chamadas]
+
+    ctx = get_script_run_ctx()
+
+    def executar(funcao, args):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return funcao(*args)
+
+    # Threads de vida curta: nenhuma thread reaproveitada fica com o contexto de outra sessão
+    with ThreadPoolExecutor(max_workers=len(chamadas), thread_name_prefix="medtrack-fetch") as executor:
+        futuros = [executor.submit(executar, funcao, args) for funcao, *args in chamadas]
+        try:
+            return [futuro.result() for futuro in futuros]
+        except BaseException:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
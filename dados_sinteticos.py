@@ -0,0 +1,275 @@
+"""
+Gera uma massa de dados sintética e reprodutível para medir o desempenho.
+
+Cada paciente tem uma internação com início sorteado no período e duração
+log-normal (alguns são residentes de longa permanência); durante a
+internação recebe doses de cada medicamento conforme a frequência, com uma
+adesão própria, e registros diários de cada tipo do diário. A mesma semente
+gera sempre os mesmos dados.
+
+Os dados são gravados com COPY, em blocos de pacientes, em um banco com as
+migrações aplicadas e sem pacientes (use --limpar para apagar os existentes).
+
+    python dados_sinteticos.py --pacientes 10000 --anos 5 --semente 42
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+import numpy as np
+
+from adesao import refresh_adherence
+from agenda import rebuild_schedule
+from db import get_connection
+from diario_valores import format_detalhes, typed_values
+
+
+NOMES = ["Ana", "Maria", "José", "João", "Antônio", "Francisca", "Carlos", "Paulo", "Pedro", "Lucas",
+         "Luiz", "Marcos", "Luís", "Gabriel", "Rafael", "Juliana", "Márcia", "Fernanda", "Patrícia", "Aline"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima",
+              "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Araújo"]
+MEDICAMENTOS = [("Losartana", "Anti-hipertensivo"), ("Metformina", "Antidiabético"), ("Dipirona", "Analgésico"),
+                ("Omeprazol", "Protetor gástrico"), ("Sinvastatina", "Hipolipemiante"), ("Enoxaparina", "Anticoagulante"),
+                ("Ceftriaxona", "Antibiótico"), ("Paracetamol", "Analgésico"), ("Furosemida", "Diurético"),
+                ("Insulina NPH", "Antidiabético"), ("Captopril", "Anti-hipertensivo"), ("Tramadol", "Analgésico")]
+# Frequência diária das prescrições e sua probabilidade
+FREQUENCIAS = ([1, 2, 3, 4, 6], [0.35, 0.30, 0.20, 0.10, 0.05])
+# Registros por dia de internação de cada tipo do diário (média de uma Poisson)
+REGISTROS_POR_DIA = {"Sinais Vitais": 3.0, "Líquidos": 4.0, "Fisiologia": 3.0, "Alimentação": 3.2, "Ocorrência": 0.4}
+OCORRENCIAS = (["Dor", "Confusão", "Falta de Ar", "Mal Estar", "Desmaio", "Tontura"],
+               [0.55, 0.12, 0.10, 0.15, 0.03, 0.05])
+REFEICOES = ["Café", "Almoço", "Chá da Tarde", "Jantar"]
+LIQUIDOS = ["Água", "Café", "Isotônico", "Soro", "Chá"]
+
+PACIENTES_POR_BLOCO = 250
+
+
+class SyntheticData:
+    """
+    Sorteia os registros de cada paciente a partir de um gerador com semente fixa.
+    """
+
+    def __init__(self, semente, anos, permanencia_mediana, longa_permanencia, fim=None):
+        self.rng = np.random.default_rng(semente)
+        self.fim = fim or date.today()
+        self.dias = int(anos * 365)
+        self.inicio = self.fim - timedelta(days=self.dias - 1)
+        self.permanencia_mediana = permanencia_mediana
+        self.longa_permanencia = longa_permanencia
+
+    def _clock(self, minutos):
+        minutos = int(minutos) % (24 * 60)
+        return dtime(minutos // 60, minutos % 60)
+
+    def stay(self):
+        """
+        Primeiro e último dia da internação.
+        """
+        if self.rng.random() < self.longa_permanencia:
+            duracao = int(self.rng.integers(180, self.dias + 1))
+        else:
+            duracao = int(np.clip(self.rng.lognormal(math.log(self.permanencia_mediana), 0.9), 1, 365))
+        primeiro = int(self.rng.integers(0, self.dias))
+        ultimo = min(primeiro + duracao - 1, self.dias - 1)
+        return self.inicio + timedelta(days=primeiro), self.inicio + timedelta(days=ultimo)
+
+    def patient(self, paciente_id):
+        sexo = self.rng.choice(["Masculino", "Feminino"], p=[0.48, 0.52])
+        altura = self.rng.normal(172 if sexo == "Masculino" else 160, 7)
+        imc = self.rng.normal(26, 4)
+        nome = f"{self.rng.choice(NOMES)} {self.rng.choice(SOBRENOMES)} {self.rng.choice(SOBRENOMES)} {paciente_id}"
+        return (paciente_id, nome, int(np.clip(self.rng.normal(64, 17), 18, 100)), sexo,
+                round(float(altura), 1), round(float(imc * (altura / 100) ** 2), 1))
+
+    def medications(self, paciente_id, primeiro_dia, proximo_id):
+        quantidade = min(1 + int(self.rng.poisson(3)), 12)
+        indices = self.rng.choice(len(MEDICAMENTOS), size=quantidade, replace=False)
+        medicamentos = []
+        for i, indice in enumerate(indices):
+            nome, categoria = MEDICAMENTOS[indice]
+            frequencia = int(self.rng.choice(FREQUENCIAS[0], p=FREQUENCIAS[1]))
+            medicamentos.append((proximo_id + i, paciente_id, nome, frequencia, categoria, "",
+                                 datetime.combine(primeiro_dia, dtime(7, 0))))
+        return medicamentos
+
+    def doses(self, paciente_id, medicamentos, primeiro_dia, ultimo_dia):
+        """
+        Doses tomadas: cada horário previsto é cumprido com a adesão do paciente,
+        com atraso normal em torno do horário.
+        """
+        adesao = self.rng.beta(18, 2)
+        dias = (ultimo_dia - primeiro_dia).days + 1
+        for medicamento_id, _, _, frequencia, _, _, _ in medicamentos:
+            intervalo = 24 * 60 // frequencia
+            tomadas = self.rng.random((dias, frequencia)) < adesao
+            atrasos = self.rng.normal(0, 25, (dias, frequencia))
+            for d, k in zip(*np.nonzero(tomadas)):
+                minutos = min(max(6 * 60 + k * intervalo + atrasos[d, k], 0), 24 * 60 - 1)
+                yield (paciente_id, medicamento_id, int(k) + 1,
+                       datetime.combine(primeiro_dia + timedelta(days=int(d)), self._clock(minutos)))
+
+    def _entry(self, tipo):
+        """
+        Campos de um registro do diário de `tipo`, como o formulário da página os monta.
+        """
+        hora = self._clock(self.rng.integers(6 * 60, 23 * 60))
+        fim = self._clock(hora.hour * 60 + hora.minute + int(self.rng.integers(5, 40)))
+        if tipo == "Sinais Vitais":
+            return hora, {
+                "O2": int(np.clip(self.rng.normal(96, 2), 80, 100)),
+                "PA": f"{int(self.rng.normal(125, 15))}/{int(self.rng.normal(80, 10))}",
+                "HR": int(np.clip(self.rng.normal(78, 12), 40, 160)),
+                "TEMP": round(float(np.clip(self.rng.normal(36.6, 0.5), 34, 41)), 1),
+                "GLIC": int(np.clip(self.rng.normal(115, 30), 40, 400)),
+            }
+        if tipo == "Líquidos":
+            return hora, {"Líquido": self.rng.choice(LIQUIDOS), "Hora Inicial": hora, "Hora Final": fim,
+                          "Quantidade": int(self.rng.choice([100, 150, 200, 250, 300, 500])), "Observação": ""}
+        if tipo == "Fisiologia":
+            if self.rng.random() < 0.8:
+                return hora, {"Subtipo": "Urina", "Quantidade": int(np.clip(self.rng.normal(300, 90), 50, 800)), "Hora": hora}
+            return hora, {"Subtipo": "Fezes", "Quantidade": "", "Hora": hora}
+        if tipo == "Alimentação":
+            return hora, {"Refeição": self.rng.choice(REFEICOES), "Hora Inicial": hora, "Hora Final": fim,
+                          "Quantidade": self.rng.choice(["Tudo", "Metade", "Pouco", "Nada"], p=[0.5, 0.3, 0.15, 0.05]),
+                          "Observação": ""}
+        subtipo = self.rng.choice(OCORRENCIAS[0], p=OCORRENCIAS[1])
+        campos = {"Subtipo": subtipo, "Hora Inicial": hora, "Hora Final": fim}
+        if subtipo == "Dor":
+            campos["Intensidade"] = int(np.clip(self.rng.poisson(4), 0, 10))
+        campos["Observação"] = ""
+        return hora, campos
+
+    def diary(self, paciente_id, primeiro_dia, ultimo_dia):
+        dias = (ultimo_dia - primeiro_dia).days + 1
+        quantidades = {tipo: self.rng.poisson(media, dias) for tipo, media in REGISTROS_POR_DIA.items()}
+        for d in range(dias):
+            dia = primeiro_dia + timedelta(days=d)
+            for tipo, por_dia in quantidades.items():
+                for _ in range(por_dia[d]):
+                    hora, campos = self._entry(tipo)
+                    yield (paciente_id, dia, hora, tipo, format_detalhes(campos),
+                           json.dumps(typed_values(tipo, campos)))
+
+
+def _copy(cursor, tabela, colunas, linhas):
+    """
+    Grava as linhas com COPY ... FROM STDIN (CSV). Retorna quantas foram gravadas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    total = 0
+    for linha in linhas:
+        writer.writerow(["" if v is None else v for v in linha])
+        total += 1
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return total
+
+
+def generate(conn, pacientes=10000, anos=5, semente=42, permanencia_mediana=10,
+             longa_permanencia=0.05, limpar=False, verbose=True):
+    """
+    Gera e grava a massa de dados. Retorna as linhas gravadas por tabela.
+    """
+    gerador = SyntheticData(semente, anos, permanencia_mediana, longa_permanencia)
+    with conn.cursor() as cursor:
+        if limpar:
+            cursor.execute("TRUNCATE pacientes, adesao_pendente RESTART IDENTITY CASCADE;")
+            cursor.execute("UPDATE adesao_controle SET calculado_ate = NULL;")
+        cursor.execute("SELECT count(*) AS n FROM pacientes;")
+        if cursor.fetchone()['n']:
+            raise ValueError("O banco já tem pacientes; use --limpar para apagá-los.")
+        for tabela, coluna in (("diario", "data"), ("doses_tomadas", "data_hora")):
+            cursor.execute(
+                "SELECT criar_particoes_mensais(%s, %s, %s, %s);",
+                (tabela, coluna, gerador.inicio, gerador.fim + timedelta(days=92))
+            )
+    conn.commit()
+
+    totais = {"pacientes": 0, "medicamentos": 0, "doses_tomadas": 0, "diario": 0}
+    proximo_medicamento = 1
+    inicio = time.monotonic()
+    for primeiro in range(1, pacientes + 1, PACIENTES_POR_BLOCO):
+        bloco_pacientes, bloco_medicamentos, bloco_doses, bloco_diario = [], [], [], []
+        for paciente_id in range(primeiro, min(primeiro + PACIENTES_POR_BLOCO, pacientes + 1)):
+            primeiro_dia, ultimo_dia = gerador.stay()
+            medicamentos = gerador.medications(paciente_id, primeiro_dia, proximo_medicamento)
+            proximo_medicamento += len(medicamentos)
+            bloco_pacientes.append(gerador.patient(paciente_id))
+            bloco_medicamentos.extend(medicamentos)
+            bloco_doses.extend(gerador.doses(paciente_id, medicamentos, primeiro_dia, ultimo_dia))
+            bloco_diario.extend(gerador.diary(paciente_id, primeiro_dia, ultimo_dia))
+
+        with conn.cursor() as cursor:
+            totais["pacientes"] += _copy(cursor, "pacientes", ["id", "nome", "idade", "sexo", "altura", "peso"],
+                                         bloco_pacientes)
+            totais["medicamentos"] += _copy(
+                cursor, "medicamentos",
+                ["id", "paciente_id", "nome", "frequencia", "categoria", "observacoes", "criado_em"],
+                bloco_medicamentos
+            )
+            totais["doses_tomadas"] += _copy(cursor, "doses_tomadas",
+                                             ["paciente_id", "medicamento_id", "dose", "data_hora"], bloco_doses)
+            totais["diario"] += _copy(cursor, "diario",
+                                      ["paciente_id", "data", "hora", "tipo", "detalhes", "valores"], bloco_diario)
+        conn.commit()
+        if verbose:
+            print(f"{totais['pacientes']} pacientes, {totais['diario']} registros, "
+                  f"{totais['doses_tomadas']} doses ({time.monotonic() - inicio:.0f}s)")
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT setval('pacientes_id_seq', %s);", (pacientes,))
+        cursor.execute("SELECT setval('medicamentos_id_seq', %s);", (max(proximo_medicamento - 1, 1),))
+        # O cálculo completo abaixo já cobre os dias marcados pelos gatilhos durante a carga
+        cursor.execute("DELETE FROM adesao_pendente;")
+    conn.commit()
+
+    if verbose:
+        print("Calculando a adesão...")
+    refresh_adherence(conn)
+    if verbose:
+        print("Gerando a agenda de doses...")
+    rebuild_schedule(conn, verbose=verbose)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("VACUUM ANALYZE;")
+    conn.autocommit = False
+    return totais
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos reprodutíveis no banco do MedTrack.")
+    parser.add_argument("--pacientes", type=int, default=10000)
+    parser.add_argument("--anos", type=float, default=5, help="Período coberto, terminando hoje.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--permanencia", type=float, default=10, help="Duração mediana da internação (dias).")
+    parser.add_argument("--longa-permanencia", type=float, default=0.05,
+                        help="Fração de pacientes de longa permanência.")
+    parser.add_argument("--limpar", action="store_true", help="Apaga todos os pacientes antes de gerar.")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        totais = generate(conn, args.pacientes, args.anos, args.semente, args.permanencia,
+                          args.longa_permanencia, args.limpar)
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao gerar dados: {e}")
+        return 1
+    finally:
+        conn.close()
+    for tabela, total in totais.items():
+        print(f"{tabela}: {total}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,499 @@
+"""
+Conexões com o banco: pool do primário e, opcionalmente, pools de réplicas de leitura.
+
+Gravações e leituras que precisam do dado mais recente usam `connection()`,
+sempre no primário. Leituras de painéis e exportações usam
+`read_connection()`, que escolhe (em rodízio) uma réplica com atraso de
+replicação até REPLICA_MAX_LAG segundos, ou o primário se nenhuma servir. O
+atraso de cada réplica é medido no máximo a cada REPLICA_CHECK_INTERVAL
+segundos, em relação ao primário:
+
+    0 se ela já aplicou o WAL até o pg_current_wal_lsn() lido no primário;
+    senão now() - pg_last_xact_replay_timestamp() na réplica
+
+Só entram no rodízio servidores em recuperação com o receptor de WAL em
+"streaming"; um servidor independente ou promovido, ou uma réplica que perdeu a
+conexão com o primário, fica de fora. O usuário das réplicas precisa do papel
+pg_read_all_stats para ler o estado do receptor em pg_stat_wal_receiver.
+
+Quem chama decide quando ler do primário para ver a própria gravação: o cache
+lê do primário as consultas cujas tags foram invalidadas (por uma gravação
+deste processo ou por uma notificação de outro) há menos de
+READ_YOUR_WRITES_WINDOW segundos; veja cache.cached_fetchall.
+
+Configuração (variáveis de ambiente):
+
+    MEDTRACK_DB_DSN        primário (DSN libpq ou URI); sem ela, MEDTRACK_DB_HOST etc.
+    MEDTRACK_DB_REPLICAS   DSNs das réplicas separados por ";"
+    MEDTRACK_REPLICA_MAX_LAG, MEDTRACK_REPLICA_CHECK_INTERVAL
+
+Para testar com duas instâncias locais, crie a réplica com
+`pg_basebackup -D replica -R -h localhost -p 5432`, inicie-a na porta 5433 e
+defina MEDTRACK_DB_REPLICAS="host=localhost port=5433 dbname=medtrack
+user=postgres password=..."; `python replicas.py` mostra o atraso de cada
+réplica e para qual servidor cada tipo de leitura foi.
+"""
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from metricas import InstrumentedConnection, metrics
+
+
+# Identifica as conexões deste processo (origem das notificações de alteração)
+PROCESS_NAME = f"medtrack-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+if os.environ.get("MEDTRACK_DB_DSN"):
+    DB_CONFIG = {"dsn": os.environ["MEDTRACK_DB_DSN"], "application_name": PROCESS_NAME}
+else:
+    DB_CONFIG = {
+        "dbname": os.environ.get("MEDTRACK_DB_NAME", "medtrack"),
+        "user": os.environ.get("MEDTRACK_DB_USER", "postgres"),
+        "password": os.environ.get("MEDTRACK_DB_PASSWORD", "password"),
+        "host": os.environ.get("MEDTRACK_DB_HOST", "localhost"),
+        "port": int(os.environ.get("MEDTRACK_DB_PORT", 5432)),
+        "application_name": PROCESS_NAME,
+    }
+
+REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get("MEDTRACK_DB_REPLICAS", "").split(";") if dsn.strip()]
+# Réplicas mais atrasadas que isso (em segundos) ficam fora do rodízio
+REPLICA_MAX_LAG = float(os.environ.get("MEDTRACK_REPLICA_MAX_LAG", 5.0))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("MEDTRACK_REPLICA_CHECK_INTERVAL", 5.0))
+# Uma réplica fora do ar não pode segurar a leitura por muito tempo
+REPLICA_CONNECT_TIMEOUT = 3
+# Depois de uma gravação, por quanto tempo as leituras dos mesmos dados vão ao primário.
+# Uma réplica no rodízio estava, na última medição, até REPLICA_MAX_LAG segundos atrás,
+# e a medição tem até REPLICA_CHECK_INTERVAL segundos.
+READ_YOUR_WRITES_WINDOW = float(
+    os.environ.get("MEDTRACK_READ_YOUR_WRITES", REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL)
+)
+
+# Configuração do pool de conexões
+POOL_MIN_SIZE = int(os.environ.get("MEDTRACK_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.environ.get("MEDTRACK_POOL_MAX_SIZE", 20))
+POOL_TIMEOUT = float(os.environ.get("MEDTRACK_POOL_TIMEOUT", 5.0))
+# Conexões ociosas há mais tempo que isso são testadas com "SELECT 1" antes de sair do pool
+POOL_CHECK_INTERVAL = float(os.environ.get("MEDTRACK_POOL_CHECK_INTERVAL", 30.0))
+
 
 def get_connection():
+    """
+    Abre uma conexão avulsa (fora do pool) com o banco de dados.
+    Prefira `connection()`, que reaproveita conexões do pool.
+    """
     try:
         conn = psycopg2.connect(
-            dbname="medtrack",
-            user="postgres",
-            password="password",
-            host="localhost",
-            port=5432,
+            **DB_CONFIG,
+            connection_factory=InstrumentedConnection,  # Registra cada comando em metricas
             cursor_factory=RealDictCursor  # Retorna resultados como dicionários
         )
         return conn
     except Exception as e:
         print(f"Erro ao conectar ao banco de dados: {e}")
         return None
+
+
+class PoolTimeout(Exception):
+    """
+    Nenhuma conexão ficou disponível dentro do tempo limite.
+    """
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe compartilhado por todas as sessões do processo.
+    """
+
+    def __init__(self, connect_kwargs, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT, check_interval=POOL_CHECK_INTERVAL):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamanhos inválidos para o pool de conexões.")
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (conexão, instante em que voltou ao pool)
+        self._size = 0
+        self._closed = False
+
+        # Estatísticas
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs, connection_factory=InstrumentedConnection,
+                                cursor_factory=RealDictCursor)
+
+    def _is_healthy(self, conn, idle_since):
+        """
+        Verifica se uma conexão ociosa ainda pode ser usada.
+        """
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - idle_since < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._discarded += 1
+            self._lock.notify()
+
+    def getconn(self, timeout=None):
+        """
+        Retira uma conexão do pool, esperando até `timeout` segundos se todas estiverem em uso.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        start = time.monotonic()
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise psycopg2.InterfaceError("O pool de conexões foi fechado.")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Nenhuma conexão disponível após {timeout:.1f}s "
+                            f"({self._size} em uso)."
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+
+                if waited:
+                    self._waits += 1
+                    self._wait_time += time.monotonic() - start
+                    waited = False
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    self._size += 1  # Reserva a vaga antes de conectar fora do lock
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self._checkouts += 1
+            # Espera total, incluindo verificação de saúde e abertura de conexões novas
+            metrics.observe_wait(time.monotonic() - start)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Devolve uma conexão ao pool, descartando-a se estiver quebrada.
+        """
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        """
+        Fecha todas as conexões ociosas e impede novas retiradas.
+        """
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                self._size -= 1
+            self._lock.notify_all()
+
+    def stats(self):
+        """
+        Retorna as estatísticas de uso do pool.
+        """
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Retorna o pool de conexões do processo, criando-o no primeiro uso.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG)
+    return _pool
+
+
+@contextmanager
+def connection():
+    """
+    Empresta uma conexão do pool durante o bloco `with`.
+
+    Se o banco estiver indisponível, imprime o erro e entrega None, como
+    `get_connection()`. Ao sair do bloco, transações não confirmadas são
+    desfeitas e a conexão volta ao pool.
+    """
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Erro ao conectar ao banco de dados: {e}")
+        yield None
+        return
+
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+
+class Replica:
+    """
+    Réplica de leitura: pool próprio (criado no primeiro uso) e o último atraso medido.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.pool = None
+        self.atraso = None  # Segundos; None enquanto não medido ou se a réplica falhou
+        self.atraso_bytes = None  # WAL do primário ainda não aplicado
+        self.em_recuperacao = None
+        self.erro = None
+        self.verificada_em = float("-inf")
+        self.leituras = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nome(self):
+        parametros = psycopg2.extensions.parse_dsn(self.dsn)
+        return f"{parametros.get('host', 'localhost')}:{parametros.get('port', 5432)}"
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = ConnectionPool(
+                {"dsn": self.dsn, "application_name": PROCESS_NAME, "connect_timeout": REPLICA_CONNECT_TIMEOUT},
+                min_size=0
+            )
+        return self.pool
+
+    def check(self, forcar=False):
+        """
+        Mede o atraso, no máximo a cada REPLICA_CHECK_INTERVAL segundos. Outra
+        thread já medindo não espera: usa-se o valor anterior.
+        """
+        if not forcar and time.monotonic() - self.verificada_em < REPLICA_CHECK_INTERVAL:
+            return
+        if not self._lock.acquire(blocking=forcar):
+            return
+        try:
+            # Lido antes da réplica: o que ela precisa ter aplicado para estar em dia
+            lsn_primario = _primary_wal_lsn()
+            pool = self._get_pool()
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        SELECT pg_is_in_recovery() AS em_recuperacao,
+                               r.pid AS receptor, r.status AS recepcao,
+                               pg_wal_lsn_diff(%s::pg_lsn, pg_last_wal_replay_lsn()) AS atraso_bytes,
+                               extract(epoch FROM now() - pg_last_xact_replay_timestamp()) AS desde_ultima
+                        FROM (SELECT 1) x LEFT JOIN pg_stat_wal_receiver r ON true;
+                        """,
+                        (lsn_primario,)
+                    )
+                    linha = cursor.fetchone()
+                conn.rollback()
+            except Exception:
+                pool.putconn(conn, discard=True)
+                raise
+            pool.putconn(conn)
+
+            self.em_recuperacao = linha['em_recuperacao']
+            if not linha['em_recuperacao']:
+                raise RuntimeError("não está em recuperação (servidor independente ou promovido)")
+            if linha['receptor'] is not None and linha['recepcao'] is None:
+                raise RuntimeError("sem permissão para ler pg_stat_wal_receiver (conceda pg_read_all_stats)")
+            if linha['recepcao'] != "streaming":
+                raise RuntimeError(f"receptor de WAL {linha['recepcao'] or 'desconectado'} do primário")
+
+            self.atraso_bytes = max(float(linha['atraso_bytes'] or 0.0), 0.0)
+            if self.atraso_bytes == 0:
+                self.atraso = 0.0
+            elif linha['desde_ultima'] is None:
+                raise RuntimeError("atrasada em relação ao primário e sem transação aplicada desde o início")
+            else:
+                # Atrás do primário: a última transação aplicada dá a idade dos dados
+                self.atraso = max(float(linha['desde_ultima']), 0.0)
+            self.erro = None
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.verificada_em = time.monotonic()
+            self._lock.release()
+
+    def fail(self, erro):
+        """
+        Tira a réplica do rodízio até a próxima verificação.
+        """
+        self.atraso = None
+        self.atraso_bytes = None
+        self.erro = str(erro).strip()
+        self.verificada_em = time.monotonic()
+
+    @property
+    def disponivel(self):
+        return self.atraso is not None and self.atraso <= REPLICA_MAX_LAG
+
+    def stats(self):
+        return {"replica": self.nome, "lag_seconds": self.atraso, "lag_bytes": self.atraso_bytes,
+                "available": self.disponivel, "in_recovery": self.em_recuperacao, "reads": self.leituras,
+                "error": self.erro}
+
+
+def _primary_wal_lsn():
+    """
+    Posição atual do WAL no primário, referência para o atraso das réplicas.
+    """
+    with connection() as conn:
+        if conn is None:
+            raise ConnectionError("primário indisponível para medir o atraso")
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()::text AS lsn;")
+            lsn = cursor.fetchone()['lsn']
+        conn.rollback()
+    return lsn
+
+
+_replicas = [Replica(dsn) for dsn in REPLICA_DSNS]
+_rodizio = itertools.count()
+_leituras_primario = 0
+
+
+def get_replicas():
+    return list(_replicas)
+
+
+def choose_replica():
+    """
+    Próxima réplica disponível no rodízio, ou None para ler do primário.
+    """
+    if not _replicas:
+        return None
+    for replica in _replicas:
+        replica.check()
+    disponiveis = [r for r in _replicas if r.disponivel]
+    if not disponiveis:
+        return None
+    return disponiveis[next(_rodizio) % len(disponiveis)]
+
+
+@contextmanager
+def read_connection(primario=False):
+    """
+    Empresta uma conexão para leituras: de uma réplica dentro do atraso
+    máximo ou, com `primario=True` ou sem réplica disponível, do primário.
+    Mesmo contrato de `connection()`: entrega None se o banco estiver indisponível.
+    """
+    global _leituras_primario
+    replica = None if primario else choose_replica()
+    conn = None
+    if replica is not None:
+        try:
+            conn = replica._get_pool().getconn()
+        except Exception as e:
+            replica.fail(e)
+            print(f"Réplica {replica.nome} indisponível; lendo do primário: {e}")
+
+    if conn is None:
+        _leituras_primario += 1
+        with connection() as conn:
+            yield conn
+        return
+
+    replica.leituras += 1
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        broken = True
+        replica.fail(e)
+        raise
+    finally:
+        replica.pool.putconn(conn, discard=broken)
+
+
+def routing_stats():
+    """
+    Leituras feitas no primário por `read_connection()` e situação de cada réplica.
+    """
+    return {"primary_reads": _leituras_primario, "replicas": [r.stats() for r in _replicas]}
@@ -1,263 +1,351 @@
 import psycopg2
-from datetime import datetime, time
+from psycopg2.extras import Json, execute_values
+from datetime import datetime, time, timedelta
 import streamlit as st
-from db import get_connection
+from db import connection
+from cache import invalidate
+from concorrencia import fetch_concurrently
+from resumo_paciente import fetch_patient_snapshot
+from diretorio_pacientes import patient_selector
+from agenda import expected_time
+from fila_escritas import ESCRITA_ADIADA, enqueue, pending_diary, pending_doses
+from notificacoes import seen, watch
+from diario_resumo import render_day_summary
+from diario_valores import format_detalhes, parse_detalhes, typed_values
+from metricas import metrics
 
-def save_diary_entry(paciente_id, tipo, data_hora, detalhes):
+# Seções do resumo do paciente lidas por cada painel
+SECOES_DOSES = ("medicamentos", "doses")
+SECOES_DIARIO = ("diario", "resumo_dia")
+
+def save_diary_entry(paciente_id, tipo, data_hora, detalhes, valores=None):
     """
     Salva uma entrada no diário do banco de dados.
+    Os valores tipados (`valores`) são extraídos de `detalhes` quando não informados.
+    Com a escrita adiada ativa, o registro vai para a fila local (fila_escritas).
     """
     if not tipo.strip() or not detalhes.strip():
         st.error("Os campos 'Tipo' e 'Detalhes' são obrigatórios.")
         return
+    if valores is None:
+        valores = parse_detalhes(tipo, detalhes)
 
-    conn = get_connection()
-    if conn:
+    if ESCRITA_ADIADA:
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO diario (paciente_id, data, tipo, detalhes, hora)
-                    VALUES (%s, %s, %s, %s, %s);
-                    """,
-                    (paciente_id, data_hora.date(), tipo, detalhes, data_hora.time())
-                )
-                conn.commit()
-                st.success(f"Registro '{tipo}' salvo com sucesso!")
+            enqueue("diario", paciente_id, {"data": data_hora.date(), "hora": data_hora.time(), "tipo": tipo,
+                                            "detalhes": detalhes, "valores": valores})
+            st.success(f"Registro '{tipo}' salvo; envio ao banco em segundo plano.")
         except Exception as e:
-            st.error(f"Erro ao salvar registro no diário: {e}")
-        finally:
-            conn.close()
+            st.error(f"Erro ao gravar registro na fila local: {e}")
+        return
 
-def fetch_diary_entries(paciente_id, data):
-    """
-    Busca entradas do diário no banco de dados.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT tipo, data, hora, detalhes
-                    FROM diario
-                    WHERE paciente_id = %s AND data = %s;
-                    """,
-                    (paciente_id, data)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar registros do diário: {e}")
-        finally:
-            conn.close()
-    return []
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO diario (paciente_id, data, tipo, detalhes, valores, hora)
+                        VALUES (%s, %s, %s, %s, %s, %s);
+                        """,
+                        (paciente_id, data_hora.date(), tipo, detalhes, Json(valores), data_hora.time())
+                    )
+                    conn.commit()
+                    invalidate(("diario", paciente_id), ("busca",))
+                    st.success(f"Registro '{tipo}' salvo com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao salvar registro no diário: {e}")
+        else:
+            st.error("Banco de dados indisponível; o registro não foi salvo.")
 
-def fetch_doses(paciente_id):
+def _enqueue_doses(paciente_id, doses):
     """
-    Busca medicamentos e suas doses associadas para o paciente.
+    Grava as doses confirmadas na fila local; retorna se a gravação deu certo.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT m.id AS medicamento_id, m.nome AS medicamento, m.frequencia AS quantidade
-                    FROM medicamentos m
-                    WHERE m.paciente_id = %s;
-                    """,
-                    (paciente_id,)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar doses: {e}")
-        finally:
-            conn.close()
-    return []
+    try:
+        enqueue("doses", paciente_id, {"doses": doses})
+        return True
+    except Exception as e:
+        st.error(f"Erro ao gravar doses na fila local: {e}")
+        return False
 
 def register_dose(paciente_id, medicamento_id, dose, hora):
     """
     Registra a confirmação de uma dose com o horário especificado.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora)
-                    VALUES (%s, %s, %s, %s);
-                    """,
-                    (paciente_id, medicamento_id, dose, hora)
-                )
-                conn.commit()
-                st.success("Dose confirmada com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao confirmar dose: {e}")
-        finally:
-            conn.close()
+    if ESCRITA_ADIADA:
+        if _enqueue_doses(paciente_id, [(medicamento_id, dose, hora)]):
+            st.success("Dose confirmada; envio ao banco em segundo plano.")
+        return
+
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora)
+                        VALUES (%s, %s, %s, %s);
+                        """,
+                        (paciente_id, medicamento_id, dose, hora)
+                    )
+                    conn.commit()
+                    invalidate(("doses", paciente_id), ("agenda",))
+                    st.success("Dose confirmada com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao confirmar dose: {e}")
+        else:
+            st.error("Banco de dados indisponível; a dose não foi confirmada.")
 
-def delete_dose(paciente_id, medicamento_id, dose):
+def register_doses(paciente_id, doses):
     """
-    Remove uma dose confirmada no banco de dados.
+    Registra várias doses de uma vez, em uma única transação.
+    `doses` é uma lista de tuplas (medicamento_id, dose, data_hora).
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    DELETE FROM doses_tomadas
-                    WHERE paciente_id = %s AND medicamento_id = %s AND dose = %s;
-                    """,
-                    (paciente_id, medicamento_id, dose)
-                )
-                conn.commit()
-                st.success("Dose removida com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao remover dose: {e}")
-        finally:
-            conn.close()
+    if not doses:
+        return
+    if ESCRITA_ADIADA:
+        if _enqueue_doses(paciente_id, doses):
+            st.success(f"{len(doses)} dose(s) confirmada(s); envio ao banco em segundo plano.")
+        return
+
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        """
+                        INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora)
+                        VALUES %s;
+                        """,
+                        [(paciente_id, medicamento_id, dose, data_hora) for medicamento_id, dose, data_hora in doses]
+                    )
+                    conn.commit()
+                    invalidate(("doses", paciente_id), ("agenda",))
+                    st.success(f"{len(doses)} dose(s) confirmada(s) com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao confirmar doses: {e}")
+        else:
+            st.error("Banco de dados indisponível; as doses não foram confirmadas.")
+
+def delete_dose(paciente_id, medicamento_id, dose, data):
+    """
+    Remove uma dose confirmada no dia informado.
+    """
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        DELETE FROM doses_tomadas
+                        WHERE paciente_id = %s AND medicamento_id = %s AND dose = %s
+                          AND data_hora >= %s AND data_hora < %s;
+                        """,
+                        (paciente_id, medicamento_id, dose, data, data + timedelta(days=1))
+                    )
+                    conn.commit()
+                    invalidate(("doses", paciente_id), ("agenda",))
+                    st.success("Dose removida com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao remover dose: {e}")
 
 def delete_diary_entry(paciente_id, data, hora):
     """
     Remove uma entrada do diário do banco de dados.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    DELETE FROM diario
-                    WHERE paciente_id = %s AND data = %s AND hora = %s;
-                    """,
-                    (paciente_id, data, hora)
-                )
-                conn.commit()
-                st.success("Registro do diário removido com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao remover registro do diário: {e}")
-        finally:
-            conn.close()
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        DELETE FROM diario
+                        WHERE paciente_id = %s AND data = %s AND hora = %s;
+                        """,
+                        (paciente_id, data, hora)
+                    )
+                    conn.commit()
+                    invalidate(("diario", paciente_id), ("busca",))
+                    st.success("Registro do diário removido com sucesso!")
+            except Exception as e:
+                st.error(f"Erro ao remover registro do diário: {e}")
+
+@metrics.fragment
+def dose_panel(paciente_id, data_selecionada):
+    """
+    Painel de doses do dia. Confirmar ou remover uma dose reexecuta só este
+    fragmento, que relê apenas medicamentos e doses do paciente.
+    """
+    seen(paciente_id, SECOES_DOSES)
+    resumo = fetch_patient_snapshot(paciente_id, data_selecionada, secoes=SECOES_DOSES)
+    doses = [
+        {"medicamento_id": m['id'], "medicamento": m['nome'], "quantidade": m['frequencia'],
+         "horario_inicio": m['horario_inicio'], "intervalo_horas": m['intervalo_horas']}
+        for m in resumo['medicamentos']
+    ]
+    confirmadas = resumo['doses']
+    # Doses confirmadas ainda na fila local contam como confirmadas, mas só
+    # podem ser removidas depois de chegarem ao banco
+    na_fila = pending_doses(paciente_id, data_selecionada) if ESCRITA_ADIADA else {}
+    agora = datetime.now()
+
+    # Gerenciamento de Doses
+    st.subheader("Gerenciamento de Doses de Medicamentos")
+    pendentes = []
+
+    for dose in doses:
+        medicamento_id = dose['medicamento_id']
+        medicamento = dose['medicamento']
+        quantidade = dose['quantidade']
+
+        st.markdown(f"### Medicamento: {medicamento}")
+        for d in range(1, quantidade + 1):
+            hora_confirmada = confirmadas.get((medicamento_id, d))
+            enviando = hora_confirmada is None and (medicamento_id, d) in na_fila
+            if enviando:
+                hora_confirmada = na_fila[(medicamento_id, d)]
+            prevista = expected_time(data_selecionada, dose['horario_inicio'], quantidade, dose['intervalo_horas'], d)
+
+            col1, col2 = st.columns([0.8, 0.2])
+
+            with col1:
+                if hora_confirmada:
+                    st.markdown(f"**Dose {d} - Administrada às {hora_confirmada.strftime('%H:%M')}** "
+                                f"(prevista para {prevista.strftime('%H:%M')})"
+                                + (" - envio pendente" if enviando else ""))
+                else:
+                    hora_especificada = st.time_input(
+                        f"Horário para Dose {d}",
+                        key=f"hora_{medicamento_id}_{d}"
+                    )
+                    st.caption(f"Prevista para {prevista.strftime('%d/%m %H:%M')}"
+                               + (" - atrasada" if prevista < agora else ""))
+                    data_hora = datetime.combine(data_selecionada, hora_especificada)
+                    pendentes.append((medicamento_id, d, data_hora))
+                    if st.button(f"Confirmar Horário para Dose {d}", key=f"confirmar_hora_{medicamento_id}_{d}"):
+                        register_dose(paciente_id, medicamento_id, d, data_hora)
+                        st.rerun(scope="fragment")
+
+            with col2:
+                if st.button("Remover Dose", key=f"remover_{medicamento_id}_{d}", disabled=not hora_confirmada or enviando):
+                    delete_dose(paciente_id, medicamento_id, d, data_selecionada)
+                    st.rerun(scope="fragment")
+
+    # Confirmação em lote das doses pendentes do dia
+    if pendentes:
+        if st.button(f"Confirmar todas as doses pendentes ({len(pendentes)})", key="confirmar_todas_doses"):
+            register_doses(paciente_id, pendentes)
+            st.rerun(scope="fragment")
+
+@metrics.fragment
+def diary_list(paciente_id, data_selecionada):
+    """
+    Registros do diário no dia. Remover um registro reexecuta só este fragmento.
+    """
+    seen(paciente_id, ("diario",))
+    resumo = fetch_patient_snapshot(paciente_id, data_selecionada, secoes=SECOES_DIARIO)
+    registros = resumo['diario']
+
+    # Exibir registros do diário
+    st.subheader(f"Registros do Diário ({data_selecionada})")
+    render_day_summary(resumo['resumo_dia'])
+    for registro in registros:
+        with st.expander(f"{registro['tipo']} - {registro['hora']}"):
+            st.write(f"**Detalhes:** {registro['detalhes']}")
+            if st.button("Remover", key=f"remover_diario_{registro['hora']}"):
+                delete_diary_entry(paciente_id, registro['data'], registro['hora'])
+                st.rerun(scope="fragment")
+    if ESCRITA_ADIADA:
+        for registro in pending_diary(paciente_id, data_selecionada):
+            with st.expander(f"{registro['tipo']} - {registro['hora']} (envio pendente)"):
+                st.write(f"**Detalhes:** {registro['detalhes']}")
+
+@metrics.fragment
+def entry_form(paciente_id):
+    """
+    Formulário de novos registros; trocar o tipo ou preencher campos não
+    reexecuta o restante da página.
+    """
+    # Formulário para novos registros
+    st.subheader("Adicionar Novo Registro")
+    tipo = st.selectbox("Tipo", ["Fisiologia", "Sinais Vitais", "Ocorrência", "Alimentação", "Líquidos"])
+
+    campos = {}
+    data_hora = datetime.now()
+
+    if tipo == "Fisiologia":
+        subtipo = st.selectbox("Subtipo", ["Urina", "Fezes"], key="fisiologia_subtipo")
+        quantidade = st.text_input("Quantidade", key="fisiologia_quantidade")
+        hora = st.time_input("Hora", value=datetime.now().time(), key="fisiologia_hora")
+        campos = {"Subtipo": subtipo, "Quantidade": quantidade, "Hora": hora}
+
+    elif tipo == "Sinais Vitais":
+        o2 = st.text_input("O2", key="sinais_vitais_o2")
+        pa = st.text_input("PA", key="sinais_vitais_pa")
+        hr = st.text_input("HR", key="sinais_vitais_hr")
+        temp = st.text_input("TEMP", key="sinais_vitais_temp")
+        glic = st.text_input("GLIC", key="sinais_vitais_glic")
+        campos = {"O2": o2, "PA": pa, "HR": hr, "TEMP": temp, "GLIC": glic}
+
+    elif tipo == "Ocorrência":
+        subtipo = st.selectbox("Subtipo", ["Dor", "Confusão", "Falta de Ar", "Mal Estar", "Desmaio", "Tontura"], key="ocorrencia_subtipo")
+        if subtipo == "Dor":
+            hora_inicial = st.time_input("Hora Inicial", key="ocorrencia_dor_hora_inicial")
+            hora_final = st.time_input("Hora Final", key="ocorrencia_dor_hora_final")
+            intensidade = st.slider("Intensidade (0-10)", 0, 10, key="ocorrencia_dor_intensidade")
+            observacao = st.text_area("Observação", key="ocorrencia_dor_observacao")
+            campos = {"Subtipo": subtipo, "Hora Inicial": hora_inicial, "Hora Final": hora_final, "Intensidade": intensidade, "Observação": observacao}
+        elif subtipo in ["Falta de Ar", "Mal Estar", "Desmaio", "Tontura"]:
+            hora_inicial = st.time_input("Hora Inicial", key=f"{subtipo}_hora_inicial")
+            hora_final = st.time_input("Hora Final", key=f"{subtipo}_hora_final")
+            observacao = st.text_area("Observação", key=f"{subtipo}_observacao")
+            campos = {"Subtipo": subtipo, "Hora Inicial": hora_inicial, "Hora Final": hora_final, "Observação": observacao}
+
+    elif tipo == "Alimentação":
+        refeicao = st.selectbox("Refeição", ["Café", "Almoço", "Jantar", "Chá da Tarde"], key="alimentacao_refeicao")
+        hora_inicial = st.time_input("Hora Inicial", key="alimentacao_hora_inicial")
+        hora_final = st.time_input("Hora Final", key="alimentacao_hora_final")
+        quantidade_aprox = st.text_input("Quantidade Aproximada", key="alimentacao_quantidade")
+        observacao = st.text_area("Observação", key="alimentacao_observacao")
+        campos = {"Refeição": refeicao, "Hora Inicial": hora_inicial, "Hora Final": hora_final, "Quantidade": quantidade_aprox, "Observação": observacao}
+
+    elif tipo == "Líquidos":
+        liquido = st.selectbox("Líquido", ["Água", "Café", "Isotônico", "Soro", "Chá"], key="liquidos_tipo")
+        hora_inicial = st.time_input("Hora Inicial", key="liquidos_hora_inicial")
+        hora_final = st.time_input("Hora Final", key="liquidos_hora_final")
+        quantidade = st.text_input("Quantidade (ml)", key="liquidos_quantidade")
+        observacao = st.text_area("Observação", key="liquidos_observacao")
+        campos = {"Líquido": liquido, "Hora Inicial": hora_inicial, "Hora Final": hora_final, "Quantidade": quantidade, "Observação": observacao}
+
+    # O texto continua sendo gravado para exibição; os valores tipados vão para `valores`
+    detalhes = format_detalhes(campos)
+    valores = typed_values(tipo, campos)
+
+    if st.button("Salvar Registro"):
+        save_diary_entry(paciente_id, tipo, data_hora, detalhes, valores)
+        # O novo registro aparece na lista de outro fragmento; na reexecução completa
+        # o painel de doses continua vindo do cache, só o diário é relido
+        st.rerun()
 
 def daily_diary():
     """
     Interface para gerenciamento de diário e doses de medicamentos.
     """
-    # Buscar pacientes
-    conn = get_connection()
-    pacientes = []
-    if conn:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id, nome FROM pacientes;")
-            pacientes = cursor.fetchall()
-        conn.close()
-
-    lista_pacientes = [f"{p['id']} - {p['nome']}" for p in pacientes]
-    if lista_pacientes:
-        paciente_selecionado = st.selectbox("Selecione o Paciente", lista_pacientes)
-        paciente_id = int(paciente_selecionado.split(" - ")[0])
+    # Paciente e data alimentam todos os painéis, então mudá-los reexecuta a página inteira
+    paciente_id = patient_selector("diario_paciente")
+    if paciente_id is not None:
         data_selecionada = st.date_input("Selecione a Data", value=datetime.now().date())
 
-        # Gerenciamento de Doses
-        st.subheader("Gerenciamento de Doses de Medicamentos")
-        doses = fetch_doses(paciente_id)
-
-        for dose in doses:
-            medicamento_id = dose['medicamento_id']
-            medicamento = dose['medicamento']
-            quantidade = dose['quantidade']
-
-            st.markdown(f"### Medicamento: {medicamento}")
-            for d in range(1, quantidade + 1):
-                dose_key = f"dose_{medicamento_id}_{d}"
-                hora_confirmada = st.session_state.get(f"dose_confirmada_{dose_key}")
-
-                col1, col2 = st.columns([0.8, 0.2])
-
-                with col1:
-                    if hora_confirmada:
-                        st.markdown(f"**Dose {d} - Administrada às {hora_confirmada.strftime('%H:%M')}**")
-                    else:
-                        hora_especificada = st.time_input(
-                            f"Horário para Dose {d}",
-                            key=f"hora_{medicamento_id}_{d}"
-                        )
-                        if st.button(f"Confirmar Horário para Dose {d}", key=f"confirmar_hora_{medicamento_id}_{d}"):
-                            data_hora = datetime.combine(data_selecionada, hora_especificada)
-                            register_dose(paciente_id, medicamento_id, d, data_hora)
-                            st.session_state[f"dose_confirmada_{dose_key}"] = data_hora
-                            st.rerun()
-
-                with col2:
-                    if st.button("Remover Dose", key=f"remover_{medicamento_id}_{d}"):
-                        delete_dose(paciente_id, medicamento_id, d)
-                        if f"dose_confirmada_{dose_key}" in st.session_state:
-                            del st.session_state[f"dose_confirmada_{dose_key}"]
-                        st.rerun()
-
-        # Exibir registros do diário
-        st.subheader(f"Registros do Diário ({data_selecionada})")
-        registros = fetch_diary_entries(paciente_id, data_selecionada)
-        for registro in registros:
-            with st.expander(f"{registro['tipo']} - {registro['hora']}"):
-                st.write(f"**Detalhes:** {registro['detalhes']}")
-                if st.button("Remover", key=f"remover_diario_{registro['hora']}"):
-                    delete_diary_entry(paciente_id, registro['data'], registro['hora'])
-                    st.rerun()
-
-        # Formulário para novos registros
-        st.subheader("Adicionar Novo Registro")
-        tipo = st.selectbox("Tipo", ["Fisiologia", "Sinais Vitais", "Ocorrência", "Alimentação", "Líquidos"])
-
-        detalhes = ""
-        data_hora = datetime.now()
-
-        if tipo == "Fisiologia":
-            subtipo = st.selectbox("Subtipo", ["Urina", "Fezes"], key="fisiologia_subtipo")
-            quantidade = st.text_input("Quantidade", key="fisiologia_quantidade")
-            hora = st.time_input("Hora", value=datetime.now().time(), key="fisiologia_hora")
-            detalhes = f"Subtipo: {subtipo}, Quantidade: {quantidade}, Hora: {hora}"
-
-        elif tipo == "Sinais Vitais":
-            o2 = st.text_input("O2", key="sinais_vitais_o2")
-            pa = st.text_input("PA", key="sinais_vitais_pa")
-            hr = st.text_input("HR", key="sinais_vitais_hr")
-            temp = st.text_input("TEMP", key="sinais_vitais_temp")
-            glic = st.text_input("GLIC", key="sinais_vitais_glic")
-            detalhes = f"O2: {o2}, PA: {pa}, HR: {hr}, TEMP: {temp}, GLIC: {glic}"
-
-        elif tipo == "Ocorrência":
-            subtipo = st.selectbox("Subtipo", ["Dor", "Confusão", "Falta de Ar", "Mal Estar", "Desmaio", "Tontura"], key="ocorrencia_subtipo")
-            if subtipo == "Dor":
-                hora_inicial = st.time_input("Hora Inicial", key="ocorrencia_dor_hora_inicial")
-                hora_final = st.time_input("Hora Final", key="ocorrencia_dor_hora_final")
-                intensidade = st.slider("Intensidade (0-10)", 0, 10, key="ocorrencia_dor_intensidade")
-                observacao = st.text_area("Observação", key="ocorrencia_dor_observacao")
-                detalhes = f"Subtipo: {subtipo}, Hora Inicial: {hora_inicial}, Hora Final: {hora_final}, Intensidade: {intensidade}, Observação: {observacao}"
-            elif subtipo in ["Falta de Ar", "Mal Estar", "Desmaio", "Tontura"]:
-                hora_inicial = st.time_input("Hora Inicial", key=f"{subtipo}_hora_inicial")
-                hora_final = st.time_input("Hora Final", key=f"{subtipo}_hora_final")
-                observacao = st.text_area("Observação", key=f"{subtipo}_observacao")
-                detalhes = f"Subtipo: {subtipo}, Hora Inicial: {hora_inicial}, Hora Final: {hora_final}, Observação: {observacao}"
-
-        elif tipo == "Alimentação":
-            refeicao = st.selectbox("Refeição", ["Café", "Almoço", "Jantar", "Chá da Tarde"], key="alimentacao_refeicao")
-            hora_inicial = st.time_input("Hora Inicial", key="alimentacao_hora_inicial")
-            hora_final = st.time_input("Hora Final", key="alimentacao_hora_final")
-            quantidade_aprox = st.text_input("Quantidade Aproximada", key="alimentacao_quantidade")
-            observacao = st.text_area("Observação", key="alimentacao_observacao")
-            detalhes = f"Refeição: {refeicao}, Hora Inicial: {hora_inicial}, Hora Final: {hora_final}, Quantidade: {quantidade_aprox}, Observação: {observacao}"
-
-        elif tipo == "Líquidos":
-            liquido = st.selectbox("Líquido", ["Água", "Café", "Isotônico", "Soro", "Chá"], key="liquidos_tipo")
-            hora_inicial = st.time_input("Hora Inicial", key="liquidos_hora_inicial")
-            hora_final = st.time_input("Hora Final", key="liquidos_hora_final")
-            quantidade = st.text_input("Quantidade (ml)", key="liquidos_quantidade")
-            observacao = st.text_area("Observação", key="liquidos_observacao")
-            detalhes = f"Líquido: {liquido}, Hora Inicial: {hora_inicial}, Hora Final: {hora_final}, Quantidade: {quantidade}, Observação: {observacao}"
-
-        if st.button("Salvar Registro"):
-            save_diary_entry(paciente_id, tipo, data_hora, detalhes)
-            st.rerun()
+        # Cada painel é um fragmento com a própria consulta; na execução completa
+        # as duas são feitas em paralelo antes, e os painéis as encontram no cache
+        fetch_concurrently(
+            (fetch_patient_snapshot, paciente_id, data_selecionada, 1, SECOES_DOSES),
+            (fetch_patient_snapshot, paciente_id, data_selecionada, 1, SECOES_DIARIO),
+        )
+        dose_panel(paciente_id, data_selecionada)
+        diary_list(paciente_id, data_selecionada)
+        entry_form(paciente_id)
+        # Alterações de outras sessões neste paciente reexecutam a página
+        watch(paciente_id)
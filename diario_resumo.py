@@ -0,0 +1,141 @@
+"""
+Resumo do diário por paciente e dia (tabela `diario_resumo`).
+
+O resumo é mantido pelos gatilhos das migrações 0007 e 0013 a cada gravação ou remoção
+no diário. Este módulo lê os resumos para as páginas e reconstrói a tabela,
+por exemplo depois de um backfill de `diario.valores`:
+
+    python diario_resumo.py                                        # tudo
+    python diario_resumo.py --inicio 2024-01-01 --fim 2024-12-31   # um período
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+
+import streamlit as st
+
+from cache import cached_fetchall
+from db import get_connection
+from diario_valores import VITAIS
+
+
+# Dias reconstruídos por transação
+DIAS_POR_BLOCO = 31
+
+
+def fetch_daily_summaries(paciente_id, inicio, fim, colunas=None, cursor_factory=None):
+    """
+    Linhas de resumo de um paciente entre `inicio` e `fim`, uma por dia com registros.
+    """
+    selecao = ", ".join(colunas) if colunas else "*"
+    return cached_fetchall(
+        f"""
+        SELECT data, {selecao}
+        FROM diario_resumo
+        WHERE paciente_id = %s AND data BETWEEN %s AND %s
+        ORDER BY data;
+        """,
+        (paciente_id, inicio, fim),
+        tags=[("diario", paciente_id)],
+        cursor_factory=cursor_factory
+    )
+
+
+def _range(minimo, maximo):
+    if minimo is None:
+        return "-"
+    if minimo == maximo:
+        return f"{minimo:g}"
+    return f"{minimo:g} - {maximo:g}"
+
+
+def render_day_summary(resumo):
+    """
+    Totais do dia a partir de uma linha de `diario_resumo` (ou None se o dia não tem registros).
+    """
+    if not resumo:
+        st.caption("Nenhum registro no dia.")
+        return
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Registros", resumo['registros'])
+    col2.metric("Líquidos (ml)", f"{resumo['entrada_ml']:g}")
+    col3.metric("Urina (ml)", f"{resumo['saida_ml']:g}")
+    col4.metric("Refeições", resumo['refeicoes'])
+
+    if resumo['ocorrencias']:
+        st.write("**Ocorrências:** " + ", ".join(
+            f"{subtipo}: {n}" for subtipo, n in sorted(resumo['ocorrencias'].items())
+        ))
+    vitais = [
+        f"{rotulo}: {_range(resumo[f'{chave}_min'], resumo[f'{chave}_max'])}"
+        for chave, rotulo in VITAIS.items() if resumo[f'{chave}_n']
+    ]
+    if vitais:
+        st.write("**Sinais vitais (mín - máx):** " + " | ".join(vitais))
+
+
+def rebuild_summaries(conn, inicio=None, fim=None, verbose=True):
+    """
+    Recalcula o resumo de todos os pacientes no período (padrão: todo o diário),
+    um bloco de dias por transação. Retorna quantos dias foram recalculados.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT min(data) AS inicio, max(data) AS fim FROM diario;")
+        limites = cursor.fetchone()
+    conn.commit()
+    inicio = inicio or limites['inicio']
+    fim = fim or limites['fim']
+    if inicio is None or fim is None:
+        return 0
+
+    total = 0
+    while inicio <= fim:
+        fim_bloco = min(inicio + timedelta(days=DIAS_POR_BLOCO - 1), fim)
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT diario_resumo_recalcular(array_agg(paciente_id), array_agg(data)), count(*) AS dias
+                FROM (SELECT DISTINCT paciente_id, data FROM diario WHERE data BETWEEN %(inicio)s AND %(fim)s) k;
+                """,
+                {"inicio": inicio, "fim": fim_bloco}
+            )
+            total += cursor.fetchone()['dias']
+            # Resumos de dias que não têm mais registros
+            cursor.execute(
+                """
+                DELETE FROM diario_resumo r
+                WHERE r.data BETWEEN %(inicio)s AND %(fim)s
+                  AND NOT EXISTS (SELECT 1 FROM diario d WHERE d.paciente_id = r.paciente_id AND d.data = r.data);
+                """,
+                {"inicio": inicio, "fim": fim_bloco}
+            )
+        conn.commit()
+        if verbose:
+            print(f"Resumo recalculado de {inicio} a {fim_bloco} ({total} dias)")
+        inicio = fim_bloco + timedelta(days=1)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstrói o resumo diário do diário.")
+    parser.add_argument("--inicio", type=date.fromisoformat, help="Data inicial (AAAA-MM-DD).")
+    parser.add_argument("--fim", type=date.fromisoformat, help="Data final (AAAA-MM-DD).")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        total = rebuild_summaries(conn, args.inicio, args.fim)
+        print(f"Reconstrução concluída: {total} dias.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro ao reconstruir o resumo: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
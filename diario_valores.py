@@ -0,0 +1,156 @@
+import re
+from datetime import time
+
+
+def _text(valor):
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _number(valor):
+    """
+    Extrai o primeiro número de um texto livre ("36,5", "200 ml", "95%").
+    """
+    match = re.search(r"-?\d+(?:[.,]\d+)?", str(valor))
+    if not match:
+        return None
+    numero = float(match.group(0).replace(",", "."))
+    return int(numero) if numero.is_integer() else numero
+
+
+def _time(valor):
+    """
+    Normaliza um horário para "HH:MM:SS".
+    """
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M:%S")
+    match = re.match(r"^\s*(\d{1,2}):(\d{2})(?::(\d{2}))?", str(valor))
+    if not match:
+        return None
+    hora, minuto, segundo = (int(g or 0) for g in match.groups())
+    if hora > 23 or minuto > 59 or segundo > 59:
+        return None
+    return f"{hora:02d}:{minuto:02d}:{segundo:02d}"
+
+
+def _pressure(valor):
+    """
+    Separa a pressão arterial "120/80" em sistólica e diastólica.
+    """
+    match = re.search(r"(\d+)\s*[/xX]\s*(\d+)", str(valor))
+    if not match:
+        return {"pa_sistolica": None, "pa_diastolica": None}
+    return {"pa_sistolica": int(match.group(1)), "pa_diastolica": int(match.group(2))}
+
+
+# Campos de cada tipo de registro do diário, na ordem em que aparecem em `detalhes`:
+# (rótulo no texto, chave em `valores`, conversor). Chave None mescla um dicionário.
+CAMPOS_POR_TIPO = {
+    "Fisiologia": [
+        ("Subtipo", "subtipo", _text),
+        ("Quantidade", "quantidade", _number),
+        ("Hora", "hora", _time),
+    ],
+    "Sinais Vitais": [
+        ("O2", "o2", _number),
+        ("PA", None, _pressure),
+        ("HR", "fc", _number),
+        ("TEMP", "temperatura", _number),
+        ("GLIC", "glicemia", _number),
+    ],
+    "Ocorrência": [
+        ("Subtipo", "subtipo", _text),
+        ("Hora Inicial", "hora_inicial", _time),
+        ("Hora Final", "hora_final", _time),
+        ("Intensidade", "intensidade", _number),
+        ("Observação", "observacao", _text),
+    ],
+    "Alimentação": [
+        ("Refeição", "refeicao", _text),
+        ("Hora Inicial", "hora_inicial", _time),
+        ("Hora Final", "hora_final", _time),
+        ("Quantidade", "quantidade", _text),
+        ("Observação", "observacao", _text),
+    ],
+    "Líquidos": [
+        ("Líquido", "liquido", _text),
+        ("Hora Inicial", "hora_inicial", _time),
+        ("Hora Final", "hora_final", _time),
+        ("Quantidade", "quantidade_ml", _number),
+        ("Observação", "observacao", _text),
+    ],
+}
+
+
+# Sinais vitais gravados em diario.valores: chave -> rótulo
+VITAIS = {
+    "o2": "O2 (%)",
+    "pa_sistolica": "PA sistólica (mmHg)",
+    "pa_diastolica": "PA diastólica (mmHg)",
+    "fc": "Frequência cardíaca (bpm)",
+    "temperatura": "Temperatura (°C)",
+    "glicemia": "Glicemia (mg/dL)",
+}
+
+
+def format_detalhes(campos):
+    """
+    Monta o texto de `detalhes` a partir de {rótulo: valor}, na ordem do dicionário.
+    """
+    return ", ".join(f"{rotulo}: {valor}" for rotulo, valor in campos.items())
+
+
+def typed_values(tipo, campos):
+    """
+    Converte {rótulo: valor} nos valores tipados gravados na coluna `valores`.
+    """
+    valores = {}
+    for rotulo, chave, conversor in CAMPOS_POR_TIPO.get(tipo, []):
+        if rotulo not in campos:
+            continue
+        convertido = conversor(campos[rotulo])
+        if chave is None:
+            valores.update(convertido)
+        else:
+            valores[chave] = convertido
+    return valores
+
+
+def split_detalhes(tipo, detalhes):
+    """
+    Separa um texto de `detalhes` gravado pelo formulário em {rótulo: texto}.
+
+    Os rótulos são procurados na ordem do tipo; rótulos ausentes (ex.:
+    Intensidade fora de "Dor") são ignorados, e o valor de cada campo vai
+    até o próximo rótulo presente, mesmo que contenha vírgulas.
+    """
+    detalhes = detalhes or ""
+    rotulos = [rotulo for rotulo, _, _ in CAMPOS_POR_TIPO.get(tipo, [])]
+
+    # Posição de início de cada rótulo presente
+    encontrados = []
+    posicao = 0
+    for rotulo in rotulos:
+        marcador = f"{rotulo}: "
+        if not encontrados and detalhes.startswith(marcador):
+            inicio = 0
+        else:
+            inicio = detalhes.find(f", {marcador}", posicao)
+            if inicio < 0:
+                continue
+            inicio += 2
+        encontrados.append((rotulo, inicio, inicio + len(marcador)))
+        posicao = inicio + len(marcador)
+
+    campos = {}
+    for i, (rotulo, _, inicio_valor) in enumerate(encontrados):
+        fim = encontrados[i + 1][1] - 2 if i + 1 < len(encontrados) else len(detalhes)
+        campos[rotulo] = detalhes[inicio_valor:fim]
+    return campos
+
+
+def parse_detalhes(tipo, detalhes):
+    """
+    Converte um texto de `detalhes` em valores tipados.
+    """
+    return typed_values(tipo, split_detalhes(tipo, detalhes))
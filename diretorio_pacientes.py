@@ -0,0 +1,188 @@
+"""
+Diretório de pacientes em memória, compartilhado pelos seletores de paciente.
+
+Os nomes são normalizados (sem acentos, minúsculos) e guardados em listas
+ordenadas: uma com o nome completo e outra com cada palavra do nome. Uma busca
+por prefixo é uma busca binária nessas listas, e só os `k` primeiros
+resultados vão para o widget, em vez da lista inteira de pacientes.
+
+O índice é reconstruído quando a tag ("pacientes",) do cache é invalidada (as
+gravações de pacientes já fazem isso) ou após CACHE_TTL, para refletir
+gravações de outros processos.
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+import streamlit as st
+
+from cache import CACHE_TTL, query_cache
+from db import READ_YOUR_WRITES_WINDOW, read_connection
+
+
+TOP_K = 20
+_TAGS = [("pacientes",)]
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+# Maior caractere possível: limite superior de um intervalo de prefixo
+_FIM = "\U0010ffff"
+
+
+def fold(texto):
+    """
+    Normaliza um nome para busca: sem acentos, minúsculo e só com letras e dígitos.
+    """
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(_SEPARADORES.split(sem_acentos.casefold())).strip()
+
+
+class PatientDirectory:
+    """
+    Índice imutável de (id, nome) com busca por prefixo do nome ou de qualquer palavra dele.
+    """
+
+    def __init__(self, pacientes, versao=None):
+        ordenados = sorted((fold(nome), pid, nome) for pid, nome in pacientes)
+        self.chaves = [chave for chave, _, _ in ordenados]
+        self.ids = [pid for _, pid, _ in ordenados]
+        self.nomes = {pid: nome for _, pid, nome in ordenados}
+        self.palavras_por_posicao = [chave.split() for chave in self.chaves]
+
+        palavras = sorted(
+            (palavra, posicao)
+            for posicao, chave in enumerate(self.chaves)
+            for palavra in set(chave.split())
+        )
+        self.palavras = [palavra for palavra, _ in palavras]
+        self.posicoes = [posicao for _, posicao in palavras]
+
+        self.versao = versao
+        self.construido_em = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def label(self, paciente_id):
+        return f"{paciente_id} - {self.nomes.get(paciente_id, '?')}"
+
+    def _range(self, lista, prefixo):
+        return bisect.bisect_left(lista, prefixo), bisect.bisect_left(lista, prefixo + _FIM)
+
+    def search(self, busca, k=TOP_K):
+        """
+        IDs dos até `k` pacientes que casam com a busca, nesta ordem:
+        código exato, nome começando pela busca, e nomes em que cada palavra
+        da busca é prefixo de alguma palavra do nome.
+        """
+        consulta = fold(busca)
+        if not consulta:
+            return self.ids[:k]
+
+        resultado = []
+        vistos = set()
+
+        def adicionar(pid):
+            if pid not in vistos:
+                vistos.add(pid)
+                resultado.append(pid)
+            return len(resultado) >= k
+
+        if consulta.isdigit() and int(consulta) in self.nomes:
+            if adicionar(int(consulta)):
+                return resultado
+
+        inicio, fim = self._range(self.chaves, consulta)
+        for posicao in range(inicio, fim):
+            if adicionar(self.ids[posicao]):
+                return resultado
+
+        termos = consulta.split()
+        # A palavra mais longa da busca é a mais seletiva
+        guia = max(termos, key=len)
+        outros = [t for t in termos if t is not guia]
+        inicio, fim = self._range(self.palavras, guia)
+        for i in range(inicio, fim):
+            posicao = self.posicoes[i]
+            palavras = self.palavras_por_posicao[posicao]
+            if all(any(p.startswith(t) for p in palavras) for t in outros):
+                if adicionar(self.ids[posicao]):
+                    break
+        return resultado
+
+
+_diretorio = None
+_diretorio_lock = threading.Lock()
+
+
+def _load(versao):
+    # Logo depois de um cadastro, lê do primário para o novo paciente aparecer
+    with read_connection(primario=query_cache.recently_invalidated(_TAGS, READ_YOUR_WRITES_WINDOW)) as conn:
+        if not conn:
+            return None
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, nome FROM pacientes;")
+            return PatientDirectory([(r['id'], r['nome']) for r in cursor.fetchall()], versao)
+
+
+def get_directory():
+    """
+    Diretório atual, reconstruído se os pacientes mudaram ou se ele expirou.
+    """
+    global _diretorio
+    versao = query_cache.versions(_TAGS)
+    diretorio = _diretorio
+    if diretorio is not None and diretorio.versao == versao \
+            and time.monotonic() - diretorio.construido_em < CACHE_TTL:
+        return diretorio
+
+    with _diretorio_lock:
+        diretorio = _diretorio
+        versao = query_cache.versions(_TAGS)
+        if diretorio is None or diretorio.versao != versao \
+                or time.monotonic() - diretorio.construido_em >= CACHE_TTL:
+            try:
+                novo = _load(versao)
+            except Exception as e:
+                st.error(f"Erro ao carregar pacientes: {e}")
+                novo = None
+            if novo is not None:
+                _diretorio = diretorio = novo
+    return diretorio or PatientDirectory([])
+
+
+def patient_selector(key, label="Selecione o Paciente", k=TOP_K):
+    """
+    Campo de busca e seletor de paciente; só os `k` melhores resultados vão
+    para o widget. Retorna o ID do paciente escolhido ou None.
+    """
+    diretorio = get_directory()
+    if not diretorio:
+        st.warning("Nenhum paciente cadastrado.")
+        return None
+
+    busca = st.text_input("Buscar paciente", key=f"{key}_busca", placeholder="Nome ou código")
+    ids = diretorio.search(busca, k)
+    if not ids:
+        st.info("Nenhum paciente encontrado para a busca.")
+        return None
+    return st.selectbox(label, ids, format_func=diretorio.label, key=key)
+
+
+def patient_multiselect(key, padrao=(), label="Pacientes", k=TOP_K):
+    """
+    Seleção de vários pacientes com busca. A escolha fica na sessão, então
+    buscar outros nomes não desfaz a seleção já feita.
+    """
+    diretorio = get_directory()
+    chave_selecao = f"{key}_selecionados"
+    if chave_selecao not in st.session_state:
+        st.session_state[chave_selecao] = list(padrao)
+    selecionados = [pid for pid in st.session_state[chave_selecao] if pid in diretorio.nomes]
+
+    busca = st.text_input("Buscar paciente", key=f"{key}_busca", placeholder="Nome ou código")
+    opcoes = selecionados + [pid for pid in diretorio.search(busca, k) if pid not in selecionados]
+    selecionados = st.multiselect(label, opcoes, default=selecionados, format_func=diretorio.label)
+    st.session_state[chave_selecao] = selecionados
+    return selecionados
@@ -0,0 +1,261 @@
+"""
+Verifica, com EXPLAIN, que as consultas de leitura das páginas usam índices.
+
+Cria um schema temporário, aplica as migrações, gera uma massa de dados
+sintética e executa cada função de busca das páginas com uma conexão que
+troca a consulta pelo seu plano de execução. Falha (código de saída 1) se
+algum plano fizer Seq Scan em uma das tabelas grandes.
+
+    python explain_check.py --pacientes 20000
+"""
+import argparse
+import hashlib
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from db import get_connection
+from migrate import migrate
+from particoes import ensure_partitions
+
+
+CHECK_SCHEMA = "medtrack_explain_check"
+LARGE_TABLES = ("pacientes", "medicamentos", "diario", "doses_tomadas", "adesao_diaria", "diario_resumo",
+               "agenda_doses")
+
+SYNTHETIC_DATA = [
+    """
+    INSERT INTO pacientes (nome, idade, sexo, altura, peso)
+    SELECT 'Paciente ' || md5(g::text), 20 + g %% 80,
+           (ARRAY['Masculino', 'Feminino', 'Outro'])[1 + g %% 3], 150 + g %% 40, 50 + g %% 60
+    FROM generate_series(1, %(pacientes)s) g;
+    """,
+    """
+    INSERT INTO medicamentos (paciente_id, nome, frequencia, categoria, observacoes)
+    SELECT p.id, 'Medicamento ' || m, 1 + (p.id + m) %% 4, 'Categoria ' || m %% 3, ''
+    FROM pacientes p CROSS JOIN generate_series(1, 5) m;
+    """,
+    """
+    INSERT INTO diario (paciente_id, data, hora, tipo, detalhes)
+    SELECT p.id, current_date - d, time '06:00' + e * interval '4 hours', 'Sinais Vitais',
+           'O2: 96, PA: 120/80, HR: 72, TEMP: 36.5, GLIC: 100'
+    FROM pacientes p, generate_series(0, %(dias)s - 1) d, generate_series(0, 2) e;
+    """,
+    """
+    INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora)
+    SELECT m.paciente_id, m.id, 1, current_date - d + time '08:00'
+    FROM medicamentos m, generate_series(0, %(dias)s - 1) d;
+    """,
+    """
+    INSERT INTO adesao_diaria (medicamento_id, data, paciente_id, esperadas, tomadas)
+    SELECT m.id, current_date - d, m.paciente_id, m.frequencia, 1
+    FROM medicamentos m, generate_series(0, %(dias)s - 1) d;
+    """,
+    """
+    SELECT agenda_doses_gerar(current_date - 1, current_date + 7);
+    """,
+]
+
+
+def _name_fragment(n):
+    """
+    Trecho do nome do n-ésimo paciente sintético, para buscas seletivas.
+    """
+    return hashlib.md5(str(n).encode()).hexdigest()[3:9]
+
+
+def read_checks():
+    """
+    Leituras feitas pelas páginas, com argumentos e se um Seq Scan é esperado.
+
+    A visão de adesão da ala lê todos os pacientes por definição.
+    """
+    import adesao
+    import agenda
+    import busca
+    import cadastro_paciente
+    import diario_resumo
+    import resumo_paciente
+    import tendencias
+
+    hoje = date.today()
+    agora = datetime.now().replace(second=0, microsecond=0)
+    snapshot = resumo_paciente.fetch_patient_snapshot
+    return [
+        ("cadastro_paciente.fetch_patients_page", cadastro_paciente.fetch_patients_page, ("", None, 25), False),
+        ("cadastro_paciente.fetch_patients_page (busca)", cadastro_paciente.fetch_patients_page, (_name_fragment(42), None, 25), False),
+        ("cadastro_paciente.fetch_patients_page (página seguinte)", cadastro_paciente.fetch_patients_page, ("", ("Paciente 8", 1), 25), False),
+        ("resumo_paciente.fetch_patient_snapshot (grade de medicamentos)", snapshot,
+         (42, hoje, 1, ("medicamentos",)), False),
+        ("resumo_paciente.fetch_patient_snapshot (painel de doses)", snapshot,
+         (42, hoje, 1, ("medicamentos", "doses")), False),
+        ("resumo_paciente.fetch_patient_snapshot (diário do dia)", snapshot,
+         (42, hoje, 1, ("diario", "resumo_dia")), False),
+        ("resumo_paciente.fetch_patient_snapshot (30 dias)", snapshot, (42, hoje, 30), False),
+        ("diario_resumo.fetch_daily_summaries", diario_resumo.fetch_daily_summaries, (42, hoje - timedelta(days=30), hoje), False),
+        ("tendencias.fetch_daily_summary", tendencias.fetch_daily_summary, (42, hoje - timedelta(days=30), hoje), False),
+        ("adesao.fetch_ward_adherence", adesao.fetch_ward_adherence, (hoje - timedelta(days=6), hoje), True),
+        ("adesao.fetch_patient_adherence", adesao.fetch_patient_adherence, (42, hoje - timedelta(days=6), hoje), False),
+        ("busca.search_diary", busca.search_diary, ("confusão ou queda", hoje - timedelta(days=29), hoje), False),
+        ("busca.search_diary (paciente e tipo)", busca.search_diary,
+         ("dor", hoje - timedelta(days=29), hoje, 42, ["Ocorrência"]), False),
+        ("busca.search_medications", busca.search_medications, ("medicamento",), False),
+        ("agenda.fetch_due_doses", agenda.fetch_due_doses, (agora - timedelta(hours=4), agora + timedelta(hours=1)), False),
+    ]
+
+
+class _ExplainCursor:
+    """
+    Cursor que executa EXPLAIN no lugar da consulta e guarda o plano.
+    """
+
+    def __init__(self, cursor, plans):
+        self._cursor = cursor
+        self._plans = plans
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, sql, params=None):
+        try:
+            self._cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        except Exception:
+            # Mantém a conexão utilizável para as próximas verificações
+            self._cursor.connection.rollback()
+            raise
+        self._plans.append((sql, self._cursor.fetchone()["QUERY PLAN"][0]["Plan"]))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+class _ExplainConnection:
+    def __init__(self, conn, plans):
+        self._conn = conn
+        self._plans = plans
+
+    def cursor(self, *args, **kwargs):
+        # O plano é lido como dicionário, qualquer que seja o cursor pedido (ex.: tuplas em tendencias)
+        return _ExplainCursor(self._conn.cursor(), self._plans)
+
+    def commit(self):
+        self._conn.rollback()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+def seq_scans(plan):
+    """
+    Lista as tabelas grandes lidas por Seq Scan em um plano (formato JSON).
+
+    As partições padrão ficam vazias depois de ensure_partitions, então ler uma
+    delas por Seq Scan não custa nada.
+    """
+    encontrados = []
+    if plan.get("Node Type") == "Seq Scan":
+        relacao = plan.get("Relation Name", "")
+        grande = any(relacao == t or relacao.startswith(t + "_") for t in LARGE_TABLES)
+        if grande and not relacao.endswith("_padrao"):
+            encontrados.append(relacao)
+    for filho in plan.get("Plans", []):
+        encontrados.extend(seq_scans(filho))
+    return encontrados
+
+
+def prepare_schema(conn, pacientes, dias):
+    """
+    Recria o schema de verificação, aplica as migrações e gera os dados sintéticos.
+    """
+    with conn.cursor() as cursor:
+        # Extensões ficam em public para sobreviver à remoção do schema de verificação
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public;")
+        cursor.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE;")
+        cursor.execute(f"CREATE SCHEMA {CHECK_SCHEMA};")
+        cursor.execute(f"SET search_path TO {CHECK_SCHEMA}, public;")
+    conn.commit()
+
+    migrate(conn, verbose=False)
+
+    with conn.cursor() as cursor:
+        for sql in SYNTHETIC_DATA:
+            cursor.execute(sql, {"pacientes": pacientes, "dias": dias})
+    conn.commit()
+    # Move os meses gerados da partição padrão para as partições mensais
+    ensure_partitions(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("ANALYZE;")
+    conn.commit()
+
+
+def run_checks(conn):
+    """
+    Executa cada função de leitura e retorna (descrição, consulta, tabelas com Seq Scan).
+    """
+    import cache
+
+    resultados = []
+    original_connection = cache.read_connection
+    try:
+        for descricao, funcao, args, permite_seq_scan in read_checks():
+            planos = []
+
+            @contextmanager
+            def explain_connection(primario=False):
+                yield _ExplainConnection(conn, planos)
+
+            cache.read_connection = explain_connection
+            cache.query_cache.clear()
+            funcao(*args)
+            if not planos:
+                resultados.append((descricao, None, ["consulta não executada"]))
+            for sql, plano in planos:
+                problemas = [] if permite_seq_scan else seq_scans(plano)
+                resultados.append((descricao, sql, problemas))
+    finally:
+        cache.read_connection = original_connection
+        cache.query_cache.clear()
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pacientes", type=int, default=20000, help="Quantidade de pacientes sintéticos.")
+    parser.add_argument("--dias", type=int, default=10, help="Dias de histórico por paciente.")
+    parser.add_argument("--manter", action="store_true", help="Não remove o schema de verificação ao final.")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        prepare_schema(conn, args.pacientes, args.dias)
+        resultados = run_checks(conn)
+    finally:
+        conn.rollback()
+        if not args.manter:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE;")
+            conn.commit()
+        conn.close()
+
+    falhas = 0
+    for descricao, sql, problemas in resultados:
+        if problemas:
+            falhas += 1
+            print(f"FALHA {descricao}: Seq Scan em {', '.join(problemas)}")
+            if sql:
+                print("    " + " ".join(sql.split()))
+        else:
+            print(f"ok    {descricao}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import argparse
+import csv
+import os
+import sys
+import uuid
+import zipfile
+from datetime import date, datetime
+from pathlib import Path
+
+import psycopg2.extensions
+import streamlit as st
+
+from db import read_connection
+from particoes import iter_archived
+from diretorio_pacientes import patient_multiselect
+
+
+EXPORT_DIR = Path(os.environ.get("MEDTRACK_EXPORT_DIR", "exportacoes"))
+CHUNK_SIZE = int(os.environ.get("MEDTRACK_EXPORT_CHUNK_SIZE", 10000))
+FORMATOS = ("parquet", "xlsx", "csv")
+XLSX_MAX_ROWS = 1_048_575  # Limite de linhas de uma planilha, descontado o cabeçalho
+
+# Conjuntos exportáveis: colunas (nome, tipo) e consulta.
+# {filtro} é substituído pelo filtro de pacientes e {periodo} pelo filtro de datas.
+# "arquivo" é a tabela cujas partições arquivadas em Parquet também são lidas.
+DATASETS = {
+    "pacientes": {
+        "colunas": [("id", "int"), ("nome", "str"), ("idade", "int"), ("sexo", "str"),
+                    ("altura", "float"), ("peso", "float")],
+        "sql": """
+            SELECT id, nome, idade, sexo, altura::float8, peso::float8
+            FROM pacientes p
+            WHERE {filtro}
+            ORDER BY id
+        """,
+        "coluna_paciente": "p.id",
+        "coluna_data": None,
+    },
+    "medicamentos": {
+        "colunas": [("id", "int"), ("paciente_id", "int"), ("paciente", "str"), ("nome", "str"),
+                    ("frequencia", "int"), ("categoria", "str"), ("observacoes", "str")],
+        "sql": """
+            SELECT m.id, m.paciente_id, p.nome, m.nome, m.frequencia, m.categoria, m.observacoes
+            FROM medicamentos m
+            JOIN pacientes p ON p.id = m.paciente_id
+            WHERE {filtro}
+            ORDER BY m.paciente_id, m.id
+        """,
+        "coluna_paciente": "m.paciente_id",
+        "coluna_data": None,
+    },
+    "diario": {
+        "colunas": [("paciente_id", "int"), ("paciente", "str"), ("data", "date"), ("hora", "time"),
+                    ("tipo", "str"), ("detalhes", "str"), ("valores", "str")],
+        "sql": """
+            SELECT d.paciente_id, p.nome, d.data, d.hora, d.tipo, d.detalhes, d.valores::text
+            FROM diario d
+            JOIN pacientes p ON p.id = d.paciente_id
+            WHERE {filtro} AND {periodo}
+            ORDER BY d.paciente_id, d.data, d.hora
+        """,
+        "coluna_paciente": "d.paciente_id",
+        "coluna_data": "d.data",
+        "arquivo": "diario",
+    },
+    "doses": {
+        "colunas": [("paciente_id", "int"), ("paciente", "str"), ("medicamento_id", "int"),
+                    ("medicamento", "str"), ("dose", "int"), ("data_hora", "datetime")],
+        "sql": """
+            SELECT t.paciente_id, p.nome, t.medicamento_id, m.nome, t.dose, t.data_hora
+            FROM doses_tomadas t
+            JOIN pacientes p ON p.id = t.paciente_id
+            JOIN medicamentos m ON m.id = t.medicamento_id
+            WHERE {filtro} AND {periodo}
+            ORDER BY t.paciente_id, t.data_hora
+        """,
+        "coluna_paciente": "t.paciente_id",
+        "coluna_data": "t.data_hora::date",
+        "arquivo": "doses_tomadas",
+    },
+}
+
+
+def _query(dataset, paciente_ids, inicio, fim):
+    """
+    Monta a consulta de um conjunto de dados com os filtros de pacientes e período.
+    """
+    definicao = DATASETS[dataset]
+    parametros = []
+    filtro = "TRUE"
+    if paciente_ids is not None:
+        filtro = f"{definicao['coluna_paciente']} = ANY(%s)"
+        parametros.append(list(paciente_ids))
+
+    periodo = "TRUE"
+    coluna_data = definicao["coluna_data"]
+    if coluna_data and inicio is not None:
+        periodo = f"{coluna_data} >= %s"
+        parametros.append(inicio)
+    if coluna_data and fim is not None:
+        periodo += f" AND {coluna_data} <= %s"
+        parametros.append(fim)
+    return definicao["sql"].format(filtro=filtro, periodo=periodo), parametros
+
+
+# Colunas de nome das exportações -> (tabela, coluna de id nos registros arquivados)
+_NOMES_ARQUIVO = {"paciente": ("pacientes", "paciente_id"), "medicamento": ("medicamentos", "medicamento_id")}
+
+
+def _archived_chunks(dataset, paciente_ids, inicio, fim, tamanho_bloco):
+    """
+    Blocos de tuplas lidos das partições arquivadas, no mesmo formato da consulta.
+
+    Os nomes de pacientes e medicamentos vêm do banco; como na consulta, que usa
+    JOIN, registros de pacientes ou medicamentos removidos ficam de fora.
+    """
+    colunas = [nome for nome, _ in DATASETS[dataset]["colunas"]]
+    ligacoes = {c: _NOMES_ARQUIVO[c] for c in colunas if c in _NOMES_ARQUIVO}
+    lidas = [c for c in colunas if c not in ligacoes]
+    lidas += [coluna_id for _, coluna_id in ligacoes.values() if coluna_id not in lidas]
+    for lote in iter_archived(DATASETS[dataset]["arquivo"], paciente_ids, inicio, fim, lidas, tamanho_bloco):
+        registros = lote.to_pylist()
+        nomes = {}
+        with read_connection() as conn:
+            if not conn:
+                raise psycopg2.OperationalError("Não foi possível conectar ao banco de dados.")
+            with conn.cursor() as cursor:
+                for coluna, (tabela, coluna_id) in ligacoes.items():
+                    cursor.execute(
+                        f"SELECT id, nome FROM {tabela} WHERE id = ANY(%s);",
+                        (list({r[coluna_id] for r in registros}),)
+                    )
+                    nomes[coluna] = {r['id']: r['nome'] for r in cursor.fetchall()}
+        bloco = [
+            tuple(nomes[c].get(r[ligacoes[c][1]]) if c in ligacoes else r[c] for c in colunas)
+            for r in registros
+            if all(r[coluna_id] in nomes[c] for c, (_, coluna_id) in ligacoes.items())
+        ]
+        if bloco:
+            yield bloco
+
+
+def iter_chunks(dataset, paciente_ids=None, inicio=None, fim=None, tamanho_bloco=CHUNK_SIZE):
+    """
+    Lê um conjunto de dados em blocos de tuplas por meio de um cursor no servidor.
+
+    Apenas um bloco fica em memória por vez, qualquer que seja o total de linhas.
+    Para diário e doses, os meses já arquivados em Parquet são lidos em seguida.
+    """
+    sql, parametros = _query(dataset, paciente_ids, inicio, fim)
+    # Exportações são as leituras mais pesadas: vão para uma réplica, se houver
+    with read_connection() as conn:
+        if not conn:
+            raise psycopg2.OperationalError("Não foi possível conectar ao banco de dados.")
+        with conn.cursor(name=f"exportacao_{uuid.uuid4().hex}",
+                         cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.itersize = tamanho_bloco
+            cursor.execute(sql, parametros)
+            while True:
+                bloco = cursor.fetchmany(tamanho_bloco)
+                if not bloco:
+                    break
+                yield bloco
+    if DATASETS[dataset].get("arquivo"):
+        yield from _archived_chunks(dataset, paciente_ids, inicio, fim, tamanho_bloco)
+
+
+def _arrow_schema(dataset):
+    import pyarrow as pa
+
+    tipos = {
+        "int": pa.int64(), "str": pa.string(), "float": pa.float64(),
+        "date": pa.date32(), "time": pa.time64("us"), "datetime": pa.timestamp("us"),
+    }
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo in DATASETS[dataset]["colunas"]])
+
+
+def write_parquet(caminho, dataset, blocos):
+    """
+    Grava os blocos em um arquivo Parquet, um row group por bloco.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(dataset)
+    total = 0
+    with pq.ParquetWriter(caminho, schema, compression="zstd") as writer:
+        for bloco in blocos:
+            colunas = list(zip(*bloco))
+            writer.write_batch(pa.record_batch(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, schema)],
+                schema=schema
+            ))
+            total += len(bloco)
+    return total
+
+
+def write_csv(caminho, dataset, blocos):
+    """
+    Grava os blocos em um arquivo CSV (UTF-8 com BOM, para abrir corretamente no Excel).
+    """
+    total = 0
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as arquivo:
+        writer = csv.writer(arquivo)
+        writer.writerow([nome for nome, _ in DATASETS[dataset]["colunas"]])
+        for bloco in blocos:
+            writer.writerows(bloco)
+            total += len(bloco)
+    return total
+
+
+def write_xlsx_sheets(workbook, dataset, blocos):
+    """
+    Acrescenta os blocos a uma pasta de trabalho em modo write-only,
+    abrindo novas planilhas quando o limite de linhas é atingido.
+    """
+    cabecalho = [nome for nome, _ in DATASETS[dataset]["colunas"]]
+    planilha, linhas, parte, total = None, 0, 0, 0
+    for bloco in blocos:
+        for linha in bloco:
+            if planilha is None or linhas >= XLSX_MAX_ROWS:
+                parte += 1
+                planilha = workbook.create_sheet(dataset if parte == 1 else f"{dataset}_{parte}")
+                planilha.append(cabecalho)
+                linhas = 0
+            planilha.append(linha)
+            linhas += 1
+        total += len(bloco)
+    if planilha is None:
+        workbook.create_sheet(dataset).append(cabecalho)
+    return total
+
+
+def export_data(formato, datasets, paciente_ids=None, inicio=None, fim=None,
+                destino=EXPORT_DIR, tamanho_bloco=CHUNK_SIZE):
+    """
+    Exporta os conjuntos de dados pedidos e devolve (arquivo gerado, linhas por conjunto).
+
+    Parquet e CSV geram um arquivo por conjunto, reunidos em um .zip quando há
+    mais de um; XLSX gera uma pasta de trabalho com uma planilha por conjunto.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    prefixo = f"medtrack_{datetime.now():%Y%m%d_%H%M%S}"
+    linhas = {}
+
+    if formato == "xlsx":
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        for dataset in datasets:
+            linhas[dataset] = write_xlsx_sheets(
+                workbook, dataset, iter_chunks(dataset, paciente_ids, inicio, fim, tamanho_bloco)
+            )
+        caminho = destino / f"{prefixo}.xlsx"
+        workbook.save(caminho)
+        return caminho, linhas
+
+    escrever = write_parquet if formato == "parquet" else write_csv
+    arquivos = []
+    for dataset in datasets:
+        caminho = destino / f"{prefixo}_{dataset}.{formato}"
+        linhas[dataset] = escrever(caminho, dataset, iter_chunks(dataset, paciente_ids, inicio, fim, tamanho_bloco))
+        arquivos.append(caminho)
+
+    if len(arquivos) == 1:
+        return arquivos[0], linhas
+    pacote = destino / f"{prefixo}_{formato}.zip"
+    with zipfile.ZipFile(pacote, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for arquivo in arquivos:
+            zip_file.write(arquivo, arquivo.name)
+            arquivo.unlink()
+    return pacote, linhas
+
+
+def render_export(paciente_id):
+    """
+    Seção de exportação da página de visualização.
+    """
+    abrangencia = st.radio(
+        "Abrangência", ["Paciente selecionado", "Lista de pacientes", "Ala inteira"],
+        horizontal=True, key="exportacao_abrangencia"
+    )
+    paciente_ids = [paciente_id]
+    if abrangencia == "Lista de pacientes":
+        paciente_ids = patient_multiselect("exportacao_pacientes", padrao=[paciente_id])
+    elif abrangencia == "Ala inteira":
+        paciente_ids = None
+
+    col_formato, col_dados = st.columns([0.3, 0.7])
+    with col_formato:
+        formato = st.selectbox("Formato", FORMATOS, key="exportacao_formato")
+    with col_dados:
+        datasets = st.multiselect("Dados", list(DATASETS), default=["diario"], key="exportacao_dados")
+    periodo = st.date_input("Período (diário e doses)", value=(), key="exportacao_periodo")
+    inicio, fim = (periodo[0], periodo[-1]) if periodo else (None, None)
+
+    if st.button("Gerar Arquivo", key="exportacao_gerar"):
+        if not datasets or paciente_ids == []:
+            st.error("Selecione ao menos um paciente e um conjunto de dados.")
+            return
+        try:
+            with st.spinner("Exportando..."):
+                caminho, linhas = export_data(formato, datasets, paciente_ids, inicio, fim)
+        except Exception as e:
+            st.error(f"Erro ao exportar dados: {e}")
+            return
+        st.success(
+            "Exportação concluída: " + ", ".join(f"{d} ({n} linhas)" for d, n in linhas.items())
+            + f". Arquivo salvo em {caminho}."
+        )
+        st.session_state["exportacao_arquivo"] = str(caminho)
+
+    arquivo = st.session_state.get("exportacao_arquivo")
+    if arquivo and Path(arquivo).exists():
+        with open(arquivo, "rb") as dados:
+            st.download_button("Baixar Arquivo", dados, file_name=Path(arquivo).name, key="exportacao_baixar")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta dados do MedTrack em Parquet, XLSX ou CSV.")
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet")
+    parser.add_argument("--dados", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--pacientes", nargs="+", type=int, help="IDs dos pacientes (padrão: ala inteira).")
+    parser.add_argument("--inicio", type=date.fromisoformat, help="Data inicial (AAAA-MM-DD).")
+    parser.add_argument("--fim", type=date.fromisoformat, help="Data final (AAAA-MM-DD).")
+    parser.add_argument("--saida", type=Path, default=EXPORT_DIR, help="Diretório de destino.")
+    parser.add_argument("--bloco", type=int, default=CHUNK_SIZE, help="Linhas lidas por bloco.")
+    args = parser.parse_args(argv)
+
+    try:
+        caminho, linhas = export_data(args.formato, args.dados, args.pacientes, args.inicio, args.fim,
+                                      args.saida, args.bloco)
+    except Exception as e:
+        print(f"Erro ao exportar dados: {e}")
+        return 1
+    for dataset, total in linhas.items():
+        print(f"{dataset}: {total} linhas")
+    print(f"Arquivo gerado: {caminho}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+Fila local de escritas (write-behind) do diário e das doses confirmadas.
+
+Com MEDTRACK_ESCRITA_ADIADA=1, save_diary_entry e register_dose(s) gravam a
+escrita em um arquivo SQLite local (modo WAL, synchronous=FULL) e respondem na
+hora, mesmo com o Postgres lento ou fora do ar. Uma thread por processo envia
+a fila ao Postgres em lotes de até TAMANHO_LOTE escritas, cada lote em uma
+transação.
+
+Cada escrita tem uma chave de idempotência, registrada em escritas_aplicadas
+(migração 0010) na mesma transação dos dados: reenviar um lote depois de uma
+falha entre o COMMIT e a remoção da fila, ou um lote já enviado por outro
+processo que usa o mesmo arquivo, não duplica linhas. Escritas recusadas pelo
+banco (por exemplo, de um paciente removido) vão para a tabela `rejeitadas`
+do arquivo, em vez de travar a fila.
+
+    python fila_escritas.py            # envia toda a fila pendente e sai
+    python fila_escritas.py --status   # profundidade, atraso e rejeitadas
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import date, datetime
+from datetime import time as dtime
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from cache import invalidate
+from db import connection
+
+
+ESCRITA_ADIADA = os.environ.get("MEDTRACK_ESCRITA_ADIADA", "0") == "1"
+FILA_ARQUIVO = Path(os.environ.get("MEDTRACK_FILA_ARQUIVO", "fila_escritas.sqlite3"))
+TAMANHO_LOTE = int(os.environ.get("MEDTRACK_FILA_LOTE", 200))
+# Verificação periódica da fila, para escritas deixadas por outros processos
+FILA_INTERVALO = float(os.environ.get("MEDTRACK_FILA_INTERVALO", 5.0))
+# Espera entre tentativas com o banco indisponível; dobra a cada falha até o máximo
+ESPERA_MINIMA = 1.0
+ESPERA_MAXIMA = 60.0
+# Chaves aplicadas mantidas no Postgres; bem acima do tempo que uma escrita fica na fila
+DIAS_CHAVES = int(os.environ.get("MEDTRACK_FILA_DIAS_CHAVES", 30))
+
+# Erros do próprio dado: a escrita vai para `rejeitadas`; os demais são tentados de novo
+_RECUSAS = (psycopg2.IntegrityError, psycopg2.DataError)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS fila (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    paciente_id INTEGER NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    ultimo_erro TEXT
+);
+CREATE INDEX IF NOT EXISTS fila_paciente_idx ON fila (paciente_id, tipo);
+CREATE TABLE IF NOT EXISTS rejeitadas (
+    chave TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    paciente_id INTEGER NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    rejeitado_em REAL NOT NULL,
+    erro TEXT
+);
+"""
+
+_esquema_criado = False
+_esquema_lock = threading.Lock()
+
+
+def _open():
+    """
+    Abre o arquivo da fila, criando as tabelas no primeiro uso do processo.
+    """
+    global _esquema_criado
+    conn = sqlite3.connect(FILA_ARQUIVO, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    # Cada escrita confirmada à página já está no disco
+    conn.execute("PRAGMA synchronous = FULL;")
+    if not _esquema_criado:
+        with _esquema_lock:
+            conn.executescript(_ESQUEMA)
+            _esquema_criado = True
+    return conn
+
+
+def _json_default(valor):
+    if isinstance(valor, (datetime, date, dtime)):
+        return valor.isoformat()
+    raise TypeError(f"Valor não serializável: {valor!r}")
+
+
+class _Estado:
+    """
+    Contadores do envio neste processo.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enviadas = 0
+        self.rejeitadas = 0
+        self.falhas = 0
+        self.ultimo_envio = None
+        self.ultimo_erro = None
+
+
+_estado = _Estado()
+
+
+def enqueue(tipo, paciente_id, dados):
+    """
+    Grava uma escrita na fila local e acorda o envio. Retorna a chave de idempotência.
+    """
+    chave = str(uuid.uuid4())
+    with closing(_open()) as fila:
+        fila.execute(
+            "INSERT INTO fila (chave, tipo, paciente_id, dados, criado_em) VALUES (?, ?, ?, ?, ?);",
+            (chave, tipo, paciente_id, json.dumps(dados, default=_json_default), time.time())
+        )
+        fila.commit()
+    start_worker()
+    _acordar.set()
+    return chave
+
+
+def pending(paciente_id, tipo):
+    """
+    Dados das escritas do paciente ainda na fila, na ordem de gravação.
+    """
+    with closing(_open()) as fila:
+        linhas = fila.execute(
+            "SELECT dados FROM fila WHERE paciente_id = ? AND tipo = ? ORDER BY seq;", (paciente_id, tipo)
+        ).fetchall()
+    return [json.loads(dados) for dados, in linhas]
+
+
+def pending_doses(paciente_id, data):
+    """
+    Doses do paciente no dia ainda na fila: {(medicamento_id, dose): data_hora}.
+    """
+    doses = {}
+    for escrita in pending(paciente_id, "doses"):
+        for medicamento_id, dose, data_hora in escrita["doses"]:
+            data_hora = datetime.fromisoformat(data_hora)
+            if data_hora.date() == data:
+                doses.setdefault((medicamento_id, dose), data_hora)
+    return doses
+
+
+def pending_diary(paciente_id, data):
+    """
+    Registros do diário do paciente no dia ainda na fila.
+    """
+    return [e for e in pending(paciente_id, "diario") if e["data"] == data.isoformat()]
+
+
+def _send(conn, escritas):
+    """
+    Aplica, em uma transação, as escritas cujas chaves ainda não foram aplicadas.
+    """
+    with conn.cursor() as cursor:
+        novas = execute_values(
+            cursor,
+            "INSERT INTO escritas_aplicadas (chave) VALUES %s ON CONFLICT DO NOTHING RETURNING chave::text;",
+            [(e["chave"],) for e in escritas],
+            template="(%s::uuid)",
+            fetch=True
+        )
+        novas = {r["chave"] for r in novas}
+
+        diario, doses = [], []
+        for e in escritas:
+            if e["chave"] not in novas:
+                continue  # Já aplicada por um envio anterior
+            dados = e["dados"]
+            if e["tipo"] == "diario":
+                diario.append((e["paciente_id"], dados["data"], dados["hora"], dados["tipo"],
+                               dados["detalhes"], Json(dados["valores"])))
+            else:
+                doses.extend((e["paciente_id"], medicamento_id, dose, data_hora)
+                             for medicamento_id, dose, data_hora in dados["doses"])
+
+        if diario:
+            execute_values(
+                cursor,
+                "INSERT INTO diario (paciente_id, data, hora, tipo, detalhes, valores) VALUES %s;",
+                diario,
+                template="(%s, %s::date, %s::time, %s, %s, %s)"
+            )
+        if doses:
+            execute_values(
+                cursor,
+                "INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora) VALUES %s;",
+                doses,
+                template="(%s, %s, %s, %s::timestamp)"
+            )
+    conn.commit()
+
+
+def _tags(escritas):
+    tags = set()
+    for e in escritas:
+        if e["tipo"] == "diario":
+            tags.update({("diario", e["paciente_id"]), ("busca",)})
+        else:
+            tags.update({("doses", e["paciente_id"]), ("agenda",)})
+    return tags
+
+
+def drain(limite=TAMANHO_LOTE):
+    """
+    Envia ao Postgres as `limite` escritas mais antigas da fila. Retorna
+    quantas saíram da fila (enviadas ou rejeitadas); levanta a exceção se o
+    banco estiver indisponível, deixando o lote na fila.
+    """
+    with closing(_open()) as fila:
+        linhas = fila.execute(
+            "SELECT seq, chave, tipo, paciente_id, dados, criado_em FROM fila ORDER BY seq LIMIT ?;", (limite,)
+        ).fetchall()
+    if not linhas:
+        return 0
+    escritas = [
+        {"seq": seq, "chave": chave, "tipo": tipo, "paciente_id": paciente_id,
+         "dados": json.loads(dados), "criado_em": criado_em, "texto": dados}
+        for seq, chave, tipo, paciente_id, dados, criado_em in linhas
+    ]
+
+    recusadas = []
+    try:
+        with connection() as conn:
+            if conn is None:
+                raise ConnectionError("Banco de dados indisponível.")
+            try:
+                _send(conn, escritas)
+            except _RECUSAS:
+                conn.rollback()
+                # Uma escrita inválida derruba o lote: envia uma a uma e separa as recusadas
+                for escrita in escritas:
+                    try:
+                        _send(conn, [escrita])
+                    except _RECUSAS as e:
+                        conn.rollback()
+                        recusadas.append((escrita, str(e).strip()))
+    except Exception as e:
+        with closing(_open()) as fila:
+            fila.executemany(
+                "UPDATE fila SET tentativas = tentativas + 1, ultimo_erro = ? WHERE seq = ?;",
+                [(str(e).strip(), escrita["seq"]) for escrita in escritas]
+            )
+            fila.commit()
+        with _estado.lock:
+            _estado.falhas += 1
+            _estado.ultimo_erro = str(e).strip()
+        raise
+
+    agora = time.time()
+    with closing(_open()) as fila:
+        fila.executemany(
+            "INSERT OR REPLACE INTO rejeitadas (chave, tipo, paciente_id, dados, criado_em, rejeitado_em, erro) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            [(e["chave"], e["tipo"], e["paciente_id"], e["texto"], e["criado_em"], agora, erro)
+             for e, erro in recusadas]
+        )
+        fila.executemany("DELETE FROM fila WHERE seq = ?;", [(e["seq"],) for e in escritas])
+        fila.commit()
+
+    invalidate(*_tags(escritas))
+    with _estado.lock:
+        _estado.enviadas += len(escritas) - len(recusadas)
+        _estado.rejeitadas += len(recusadas)
+        _estado.ultimo_envio = datetime.now()
+    for escrita, erro in recusadas:
+        print(f"Escrita {escrita['chave']} ({escrita['tipo']}, paciente {escrita['paciente_id']}) rejeitada: {erro}")
+    return len(escritas)
+
+
+def prune_keys(dias=DIAS_CHAVES):
+    """
+    Remove as chaves de idempotência aplicadas há mais de `dias` dias.
+    """
+    with connection() as conn:
+        if conn is None:
+            return 0
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM escritas_aplicadas WHERE aplicada_em < now() - %s * interval '1 day';", (dias,)
+            )
+            removidas = cursor.rowcount
+        conn.commit()
+    return removidas
+
+
+_acordar = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run():
+    espera = ESPERA_MINIMA
+    ultima_limpeza = float("-inf")
+    while True:
+        _acordar.clear()
+        try:
+            while drain():
+                pass
+            if time.monotonic() - ultima_limpeza > 3600:
+                prune_keys()
+                ultima_limpeza = time.monotonic()
+            espera = ESPERA_MINIMA
+            _acordar.wait(FILA_INTERVALO)
+        except Exception as e:
+            print(f"Erro ao enviar a fila de escritas (nova tentativa em {espera:.0f}s): {e}")
+            # Novas escritas não antecipam a tentativa com o banco fora do ar
+            time.sleep(espera)
+            espera = min(espera * 2, ESPERA_MAXIMA)
+
+
+def start_worker():
+    """
+    Inicia, uma vez por processo, a thread que envia a fila ao Postgres.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="medtrack-fila", daemon=True)
+            _worker.start()
+    return _worker
+
+
+def journal_stats():
+    """
+    Profundidade e atraso da fila (do arquivo, compartilhado entre processos)
+    e contadores de envio deste processo.
+    """
+    with closing(_open()) as fila:
+        profundidade, mais_antiga = fila.execute("SELECT count(*), min(criado_em) FROM fila;").fetchone()
+        rejeitadas = fila.execute("SELECT count(*) FROM rejeitadas;").fetchone()[0]
+    with _estado.lock:
+        return {
+            "depth": profundidade,
+            "lag_seconds": round(time.time() - mais_antiga, 3) if mais_antiga else 0.0,
+            "rejected": rejeitadas,
+            "sent": _estado.enviadas,
+            "failures": _estado.falhas,
+            "last_sent": _estado.ultimo_envio,
+            "last_error": _estado.ultimo_erro,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Envia ao banco a fila local de escritas.")
+    parser.add_argument("--status", action="store_true", help="Só mostra a situação da fila.")
+    args = parser.parse_args(argv)
+
+    if not args.status:
+        try:
+            enviadas = 0
+            while True:
+                n = drain()
+                if not n:
+                    break
+                enviadas += n
+            print(f"{enviadas} escrita(s) enviada(s).")
+        except Exception as e:
+            print(f"Erro ao enviar a fila de escritas: {e}")
+            return 1
+
+    estatisticas = journal_stats()
+    print(f"Na fila: {estatisticas['depth']} (mais antiga há {estatisticas['lag_seconds']:.0f}s); "
+          f"rejeitadas: {estatisticas['rejected']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,192 +1,208 @@
+from datetime import time
+
+import pandas as pd
 import streamlit as st
-from db import get_connection  # Função para conectar ao banco de dados
+from psycopg2.extras import execute_values
+from db import connection  # Função para conectar ao banco de dados
+from cache import invalidate
+from resumo_paciente import fetch_patient_snapshot
+from diretorio_pacientes import patient_selector
+from metricas import metrics
 
-def fetch_doses(paciente_id):
-    """
-    Obtém medicamentos e suas doses associadas para o paciente.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT m.id AS medicamento_id, m.nome AS medicamento, m.frequencia AS quantidade, d.dose
-                    FROM medicamentos m
-                    LEFT JOIN doses_tomadas d ON m.id = d.medicamento_id AND d.paciente_id = %s
-                    WHERE m.paciente_id = %s;
-                    """,
-                    (paciente_id, paciente_id)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar doses: {e}")
-        finally:
-            conn.close()
-    return []
-
-def register_dose(paciente_id, medicamento_id, dose):
+COLUNAS_GRADE = ["id", "nome", "frequencia", "horario_inicio", "intervalo_horas", "categoria", "observacoes"]
+# Mesmo padrão da coluna medicamentos.horario_inicio
+HORARIO_PADRAO = time(8, 0)
+
+def apply_medication_changes(paciente_id, inserir, atualizar, remover):
     """
-    Registra a confirmação de uma dose.
+    Aplica as alterações da grade em uma única transação, com um comando por tipo:
+    `inserir` e `atualizar` são listas de dicionários com as colunas da grade
+    (`atualizar` com o id), `remover` é uma lista de ids.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose)
-                    VALUES (%s, %s, %s);
-                    """,
-                    (paciente_id, medicamento_id, dose)
-                )
+    if not (inserir or atualizar or remover):
+        return True
+    with connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cursor:
+                    if remover:
+                        cursor.execute(
+                            "DELETE FROM medicamentos WHERE paciente_id = %s AND id = ANY(%s);",
+                            (paciente_id, list(remover))
+                        )
+                    if atualizar:
+                        execute_values(
+                            cursor,
+                            """
+                            UPDATE medicamentos m
+                            SET nome = v.nome, frequencia = v.frequencia,
+                                horario_inicio = v.horario_inicio, intervalo_horas = v.intervalo_horas,
+                                categoria = v.categoria, observacoes = v.observacoes
+                            FROM (VALUES %s) AS v (id, paciente_id, nome, frequencia, horario_inicio,
+                                                   intervalo_horas, categoria, observacoes)
+                            WHERE m.id = v.id AND m.paciente_id = v.paciente_id;
+                            """,
+                            [(m['id'], paciente_id, m['nome'], m['frequencia'], m['horario_inicio'],
+                              m['intervalo_horas'], m['categoria'], m['observacoes'])
+                             for m in atualizar],
+                            template="(%s::integer, %s::integer, %s::text, %s::integer, %s::time, "
+                                     "%s::numeric, %s::text, %s::text)"
+                        )
+                    if inserir:
+                        execute_values(
+                            cursor,
+                            """
+                            INSERT INTO medicamentos (paciente_id, nome, frequencia, horario_inicio,
+                                                      intervalo_horas, categoria, observacoes)
+                            VALUES %s;
+                            """,
+                            [(paciente_id, m['nome'], m['frequencia'], m['horario_inicio'], m['intervalo_horas'],
+                              m['categoria'], m['observacoes']) for m in inserir]
+                        )
                 conn.commit()
-                st.success("Dose confirmada com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao confirmar dose: {e}")
-        finally:
-            conn.close()
+                # As doses dos medicamentos removidos são removidas em cascata; a agenda
+                # é refeita pelos gatilhos de medicamentos
+                invalidate(("medicamentos", paciente_id), ("agenda",), ("busca",),
+                           *([("doses", paciente_id)] if remover else []))
+                st.success(
+                    f"Medicamentos salvos: {len(inserir)} adicionado(s), "
+                    f"{len(atualizar)} alterado(s), {len(remover)} removido(s)."
+                )
+                return True
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Erro ao salvar medicamentos: {e}")
+    return False
 
-def remove_dose(paciente_id, medicamento_id, dose):
+def _clean(valor):
     """
-    Remove uma dose ainda não confirmada.
+    Converte valores vazios da grade (None, NaN, texto em branco) em None.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    DELETE FROM doses_tomadas
-                    WHERE paciente_id = %s AND medicamento_id = %s AND dose = %s;
-                    """,
-                    (paciente_id, medicamento_id, dose)
-                )
-                conn.commit()
-                st.success("Dose removida com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao remover dose: {e}")
-        finally:
-            conn.close()
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return None
+    if isinstance(valor, str):
+        return valor.strip() or None
+    return valor
 
-def fetch_medications(paciente_id):
+def _row(valores):
     """
-    Obtém a lista de medicamentos para um paciente específico.
+    Linha da grade com valores vazios normalizados e o horário como datetime.time
+    (o data_editor devolve horários editados como texto).
     """
-    conn = get_connection()
-    if conn:
+    linha = {c: _clean(valores.get(c)) for c in COLUNAS_GRADE}
+    if isinstance(linha['horario_inicio'], str):
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT id, nome, frequencia, categoria, observacoes
-                    FROM medicamentos
-                    WHERE paciente_id = %s;
-                    """,
-                    (paciente_id,)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar medicamentos: {e}")
-        finally:
-            conn.close()
-    return []
-
-def save_medication(paciente_id, nome, frequencia, categoria, observacoes):
+            linha['horario_inicio'] = time.fromisoformat(linha['horario_inicio'])
+        except ValueError:
+            pass  # Rejeitado na validação
+    return linha
+
+def medication_diff(originais, alteracoes):
     """
-    Salva um medicamento no banco de dados.
+    Calcula, a partir do estado do st.data_editor ("edited_rows", "added_rows",
+    "deleted_rows"), as listas (inserir, atualizar, remover) e os erros de validação.
+    Linhas editadas sem mudança efetiva não entram no resultado.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    INSERT INTO medicamentos (paciente_id, nome, frequencia, categoria, observacoes)
-                    VALUES (%s, %s, %s, %s, %s);
-                    """,
-                    (paciente_id, nome, frequencia, categoria, observacoes)
-                )
-                conn.commit()
-                st.success(f"Medicamento '{nome}' adicionado com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao salvar medicamento: {e}")
-        finally:
-            conn.close()
+    removidas = set(alteracoes.get("deleted_rows", []))
+    remover = [originais[i]['id'] for i in sorted(removidas)]
+
+    inserir, atualizar, erros = [], [], []
+
+    def validar(linha, descricao):
+        if not linha['nome']:
+            erros.append(f"{descricao}: o nome é obrigatório.")
+            return False
+        if linha['frequencia'] is None or int(linha['frequencia']) < 1:
+            erros.append(f"{descricao}: a frequência deve ser de pelo menos 1 dose por dia.")
+            return False
+        linha['frequencia'] = int(linha['frequencia'])
+        if linha['horario_inicio'] is None:
+            linha['horario_inicio'] = HORARIO_PADRAO
+        if not isinstance(linha['horario_inicio'], time):
+            erros.append(f"{descricao}: horário da primeira dose inválido.")
+            return False
+        if linha['intervalo_horas'] is not None and float(linha['intervalo_horas']) <= 0:
+            erros.append(f"{descricao}: o intervalo entre doses deve ser positivo.")
+            return False
+        return True
+
+    for indice, mudancas in alteracoes.get("edited_rows", {}).items():
+        indice = int(indice)
+        if indice in removidas:
+            continue
+        original = originais[indice]
+        linha = _row({**original, **mudancas})
+        linha['id'] = original['id']
+        if linha == _row(original):
+            continue
+        if validar(linha, f"Medicamento '{original['nome']}'"):
+            atualizar.append(linha)
+
+    for numero, nova in enumerate(alteracoes.get("added_rows", []), start=1):
+        linha = _row(nova)
+        if all(v is None for v in linha.values()):
+            continue  # Linha acrescentada e deixada em branco
+        if validar(linha, f"Nova linha {numero}"):
+            inserir.append(linha)
+
+    return inserir, atualizar, remover, erros
 
-def delete_medication(med_id):
+@metrics.fragment
+def medication_grid(paciente_id):
     """
-    Remove um medicamento do banco de dados.
+    Grade editável dos medicamentos do paciente. As edições ficam no navegador
+    (dentro de um formulário, sem reexecuções) até "Salvar alterações", que envia
+    só a diferença em uma transação e reexecuta só este fragmento.
     """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM medicamentos WHERE id = %s;", (med_id,))
-                conn.commit()
-                st.success("Medicamento removido com sucesso!")
-        except Exception as e:
-            st.error(f"Erro ao remover medicamento: {e}")
-        finally:
-            conn.close()
+    st.subheader("Medicamentos Cadastrados")
+    originais = fetch_patient_snapshot(paciente_id, secoes=("medicamentos",))['medicamentos']
+
+    # A chave muda a cada gravação para a grade recomeçar do estado salvo
+    versao = st.session_state.setdefault(f"medicamentos_grade_versao_{paciente_id}", 0)
+    chave = f"medicamentos_grade_{paciente_id}_{versao}"
+
+    with st.form(f"medicamentos_grade_form_{paciente_id}"):
+        st.data_editor(
+            pd.DataFrame(originais, columns=COLUNAS_GRADE),
+            key=chave,
+            num_rows="dynamic",
+            hide_index=True,
+            column_order=COLUNAS_GRADE[1:],
+            column_config={
+                "nome": st.column_config.TextColumn("Nome do Medicamento", required=True),
+                "frequencia": st.column_config.NumberColumn(
+                    "Frequência (doses por dia)", min_value=1, step=1, default=1, required=True
+                ),
+                "horario_inicio": st.column_config.TimeColumn("Primeira dose", format="HH:mm", step=300),
+                "intervalo_horas": st.column_config.NumberColumn(
+                    "Intervalo (h)", min_value=0.25, step=0.25, help="Vazio: doses distribuídas pelas 24 horas"
+                ),
+                "categoria": st.column_config.TextColumn("Categoria"),
+                "observacoes": st.column_config.TextColumn("Observações"),
+            },
+        )
+        submit = st.form_submit_button("Salvar alterações")
+
+    if not originais:
+        st.caption("Nenhum medicamento cadastrado; acrescente linhas na grade.")
+
+    if submit:
+        inserir, atualizar, remover, erros = medication_diff(originais, st.session_state.get(chave, {}))
+        for erro in erros:
+            st.error(erro)
+        if erros:
+            return
+        if not (inserir or atualizar or remover):
+            st.info("Nenhuma alteração para salvar.")
+        elif apply_medication_changes(paciente_id, inserir, atualizar, remover):
+            st.session_state[f"medicamentos_grade_versao_{paciente_id}"] = versao + 1
+            st.rerun(scope="fragment")
 
 def medication_management():
     """
     Interface para gerenciar os medicamentos de um paciente.
     """
-    # Inicialize 'reload' na sessão se ainda não existir
-    if 'reload' not in st.session_state:
-        st.session_state['reload'] = False
-
-    # Buscar pacientes
-    conn = get_connection()
-    pacientes = []
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT id, nome FROM pacientes;")
-                pacientes = cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao carregar pacientes: {e}")
-        finally:
-            conn.close()
-
-    lista_pacientes = [f"{p['id']} - {p['nome']}" for p in pacientes]
-    if lista_pacientes:
-        paciente_selecionado = st.selectbox("Selecione o Paciente", lista_pacientes)
-        paciente_id = int(paciente_selecionado.split(" - ")[0])
-
-        st.subheader("Medicamentos Cadastrados")
-        medicamentos = fetch_medications(paciente_id)
-        if medicamentos:
-            for med in medicamentos:
-                with st.expander(f"{med['nome']}"):
-                    st.write(f"**Frequência:** {med['frequencia']}")
-                    st.write(f"**Categoria:** {med['categoria']}")
-                    st.write(f"**Observações:** {med['observacoes']}")
-
-                    # Botão para remover medicamento
-                    if st.button("Remover", key=f"remover_{med['id']}"):
-                        delete_medication(med['id'])
-                        st.session_state['reload'] = True  # Atualiza o estado para recarregar a página
-
-        else:
-            st.warning("Nenhum medicamento cadastrado para este paciente.")
-
-        # Formulário para adicionar novos medicamentos
-        st.subheader("Adicionar Novo Medicamento")
-        with st.form("adicionar_medicamento"):
-            nome = st.text_input("Nome do Medicamento")
-            frequencia = st.number_input("Frequência (doses por dia)", min_value=1, step=1)
-            categoria = st.text_input("Categoria")
-            observacoes = st.text_area("Observações")
-            submit = st.form_submit_button("Adicionar Medicamento")
-
-            if submit:
-                save_medication(paciente_id, nome, frequencia, categoria, observacoes)
-                st.session_state['reload'] = True  # Atualiza o estado para recarregar a página
-
-        # Recarga da página
-            st.rerun()  # Ou a abordagem alternativa de redirecionamento
-    else:
-        st.warning("Nenhum paciente cadastrado.")
+    # Trocar de paciente reexecuta a página inteira; os painéis são fragmentos
+    paciente_id = patient_selector("medicamentos_paciente")
+    if paciente_id is not None:
+        medication_grid(paciente_id)
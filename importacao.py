@@ -0,0 +1,446 @@
+import argparse
+import csv
+import io
+import sys
+import time
+from pathlib import Path
+
+import streamlit as st
+from psycopg2.extras import Json, execute_values
+
+from cache import query_cache
+from db import connection
+from diario_valores import parse_detalhes
+
+
+PARQUET_BATCH_SIZE = 50000
+# Registros do diário convertidos em `valores` por vez, antes da inserção
+VALORES_BATCH_SIZE = 5000
+
+NUMERO = r"^(\d+([.,]\d+)?)?$"
+DATA = r"^\d{4}-\d{2}-\d{2}$"
+HORA = r"^\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$"
+DATA_HORA = r"^\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$"
+TIPOS_DIARIO = ("Fisiologia", "Sinais Vitais", "Ocorrência", "Alimentação", "Líquidos")
+
+# Identifica o paciente pelo nome; nomes repetidos no banco são rejeitados como ambíguos
+RESOLVER_PACIENTE = [
+    ("sql", """
+        UPDATE {stg} s SET paciente_id = p.id
+        FROM (SELECT nome, min(id) AS id, count(*) AS n FROM pacientes GROUP BY nome) p
+        WHERE s.motivo IS NULL AND p.nome = trim(s.paciente) AND p.n = 1;
+    """),
+    ("motivo", "s.paciente_id IS NULL AND EXISTS (SELECT 1 FROM pacientes p WHERE p.nome = trim(s.paciente))",
+     "paciente ambíguo (nome repetido no cadastro)"),
+    ("motivo", "s.paciente_id IS NULL", "paciente não encontrado"),
+]
+
+
+def _fill_diary_values(cursor, stg):
+    """
+    Preenche `valores` dos registros aceitos do diário a partir de `detalhes`,
+    bloco a bloco, na mesma transação da inserção.
+    """
+    ultima_linha = 0
+    while True:
+        cursor.execute(
+            f"""
+            SELECT linha, trim(tipo) AS tipo, trim(detalhes) AS detalhes
+            FROM {stg}
+            WHERE motivo IS NULL AND linha > %s
+            ORDER BY linha
+            LIMIT %s;
+            """,
+            (ultima_linha, VALORES_BATCH_SIZE)
+        )
+        bloco = cursor.fetchall()
+        if not bloco:
+            break
+        execute_values(
+            cursor,
+            f"""
+            UPDATE {stg} AS s
+            SET valores = v.valores::jsonb
+            FROM (VALUES %s) AS v (linha, valores)
+            WHERE s.linha = v.linha;
+            """,
+            [(r['linha'], Json(parse_detalhes(r['tipo'], r['detalhes']))) for r in bloco],
+            page_size=len(bloco)
+        )
+        ultima_linha = bloco[-1]['linha']
+
+
+# Cada tipo de importação, na ordem em que é aplicado (pacientes antes de seus medicamentos etc.).
+# "etapas" são executadas em sequência sobre a tabela de staging: regras ("motivo", condição de
+# rejeição, motivo) ou comandos ("sql", comando). "chave" define duplicatas e "existente" detecta
+# registros que já estão no banco. "preparar", se houver, completa as linhas aceitas antes de "inserir".
+# As regras "fora do intervalo" rejeitam valores que passam pela expressão regular mas não cabem
+# na coluna de destino (INTEGER ou NUMERIC(5, 1)).
+IMPORTACOES = {
+    "pacientes": {
+        "colunas": ["nome", "idade", "sexo", "altura", "peso"],
+        "obrigatorias": ["nome"],
+        "etapas": [
+            ("motivo", "nullif(trim(s.nome), '') IS NULL", "nome obrigatório"),
+            ("motivo", r"coalesce(trim(s.idade), '') !~ '^\d*$'", "idade inválida"),
+            ("motivo", "nullif(trim(s.idade), '') IS NOT NULL AND tenta_converter_inteiro(trim(s.idade)) IS NULL",
+             "idade fora do intervalo"),
+            ("motivo", "coalesce(trim(s.sexo), '') NOT IN ('', 'Masculino', 'Feminino', 'Outro')", "sexo inválido"),
+            ("motivo", f"coalesce(trim(s.altura), '') !~ '{NUMERO}'", "altura inválida"),
+            ("motivo", "nullif(trim(s.altura), '') IS NOT NULL AND tenta_converter_medida(trim(s.altura)) IS NULL",
+             "altura fora do intervalo (até 9999,9)"),
+            ("motivo", f"coalesce(trim(s.peso), '') !~ '{NUMERO}'", "peso inválido"),
+            ("motivo", "nullif(trim(s.peso), '') IS NOT NULL AND tenta_converter_medida(trim(s.peso)) IS NULL",
+             "peso fora do intervalo (até 9999,9)"),
+        ],
+        "chave": "trim(s.nome), nullif(trim(s.idade), ''), nullif(trim(s.sexo), '')",
+        "existente": """
+            EXISTS (SELECT 1 FROM pacientes p
+                    WHERE p.nome = trim(s.nome)
+                      AND p.idade IS NOT DISTINCT FROM tenta_converter_inteiro(nullif(trim(s.idade), ''))
+                      AND p.sexo IS NOT DISTINCT FROM nullif(trim(s.sexo), ''))
+        """,
+        "inserir": """
+            INSERT INTO pacientes (nome, idade, sexo, altura, peso)
+            SELECT trim(nome), tenta_converter_inteiro(nullif(trim(idade), '')), nullif(trim(sexo), ''),
+                   tenta_converter_medida(nullif(trim(altura), '')),
+                   tenta_converter_medida(nullif(trim(peso), ''))
+            FROM {stg} WHERE motivo IS NULL ORDER BY linha;
+        """,
+    },
+    "medicamentos": {
+        "colunas": ["paciente", "nome", "frequencia", "categoria", "observacoes"],
+        "obrigatorias": ["paciente", "nome", "frequencia"],
+        "etapas": [
+            ("motivo", "nullif(trim(s.nome), '') IS NULL", "nome do medicamento obrigatório"),
+            ("motivo", r"coalesce(trim(s.frequencia), '') !~ '^[1-9]\d*$'", "frequência inválida"),
+            ("motivo", "tenta_converter_inteiro(trim(s.frequencia)) IS NULL", "frequência fora do intervalo"),
+        ] + RESOLVER_PACIENTE,
+        "chave": "s.paciente_id, trim(s.nome)",
+        "existente": """
+            EXISTS (SELECT 1 FROM medicamentos m
+                    WHERE m.paciente_id = s.paciente_id AND m.nome = trim(s.nome))
+        """,
+        "inserir": """
+            INSERT INTO medicamentos (paciente_id, nome, frequencia, categoria, observacoes)
+            SELECT paciente_id, trim(nome), tenta_converter_inteiro(trim(frequencia)), nullif(trim(categoria), ''),
+                   observacoes
+            FROM {stg} WHERE motivo IS NULL ORDER BY linha;
+        """,
+    },
+    "diario": {
+        "colunas": ["paciente", "data", "hora", "tipo", "detalhes"],
+        "obrigatorias": ["paciente", "data", "hora", "tipo", "detalhes"],
+        "etapas": [
+            ("motivo", f"coalesce(trim(s.data), '') !~ '{DATA}' OR tenta_converter_data(trim(s.data)) IS NULL",
+             "data inválida"),
+            ("motivo", f"coalesce(trim(s.hora), '') !~ '{HORA}' OR tenta_converter_hora(trim(s.hora)) IS NULL",
+             "hora inválida"),
+            ("motivo", "coalesce(trim(s.tipo), '') NOT IN ({tipos})".format(
+                tipos=", ".join(f"'{t}'" for t in TIPOS_DIARIO)), "tipo inválido"),
+            ("motivo", "nullif(trim(s.detalhes), '') IS NULL", "detalhes obrigatórios"),
+        ] + RESOLVER_PACIENTE,
+        "chave": "s.paciente_id, tenta_converter_data(trim(s.data)), tenta_converter_hora(trim(s.hora)), "
+                 "trim(s.tipo), trim(s.detalhes)",
+        "existente": """
+            EXISTS (SELECT 1 FROM diario d
+                    WHERE d.paciente_id = s.paciente_id AND d.data = tenta_converter_data(trim(s.data))
+                      AND d.hora = tenta_converter_hora(trim(s.hora)) AND d.tipo = trim(s.tipo)
+                      AND d.detalhes = trim(s.detalhes))
+        """,
+        # `valores` é extraído de `detalhes` antes da inserção, para que o resumo diário já o use
+        "preparar": _fill_diary_values,
+        "inserir": """
+            INSERT INTO diario (paciente_id, data, hora, tipo, detalhes, valores)
+            SELECT paciente_id, trim(data)::date, trim(hora)::time, trim(tipo), trim(detalhes), valores
+            FROM {stg} WHERE motivo IS NULL ORDER BY linha;
+        """,
+    },
+    "doses": {
+        "colunas": ["paciente", "medicamento", "dose", "data_hora"],
+        "obrigatorias": ["paciente", "medicamento", "dose", "data_hora"],
+        "etapas": [
+            ("motivo", r"coalesce(trim(s.dose), '') !~ '^[1-9]\d*$'", "dose inválida"),
+            ("motivo", "tenta_converter_inteiro(trim(s.dose)) IS NULL", "dose fora do intervalo"),
+            ("motivo", f"coalesce(trim(s.data_hora), '') !~ '{DATA_HORA}' "
+                       "OR tenta_converter_timestamp(trim(s.data_hora)) IS NULL", "data/hora inválida"),
+        ] + RESOLVER_PACIENTE + [
+            ("sql", """
+                UPDATE {stg} s SET medicamento_id = m.id
+                FROM (SELECT paciente_id, nome, min(id) AS id, count(*) AS n
+                      FROM medicamentos GROUP BY paciente_id, nome) m
+                WHERE s.motivo IS NULL AND m.paciente_id = s.paciente_id
+                  AND m.nome = trim(s.medicamento) AND m.n = 1;
+            """),
+            ("motivo", "s.medicamento_id IS NULL", "medicamento não encontrado (ou repetido) para o paciente"),
+        ],
+        "chave": "s.medicamento_id, trim(s.dose), tenta_converter_timestamp(trim(s.data_hora))",
+        "existente": """
+            EXISTS (SELECT 1 FROM doses_tomadas t
+                    WHERE t.paciente_id = s.paciente_id AND t.medicamento_id = s.medicamento_id
+                      AND t.dose::text = trim(s.dose)
+                      AND t.data_hora = tenta_converter_timestamp(trim(s.data_hora)))
+        """,
+        "inserir": """
+            INSERT INTO doses_tomadas (paciente_id, medicamento_id, dose, data_hora)
+            SELECT paciente_id, medicamento_id, tenta_converter_inteiro(trim(dose)), trim(data_hora)::timestamp
+            FROM {stg} WHERE motivo IS NULL ORDER BY linha;
+        """,
+    },
+}
+
+
+def _source_name(fonte):
+    return str(getattr(fonte, "name", fonte))
+
+
+def _open_binary(fonte):
+    """
+    Abre um caminho em modo binário ou reposiciona um arquivo já aberto (ex.: upload do Streamlit).
+    """
+    if isinstance(fonte, (str, Path)):
+        return open(fonte, "rb")
+    fonte.seek(0)
+    return fonte
+
+
+def _check_columns(tipo, colunas):
+    definicao = IMPORTACOES[tipo]
+    desconhecidas = [c for c in colunas if c not in definicao["colunas"]]
+    faltando = [c for c in definicao["obrigatorias"] if c not in colunas]
+    if desconhecidas or faltando:
+        partes = []
+        if faltando:
+            partes.append(f"faltando {', '.join(faltando)}")
+        if desconhecidas:
+            partes.append(f"desconhecidas {', '.join(desconhecidas)}")
+        raise ValueError(f"Colunas inválidas para {tipo}: {'; '.join(partes)}.")
+
+
+def _copy_csv(cursor, tipo, stg, fonte):
+    """
+    Carrega um CSV (com cabeçalho) na tabela de staging por COPY, sem passar linha a linha pelo Python.
+    """
+    arquivo = _open_binary(fonte)
+    texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+    try:
+        colunas = [c.strip() for c in next(csv.reader([texto.readline()]))]
+        _check_columns(tipo, colunas)
+        cursor.copy_expert(
+            f"COPY {stg} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv, HEADER false)",
+            texto
+        )
+    finally:
+        texto.detach()
+        if isinstance(fonte, (str, Path)):
+            arquivo.close()
+
+
+def _copy_parquet(cursor, tipo, stg, fonte):
+    """
+    Carrega um Parquet na tabela de staging, convertendo um lote por vez em CSV para o COPY.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    arquivo = _open_binary(fonte)
+    try:
+        parquet = pq.ParquetFile(arquivo)
+        colunas = parquet.schema_arrow.names
+        _check_columns(tipo, colunas)
+        comando = f"COPY {stg} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv, HEADER false)"
+        for lote in parquet.iter_batches(batch_size=PARQUET_BATCH_SIZE):
+            lote = pa.record_batch([c.cast(pa.string()) for c in lote.columns], names=colunas)
+            saida = pa.BufferOutputStream()
+            pa_csv.write_csv(lote, saida, pa_csv.WriteOptions(include_header=False))
+            cursor.copy_expert(comando, io.BytesIO(saida.getvalue().to_pybytes()))
+    finally:
+        if isinstance(fonte, (str, Path)):
+            arquivo.close()
+
+
+def _stage(cursor, tipo, fonte):
+    """
+    Cria a tabela de staging de um tipo e carrega o arquivo nela. Retorna o nome da tabela.
+    """
+    stg = f"stg_importacao_{tipo}"
+    colunas = ", ".join(f"{c} TEXT" for c in IMPORTACOES[tipo]["colunas"])
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE {stg} (
+            linha BIGINT GENERATED ALWAYS AS IDENTITY,
+            {colunas},
+            paciente_id INTEGER,
+            medicamento_id INTEGER,
+            valores JSONB,
+            motivo TEXT
+        ) ON COMMIT DROP;
+        """
+    )
+    if _source_name(fonte).lower().endswith(".parquet"):
+        _copy_parquet(cursor, tipo, stg, fonte)
+    else:
+        _copy_csv(cursor, tipo, stg, fonte)
+    cursor.execute(f"ANALYZE {stg};")
+    return stg
+
+
+def _validate_and_merge(cursor, tipo, stg):
+    """
+    Valida, remove duplicatas e insere os registros aceitos, tudo em SQL sobre o staging.
+    Retorna (linhas lidas, linhas importadas, [(linha, motivo)] rejeitadas).
+    """
+    definicao = IMPORTACOES[tipo]
+    for etapa in definicao["etapas"]:
+        if etapa[0] == "sql":
+            cursor.execute(etapa[1].format(stg=stg))
+        else:
+            _, condicao, motivo = etapa
+            cursor.execute(
+                f"UPDATE {stg} s SET motivo = %s WHERE s.motivo IS NULL AND ({condicao});",
+                (motivo,)
+            )
+
+    # Duplicatas dentro do próprio arquivo: mantém a primeira ocorrência
+    cursor.execute(
+        f"""
+        WITH ocorrencias AS (
+            SELECT s.linha, min(s.linha) OVER (PARTITION BY {definicao['chave']}) AS primeira
+            FROM {stg} s
+            WHERE s.motivo IS NULL
+        )
+        UPDATE {stg} s SET motivo = 'duplicado da linha ' || o.primeira
+        FROM ocorrencias o
+        WHERE s.linha = o.linha AND o.linha <> o.primeira;
+        """
+    )
+    cursor.execute(
+        f"UPDATE {stg} s SET motivo = 'já cadastrado' WHERE s.motivo IS NULL AND {definicao['existente']};"
+    )
+
+    if "preparar" in definicao:
+        definicao["preparar"](cursor, stg)
+
+    cursor.execute(definicao["inserir"].format(stg=stg))
+    importadas = cursor.rowcount
+    cursor.execute(f"SELECT count(*) AS total FROM {stg};")
+    lidas = cursor.fetchone()['total']
+    cursor.execute(f"SELECT linha, motivo FROM {stg} WHERE motivo IS NOT NULL ORDER BY linha;")
+    rejeitadas = [(r['linha'], r['motivo']) for r in cursor.fetchall()]
+    return lidas, importadas, rejeitadas
+
+
+def import_files(fontes, dry_run=False):
+    """
+    Importa arquivos CSV ou Parquet em uma única transação.
+
+    `fontes` mapeia o tipo ("pacientes", "medicamentos", "diario", "doses") para
+    um caminho ou arquivo aberto. Os tipos são aplicados na ordem de
+    IMPORTACOES, de modo que medicamentos podem citar pacientes do mesmo lote.
+    Com `dry_run`, tudo é validado e a transação é desfeita no final.
+
+    Retorna {tipo: {"lidas", "importadas", "rejeitadas", "segundos"}}; as
+    linhas rejeitadas são numeradas a partir do primeiro registro do arquivo.
+    """
+    desconhecidos = set(fontes) - set(IMPORTACOES)
+    if desconhecidos:
+        raise ValueError(f"Tipos de importação desconhecidos: {', '.join(sorted(desconhecidos))}.")
+
+    resultado = {}
+    with connection() as conn:
+        if not conn:
+            raise ConnectionError("Não foi possível conectar ao banco de dados.")
+        try:
+            with conn.cursor() as cursor:
+                for tipo in IMPORTACOES:
+                    if tipo not in fontes:
+                        continue
+                    inicio = time.monotonic()
+                    stg = _stage(cursor, tipo, fontes[tipo])
+                    lidas, importadas, rejeitadas = _validate_and_merge(cursor, tipo, stg)
+                    resultado[tipo] = {
+                        "lidas": lidas,
+                        "importadas": importadas,
+                        "rejeitadas": rejeitadas,
+                        "segundos": time.monotonic() - inicio,
+                    }
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    if not dry_run:
+        # Importações afetam muitos pacientes de uma vez; descarta todo o cache
+        query_cache.clear()
+    return resultado
+
+
+def render_import():
+    """
+    Seção de importação em massa da página de cadastro.
+    """
+    st.caption(
+        "Arquivos CSV (com cabeçalho) ou Parquet. Pacientes são referenciados pelo nome. "
+        "Colunas: " + "; ".join(f"{tipo}: {', '.join(d['colunas'])}" for tipo, d in IMPORTACOES.items())
+    )
+    fontes = {}
+    for tipo in IMPORTACOES:
+        arquivo = st.file_uploader(f"Arquivo de {tipo}", type=["csv", "parquet"], key=f"importacao_{tipo}")
+        if arquivo is not None:
+            fontes[tipo] = arquivo
+
+    col_validar, col_importar = st.columns(2)
+    with col_validar:
+        validar = st.button("Validar", key="importacao_validar", disabled=not fontes)
+    with col_importar:
+        importar = st.button("Importar", key="importacao_importar", disabled=not fontes)
+
+    if validar or importar:
+        try:
+            with st.spinner("Processando arquivos..."):
+                resultado = import_files(fontes, dry_run=validar)
+        except Exception as e:
+            st.error(f"Erro ao importar arquivos: {e}")
+            return
+
+        for tipo, r in resultado.items():
+            acao = "seriam importadas" if validar else "importadas"
+            mensagem = f"{tipo}: {r['importadas']} de {r['lidas']} linhas {acao} em {r['segundos']:.1f}s."
+            if r["rejeitadas"]:
+                st.warning(mensagem + f" {len(r['rejeitadas'])} rejeitadas:")
+                st.dataframe([{"linha": linha, "motivo": motivo} for linha, motivo in r["rejeitadas"]])
+            else:
+                st.success(mensagem)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa pacientes, medicamentos, diário e doses em massa.")
+    for tipo in IMPORTACOES:
+        parser.add_argument(f"--{tipo}", type=Path, help=f"Arquivo CSV ou Parquet de {tipo}.")
+    parser.add_argument("--validar", action="store_true", help="Apenas valida, sem gravar.")
+    args = parser.parse_args(argv)
+
+    fontes = {tipo: getattr(args, tipo) for tipo in IMPORTACOES if getattr(args, tipo)}
+    if not fontes:
+        parser.error("Informe ao menos um arquivo.")
+    try:
+        resultado = import_files(fontes, dry_run=args.validar)
+    except Exception as e:
+        print(f"Erro ao importar arquivos: {e}")
+        return 1
+
+    for tipo, r in resultado.items():
+        taxa = r["lidas"] / max(r["segundos"], 1e-9)
+        print(f"{tipo}: {r['lidas']} lidas, {r['importadas']} importadas, "
+              f"{len(r['rejeitadas'])} rejeitadas ({taxa:.0f} linhas/s)")
+        for linha, motivo in r["rejeitadas"]:
+            print(f"    linha {linha}: {motivo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Mede o tempo de inicialização do aplicativo em processos novos.
+
+- partida a frio: tempo de `import medtrack` em um interpretador recém-aberto
+  (e o tempo total do processo, incluindo o próprio Python);
+- formulário de login: tempo até a primeira execução do script, sem sessão
+  autenticada, desenhar o formulário de login (pelo AppTest do Streamlit).
+
+Também lista as bibliotecas pesadas carregadas por `import medtrack`, que
+devem ficar fora do caminho até o login.
+
+    python inicializacao.py --repeticoes 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+BENCHMARK_DIR = Path(os.environ.get("MEDTRACK_BENCHMARK_DIR", "benchmarks"))
+PESADAS = ("pandas", "plotly", "pyarrow", "openpyxl")
+RAIZ = Path(__file__).resolve().parent
+
+_SONDA_IMPORT = """
+import json, sys, time
+inicio = time.perf_counter()
+import medtrack
+duracao = time.perf_counter() - inicio
+print(json.dumps({"import_s": duracao, "pesadas": [m for m in %r if m in sys.modules]}))
+"""
+
+_SONDA_LOGIN = """
+import json, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app = AppTest.from_file("medtrack.py", default_timeout=60).run()
+duracao = time.perf_counter() - inicio
+campos = [w.key for w in app.sidebar.text_input]
+print(json.dumps({"login_s": duracao, "harness_s": harness,
+                  "formulario": "login_username" in campos and "login_password" in campos,
+                  "erros": len(app.exception)}))
+"""
+
+
+def _probe(codigo):
+    """
+    Executa a sonda em um interpretador novo; devolve (resultado, tempo total do processo).
+    """
+    inicio = time.perf_counter()
+    processo = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True)
+    total = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "falha na sonda")
+    return json.loads(processo.stdout.strip().splitlines()[-1]), total
+
+
+def _ms(valores):
+    valores = [v * 1000.0 for v in valores]
+    return {"mediana_ms": round(statistics.median(valores), 1), "min_ms": round(min(valores), 1),
+            "max_ms": round(max(valores), 1)}
+
+
+def measure_startup(repeticoes=10, login=True):
+    importacao, processo, pesadas = [], [], set()
+    for _ in range(repeticoes):
+        resultado, total = _probe(_SONDA_IMPORT % (PESADAS,))
+        importacao.append(resultado["import_s"])
+        processo.append(total)
+        pesadas.update(resultado["pesadas"])
+    resultados = {
+        "import medtrack": _ms(importacao),
+        "processo (python -c 'import medtrack')": _ms(processo),
+        "bibliotecas_pesadas_no_import": sorted(pesadas),
+    }
+
+    if login:
+        tempos, formulario, erros = [], True, 0
+        for _ in range(repeticoes):
+            resultado, _ = _probe(_SONDA_LOGIN)
+            tempos.append(resultado["login_s"])
+            formulario = formulario and resultado["formulario"]
+            erros += resultado["erros"]
+        resultados["formulario de login"] = _ms(tempos)
+        resultados["formulario de login"].update({"exibido": formulario, "erros": erros})
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de inicialização do MedTrack.")
+    parser.add_argument("--repeticoes", type=int, default=10, help="Processos medidos por etapa.")
+    parser.add_argument("--sem-login", action="store_true", help="Mede só a importação.")
+    parser.add_argument("--saida", type=Path, help="Arquivo JSON do resultado.")
+    args = parser.parse_args(argv)
+
+    try:
+        resultados = measure_startup(args.repeticoes, login=not args.sem_login)
+    except Exception as e:
+        print(f"Erro ao medir a inicialização: {e}")
+        return 1
+
+    for nome, valor in resultados.items():
+        print(f"{nome}: {valor}")
+
+    saida = args.saida or BENCHMARK_DIR / f"inicializacao_{datetime.now():%Y%m%d_%H%M%S}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps({"gerado_em": datetime.now().isoformat(timespec="seconds"),
+                                 "python": sys.version.split()[0], "resultados": resultados},
+                                indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultado salvo em {saida}")
+    # Bibliotecas pesadas no caminho do login contam como regressão
+    return 1 if resultados["bibliotecas_pesadas_no_import"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
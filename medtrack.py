@@ -1,9 +1,9 @@
+import importlib
+
 import streamlit as st
-from diario_diario import daily_diary
-from datetime import datetime
-from cadastro_paciente import patient_registration
-from gerenciamento_medicamentos import medication_management
-from visualizar_dados import view_data
+from metricas import metrics, start_metrics_server
+from particoes import ensure_partitions_once
+from fila_escritas import ESCRITA_ADIADA, start_worker
 
 # Usuário e senha hardcoded para autenticação
 USERS = {
@@ -11,6 +11,31 @@ USERS = {
     "user": "password"
 }
 
+# Páginas do menu: nome -> (módulo, função, somente administrador).
+# O módulo só é importado quando a página é aberta pela primeira vez, para que
+# pandas, plotly, pyarrow e openpyxl fiquem fora do caminho até o login.
+PAGES = {
+    "Cadastro de Paciente": ("cadastro_paciente", "patient_registration", False),
+    "Gerenciamento de Medicamentos": ("gerenciamento_medicamentos", "medication_management", False),
+    "Diário Diário": ("diario_diario", "daily_diary", False),
+    "Visualizar Dados": ("visualizar_dados", "view_data", False),
+    "Busca": ("busca", "search_page", False),
+    "Métricas": ("metricas", "metrics_page", True),
+}
+
+def available_pages(username):
+    """
+    Páginas visíveis no menu para o usuário.
+    """
+    return [nome for nome, (_, _, restrita) in PAGES.items() if not restrita or username == "admin"]
+
+def load_page(menu):
+    """
+    Importa (na primeira vez) o módulo da página e devolve sua função de renderização.
+    """
+    modulo, funcao, _ = PAGES[menu]
+    return getattr(importlib.import_module(modulo), funcao)
+
 def authenticate():
     """
     Exibe a interface de login na barra lateral.
@@ -45,25 +70,25 @@ def main():
     Função principal para gerenciar o fluxo do sistema.
     """
     st.set_page_config(page_title="MedTrack", layout="wide")
+    # Endpoint /metrics para o Prometheus, se MEDTRACK_METRICS_PORT estiver definida
+    start_metrics_server()
 
     if secure_app():
+        # Partições dos próximos meses de diario e doses_tomadas (uma vez por processo);
+        # fica depois do login para não atrasar o formulário na primeira abertura
+        ensure_partitions_once()
+        # Envia escritas deixadas na fila local por execuções anteriores
+        if ESCRITA_ADIADA:
+            start_worker()
+
         st.title("MedTrack - Sistema de Gerenciamento de Pacientes (Projeto Cholinho feliz :))")
         
         # Exibir menu lateral
-        menu = st.sidebar.selectbox("Menu", ["Cadastro de Paciente", "Gerenciamento de Medicamentos", "Diário Diário", "Visualizar Dados"])
+        paginas = available_pages(st.session_state.get("username"))
+        menu = st.sidebar.selectbox("Menu", paginas)
 
-        if menu == "Cadastro de Paciente":
-           # st.info("Navegando para Cadastro de Paciente.")
-            patient_registration()
-        elif menu == "Gerenciamento de Medicamentos":
-           # st.info("Navegando para Gerenciamento de Medicamentos.")
-            medication_management()
-        elif menu == "Diário Diário":
-           # st.info("Navegando para Diário Diário.")
-            daily_diary()
-        elif menu == "Visualizar Dados":
-           # st.info("Navegando para Visualizar Dados.")
-            view_data()
+        with metrics.page(menu):
+            load_page(menu)()
 
 if __name__ == "__main__":
     main()
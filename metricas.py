@@ -0,0 +1,468 @@
+"""
+Métricas de desempenho do acesso ao banco.
+
+Todas as conexões do aplicativo usam `InstrumentedConnection`, cujos cursores
+medem cada comando executado: latência e linhas por comando (agrupados pelo
+texto SQL com os parâmetros ainda como %s) e por página, além do tempo de
+espera por uma conexão do pool. Comandos mais lentos que
+SLOW_QUERY_MS vão para o log de consultas lentas. Os fragmentos das páginas
+usam `metrics.fragment` no lugar de st.fragment, para que suas reexecuções
+também sejam atribuídas à página.
+
+As métricas podem ser exportadas no formato texto do Prometheus, para um
+arquivo (lido, por exemplo, pelo textfile collector do node_exporter) ou por
+um endpoint HTTP iniciado com MEDTRACK_METRICS_PORT. O endpoint escuta só em
+127.0.0.1; para um Prometheus em outra máquina, defina MEDTRACK_METRICS_HOST
+(ex.: 0.0.0.0) e restrinja o acesso à porta na rede.
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import psycopg2.extensions
+
+
+SLOW_QUERY_MS = float(os.environ.get("MEDTRACK_SLOW_QUERY_MS", 200.0))
+SLOW_QUERY_LOG = os.environ.get("MEDTRACK_SLOW_QUERY_LOG", "consultas_lentas.log")
+PROMETHEUS_FILE = Path(os.environ.get("MEDTRACK_PROMETHEUS_FILE", "metricas/medtrack.prom"))
+METRICS_PORT = int(os.environ.get("MEDTRACK_METRICS_PORT", 0))
+# O endpoint expõe o texto dos comandos SQL; por padrão, só a própria máquina o acessa
+METRICS_HOST = os.environ.get("MEDTRACK_METRICS_HOST", "127.0.0.1")
+# Limites superiores (segundos) dos intervalos dos histogramas
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Comandos distintos acompanhados; os demais são somados em OUTROS
+MAX_STATEMENTS = 500
+OUTROS = "(outros)"
+
+# Página em renderização na sessão atual (None fora de uma página)
+pagina_atual = contextvars.ContextVar("pagina_atual", default=None)
+
+_VALUES = re.compile(r"\bVALUES\s*\(.*", re.IGNORECASE | re.DOTALL)
+
+
+def _statement_key(sql):
+    """
+    Texto que identifica um comando: espaços normalizados e, em comandos já
+    interpolados (execute_values), a lista de VALUES resumida.
+    """
+    if isinstance(sql, bytes):
+        sql = _VALUES.sub("VALUES (...)", sql.decode("utf-8", "replace"))
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    return " ".join(sql.split()).rstrip(";")
+
+
+class Histogram:
+    """
+    Histograma acumulado com os intervalos de BUCKETS, no modelo do Prometheus.
+    """
+
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observe(self, valor):
+        self.contagens[bisect.bisect_left(BUCKETS, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def quantile(self, q):
+        """
+        Estimativa de um quantil por interpolação linear dentro do intervalo.
+        """
+        if not self.total:
+            return None
+        alvo = q * self.total
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            if acumulado + contagem >= alvo and contagem:
+                inferior = BUCKETS[i - 1] if i > 0 else 0.0
+                superior = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return inferior + (superior - inferior) * (alvo - acumulado) / contagem
+            acumulado += contagem
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """
+    Registro de métricas compartilhado por todas as sessões do processo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.comandos = {}  # sql -> {"latencia": Histogram, "linhas": int, "lentos": int}
+            self.paginas = {}  # página -> Histogram
+            self.comandos_por_pagina = {}  # página -> quantidade de comandos
+            self.espera_conexao = Histogram()
+            self.lentos = deque(maxlen=200)
+            self.total_comandos = 0
+            self.iniciado_em = datetime.now()
+
+    def observe_statement(self, sql, segundos, linhas):
+        chave = _statement_key(sql)
+        pagina = pagina_atual.get()
+        lento = segundos * 1000 >= SLOW_QUERY_MS
+        with self._lock:
+            if chave not in self.comandos and len(self.comandos) >= MAX_STATEMENTS:
+                chave = OUTROS
+            comando = self.comandos.setdefault(chave, {"latencia": Histogram(), "linhas": 0, "lentos": 0})
+            comando["latencia"].observe(segundos)
+            comando["linhas"] += max(linhas, 0)
+            self.total_comandos += 1
+            if pagina is not None:
+                self.comandos_por_pagina[pagina] = self.comandos_por_pagina.get(pagina, 0) + 1
+            if lento:
+                comando["lentos"] += 1
+                self.lentos.append((datetime.now(), pagina, segundos, chave))
+        if lento:
+            _slow_log().warning("%.1f ms | %s | %s", segundos * 1000, pagina or "-", chave)
+
+    def observe_wait(self, segundos):
+        with self._lock:
+            self.espera_conexao.observe(segundos)
+
+    def observe_page(self, pagina, segundos):
+        with self._lock:
+            self.paginas.setdefault(pagina, Histogram()).observe(segundos)
+
+    def statement_count(self):
+        with self._lock:
+            return self.total_comandos
+
+    @contextmanager
+    def page(self, pagina):
+        """
+        Atribui os comandos do bloco à página e mede o tempo de renderização.
+        """
+        token = pagina_atual.set(pagina)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_page(pagina, time.perf_counter() - inicio)
+            pagina_atual.reset(token)
+
+    def fragment(self, funcao=None, *, pagina=None, **opcoes):
+        """
+        Substitui st.fragment (mesmas opções, como run_every). As reexecuções
+        só do fragmento não passam pelo `page()` do script principal; nelas os
+        comandos e o tempo são atribuídos a `pagina` ou, sem ela, à página em
+        que o fragmento foi desenhado pela última vez na sessão.
+        """
+        import streamlit as st
+
+        def decorar(funcao):
+            chave = f"metricas_pagina_{funcao.__module__}.{funcao.__qualname__}"
+
+            @functools.wraps(funcao)
+            def executar(*args, **kwargs):
+                atual = pagina_atual.get()
+                if atual is not None:
+                    # Execução do script inteiro, já dentro de page()
+                    st.session_state[chave] = atual
+                    return funcao(*args, **kwargs)
+                with self.page(pagina or st.session_state.get(chave, funcao.__name__)):
+                    return funcao(*args, **kwargs)
+
+            return st.fragment(executar, **opcoes)
+
+        return decorar if funcao is None else decorar(funcao)
+
+
+metrics = Metrics()
+
+_slow_logger = None
+_slow_logger_lock = threading.Lock()
+
+
+def _slow_log():
+    """
+    Logger das consultas lentas, gravado em SLOW_QUERY_LOG (configurado no primeiro uso).
+    """
+    global _slow_logger
+    if _slow_logger is None:
+        with _slow_logger_lock:
+            if _slow_logger is None:
+                logger = logging.getLogger("medtrack.consultas_lentas")
+                if SLOW_QUERY_LOG:
+                    handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                    logger.addHandler(handler)
+                logger.setLevel(logging.WARNING)
+                logger.propagate = False
+                _slow_logger = logger
+    return _slow_logger
+
+
+_instrumented_classes = {}
+_instrumented_lock = threading.Lock()
+
+
+def _timed(metodo):
+    def executar(self, sql, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return metodo(self, sql, *args, **kwargs)
+        finally:
+            metrics.observe_statement(sql, time.perf_counter() - inicio, self.rowcount)
+    return executar
+
+
+def instrumented_cursor(base):
+    """
+    Subclasse de um tipo de cursor que mede execute, executemany e copy_expert.
+    """
+    with _instrumented_lock:
+        if base not in _instrumented_classes:
+            _instrumented_classes[base] = type(f"Instrumented{base.__name__}", (base,), {
+                "execute": _timed(base.execute),
+                "executemany": _timed(base.executemany),
+                "copy_expert": _timed(base.copy_expert),
+            })
+        return _instrumented_classes[base]
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """
+    Conexão cujos cursores, de qualquer tipo, registram cada comando em `metrics`.
+    """
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = instrumented_cursor(base)
+        return super().cursor(*args, **kwargs)
+
+
+def _label(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+def _histogram_lines(nome, rotulos, histograma):
+    linhas = []
+    acumulado = 0
+    for limite, contagem in zip(BUCKETS + (float("inf"),), histograma.contagens):
+        acumulado += contagem
+        le = "+Inf" if limite == float("inf") else repr(limite)
+        linhas.append(f'{nome}_bucket{{{rotulos}{"," if rotulos else ""}le="{le}"}} {acumulado}')
+    chaves = f"{{{rotulos}}}" if rotulos else ""
+    linhas.append(f"{nome}_sum{chaves} {histograma.soma}")
+    linhas.append(f"{nome}_count{chaves} {histograma.total}")
+    return linhas
+
+
+def render_prometheus(pool_stats=None, journal_stats=None, routing_stats=None):
+    """
+    Métricas no formato texto de exposição do Prometheus.
+    """
+    with metrics._lock:
+        comandos = {k: (v["latencia"], v["linhas"], v["lentos"]) for k, v in metrics.comandos.items()}
+        paginas = dict(metrics.paginas)
+        espera = metrics.espera_conexao
+
+        linhas = ["# HELP medtrack_statement_duration_seconds Latência dos comandos SQL.",
+                  "# TYPE medtrack_statement_duration_seconds histogram"]
+        for sql, (histograma, _, _) in comandos.items():
+            linhas += _histogram_lines("medtrack_statement_duration_seconds", f'statement="{_label(sql)}"', histograma)
+        linhas += ["# HELP medtrack_statement_rows_total Linhas retornadas ou afetadas pelos comandos SQL.",
+                   "# TYPE medtrack_statement_rows_total counter"]
+        linhas += [f'medtrack_statement_rows_total{{statement="{_label(sql)}"}} {n}'
+                   for sql, (_, n, _) in comandos.items()]
+        linhas += ["# HELP medtrack_slow_statements_total Comandos acima do limite de consulta lenta.",
+                   "# TYPE medtrack_slow_statements_total counter"]
+        linhas += [f'medtrack_slow_statements_total{{statement="{_label(sql)}"}} {n}'
+                   for sql, (_, _, n) in comandos.items()]
+        linhas += ["# HELP medtrack_page_duration_seconds Tempo de renderização das páginas.",
+                   "# TYPE medtrack_page_duration_seconds histogram"]
+        for pagina, histograma in paginas.items():
+            linhas += _histogram_lines("medtrack_page_duration_seconds", f'page="{_label(pagina)}"', histograma)
+        linhas += ["# HELP medtrack_pool_wait_seconds Tempo para obter uma conexão do pool.",
+                   "# TYPE medtrack_pool_wait_seconds histogram"]
+        linhas += _histogram_lines("medtrack_pool_wait_seconds", "", espera)
+
+    for chave, valor in (pool_stats or {}).items():
+        linhas += [f"# TYPE medtrack_pool_{chave} gauge", f"medtrack_pool_{chave} {valor}"]
+    for chave, valor in (journal_stats or {}).items():
+        if isinstance(valor, (int, float)):
+            linhas += [f"# TYPE medtrack_journal_{chave} gauge", f"medtrack_journal_{chave} {valor}"]
+    if routing_stats:
+        linhas += ["# HELP medtrack_primary_reads_total Leituras roteáveis atendidas pelo primário.",
+                   "# TYPE medtrack_primary_reads_total counter",
+                   f"medtrack_primary_reads_total {routing_stats['primary_reads']}"]
+        for nome, descricao, tipo in (("lag_seconds", "Atraso de replicação medido.", "gauge"),
+                                      ("lag_bytes", "Bytes de WAL do primário ainda não aplicados.", "gauge"),
+                                      ("available", "Réplica no rodízio de leituras (1) ou fora (0).", "gauge"),
+                                      ("reads", "Leituras atendidas pela réplica.", "counter")):
+            linhas += [f"# HELP medtrack_replica_{nome} {descricao}", f"# TYPE medtrack_replica_{nome} {tipo}"]
+            linhas += [f'medtrack_replica_{nome}{{replica="{_label(r["replica"])}"}} {float(r[nome])}'
+                       for r in routing_stats["replicas"] if r[nome] is not None]
+    return "\n".join(linhas) + "\n"
+
+
+def _pool_stats():
+    from db import get_pool
+
+    return get_pool().stats()
+
+
+def _routing_stats():
+    from db import routing_stats
+
+    return routing_stats()
+
+
+def _journal_stats():
+    """
+    Situação da fila de escritas adiadas, se ativa.
+    """
+    from fila_escritas import ESCRITA_ADIADA, journal_stats
+
+    return journal_stats() if ESCRITA_ADIADA else None
+
+
+def write_prometheus(caminho=PROMETHEUS_FILE):
+    """
+    Grava as métricas em `caminho`, substituindo o arquivo de uma só vez.
+    """
+    caminho = Path(caminho)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(caminho.suffix + ".tmp")
+    temporario.write_text(render_prometheus(_pool_stats(), _journal_stats(), _routing_stats()), encoding="utf-8")
+    temporario.replace(caminho)
+    return caminho
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        corpo = render_prometheus(_pool_stats(), _journal_stats(), _routing_stats()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def start_metrics_server(porta=METRICS_PORT, endereco=METRICS_HOST):
+    """
+    Inicia, uma vez por processo, o endpoint /metrics no endereço e na porta informados (porta 0 desativa).
+    """
+    global _servidor
+    if not porta:
+        return None
+    with _servidor_lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer((endereco, porta), _MetricsHandler)
+            except OSError as e:
+                print(f"Erro ao iniciar o endpoint de métricas em {endereco}:{porta}: {e}")
+                return None
+            threading.Thread(target=_servidor.serve_forever, name="medtrack-metrics", daemon=True).start()
+    return _servidor
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 1)
+
+
+def metrics_page():
+    """
+    Página de métricas, restrita ao administrador.
+    """
+    import pandas as pd
+    import streamlit as st
+
+    st.subheader("Métricas de Desempenho")
+    st.caption(f"Desde {metrics.iniciado_em:%d/%m/%Y %H:%M:%S} | consultas lentas: acima de {SLOW_QUERY_MS:.0f} ms")
+
+    with metrics._lock:
+        comandos = [
+            {"Comando": sql, "Execuções": v["latencia"].total, "Total (ms)": _ms(v["latencia"].soma),
+             "Média (ms)": _ms(v["latencia"].soma / v["latencia"].total) if v["latencia"].total else None,
+             "p50 (ms)": _ms(v["latencia"].quantile(0.5)), "p95 (ms)": _ms(v["latencia"].quantile(0.95)),
+             "p99 (ms)": _ms(v["latencia"].quantile(0.99)), "Linhas": v["linhas"], "Lentos": v["lentos"]}
+            for sql, v in metrics.comandos.items()
+        ]
+        paginas = [
+            {"Página": pagina, "Renderizações": h.total, "Média (ms)": _ms(h.soma / h.total) if h.total else None,
+             "p50 (ms)": _ms(h.quantile(0.5)), "p95 (ms)": _ms(h.quantile(0.95)),
+             "Comandos por renderização": round(metrics.comandos_por_pagina.get(pagina, 0) / h.total, 1) if h.total else None}
+            for pagina, h in metrics.paginas.items()
+        ]
+        espera = metrics.espera_conexao
+        lentos = [
+            {"Quando": quando, "Página": pagina or "-", "Duração (ms)": _ms(segundos), "Comando": sql}
+            for quando, pagina, segundos, sql in reversed(metrics.lentos)
+        ]
+
+    col1, col2, col3, col4 = st.columns(4)
+    estatisticas = _pool_stats()
+    col1.metric("Conexões em uso", f"{estatisticas['in_use']}/{estatisticas['max_size']}")
+    col2.metric("Espera p95 (ms)", _ms(espera.quantile(0.95)) or 0)
+    col3.metric("Esperas por conexão", estatisticas["waits"])
+    col4.metric("Tempo esgotado", estatisticas["timeouts"])
+
+    roteamento = _routing_stats()
+    if roteamento["replicas"]:
+        st.write(f"**Réplicas de leitura** (leituras no primário: {roteamento['primary_reads']})")
+        st.dataframe(pd.DataFrame([
+            {"Réplica": r["replica"], "No rodízio": r["available"], "Atraso (s)": r["lag_seconds"],
+             "Atraso (bytes)": r["lag_bytes"],
+             "Leituras": r["reads"], "Erro": r["error"] or ""}
+            for r in roteamento["replicas"]
+        ]), hide_index=True)
+
+    fila = _journal_stats()
+    if fila is not None:
+        st.write("**Fila de escritas adiadas**")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Na fila", fila["depth"])
+        col2.metric("Atraso (s)", round(fila["lag_seconds"], 1))
+        col3.metric("Enviadas", fila["sent"])
+        col4.metric("Rejeitadas", fila["rejected"])
+        if fila["last_error"]:
+            st.caption(f"Último erro de envio: {fila['last_error']}")
+
+    st.write("**Páginas**")
+    if paginas:
+        st.dataframe(pd.DataFrame(paginas), hide_index=True)
+    st.write("**Comandos SQL** (ordenados pelo tempo total)")
+    if comandos:
+        st.dataframe(pd.DataFrame(comandos).sort_values("Total (ms)", ascending=False), hide_index=True)
+    st.write("**Consultas lentas**")
+    if lentos:
+        st.dataframe(pd.DataFrame(lentos), hide_index=True)
+    else:
+        st.caption("Nenhuma consulta lenta registrada.")
+
+    col_exportar, col_zerar = st.columns(2)
+    with col_exportar:
+        if st.button("Exportar para Prometheus", key="metricas_exportar"):
+            st.success(f"Métricas gravadas em {write_prometheus()}.")
+    with col_zerar:
+        if st.button("Zerar métricas", key="metricas_zerar"):
+            metrics.reset()
+            st.rerun()
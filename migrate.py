@@ -0,0 +1,116 @@
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from db import get_connection
+
+
+MIGRATIONS_DIR = Path(__file__).with_name("migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# Chave arbitrária para impedir que dois processos migrem ao mesmo tempo
+MIGRATION_LOCK_ID = 7_341_001
+
+
+def list_migrations():
+    """
+    Lista as migrações disponíveis como tuplas (versão, nome, caminho), em ordem.
+    """
+    migracoes = []
+    for caminho in MIGRATIONS_DIR.glob("*.sql"):
+        match = MIGRATION_FILE.match(caminho.name)
+        if match:
+            migracoes.append((int(match.group(1)), match.group(2), caminho))
+    migracoes.sort()
+
+    versoes = [versao for versao, _, _ in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise ValueError("Existem migrações com a mesma versão.")
+    return migracoes
+
+
+def applied_versions(conn):
+    """
+    Retorna o conjunto de versões já aplicadas, criando a tabela de controle se preciso.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                versao INTEGER PRIMARY KEY,
+                nome TEXT NOT NULL,
+                aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """
+        )
+        cursor.execute("SELECT versao FROM schema_migrations;")
+        versoes = {row['versao'] for row in cursor.fetchall()}
+    conn.commit()
+    return versoes
+
+
+def migrate(conn, target=None, verbose=True):
+    """
+    Aplica as migrações pendentes até `target` (ou todas), cada uma em sua transação.
+    Retorna a lista de versões aplicadas.
+    """
+    aplicadas = []
+    ja_aplicadas = applied_versions(conn)
+    for versao, nome, caminho in list_migrations():
+        if target is not None and versao > target:
+            break
+        if versao in ja_aplicadas:
+            continue
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+                # Outro processo pode ter aplicado a migração enquanto esperávamos o lock
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE versao = %s;", (versao,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    continue
+                cursor.execute(caminho.read_text(encoding="utf-8"))
+                cursor.execute(
+                    "INSERT INTO schema_migrations (versao, nome) VALUES (%s, %s);",
+                    (versao, nome)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(versao)
+        if verbose:
+            print(f"Migração {versao:04d} ({nome}) aplicada.")
+    return aplicadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica as migrações do banco do MedTrack.")
+    parser.add_argument("--target", type=int, help="Versão máxima a aplicar.")
+    parser.add_argument("--list", action="store_true", help="Apenas lista as migrações e seu estado.")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        if args.list:
+            ja_aplicadas = applied_versions(conn)
+            for versao, nome, _ in list_migrations():
+                estado = "aplicada" if versao in ja_aplicadas else "pendente"
+                print(f"{versao:04d} {nome}: {estado}")
+        else:
+            aplicadas = migrate(conn, args.target)
+            if not aplicadas:
+                print("Banco de dados já está atualizado.")
+    except Exception as e:
+        print(f"Erro ao aplicar migrações: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+-- Tabelas principais do MedTrack.
+-- Usa IF NOT EXISTS para adotar bancos criados antes das migrações.
+
+CREATE TABLE IF NOT EXISTS pacientes (
+    id SERIAL PRIMARY KEY,
+    nome TEXT NOT NULL,
+    idade INTEGER,
+    sexo TEXT,
+    altura NUMERIC(5, 1),
+    peso NUMERIC(5, 1)
+);
+
+CREATE TABLE IF NOT EXISTS medicamentos (
+    id SERIAL PRIMARY KEY,
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    nome TEXT NOT NULL,
+    frequencia INTEGER NOT NULL DEFAULT 1,
+    categoria TEXT,
+    observacoes TEXT
+);
+
+CREATE TABLE IF NOT EXISTS diario (
+    id SERIAL PRIMARY KEY,
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    hora TIME NOT NULL,
+    tipo TEXT NOT NULL,
+    detalhes TEXT
+);
+
+CREATE TABLE IF NOT EXISTS doses_tomadas (
+    id SERIAL PRIMARY KEY,
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    medicamento_id INTEGER NOT NULL REFERENCES medicamentos (id) ON DELETE CASCADE,
+    dose INTEGER NOT NULL,
+    data_hora TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,20 @@
+-- Índices compostos para os caminhos de acesso usados pelas páginas.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Listagem paginada por (nome, id) e busca por prefixo ou trecho do nome
+CREATE INDEX IF NOT EXISTS pacientes_nome_id_idx ON pacientes (nome, id);
+CREATE INDEX IF NOT EXISTS pacientes_nome_trgm_idx ON pacientes USING gin (nome gin_trgm_ops);
+
+-- medicamentos WHERE paciente_id
+CREATE INDEX IF NOT EXISTS medicamentos_paciente_idx ON medicamentos (paciente_id);
+
+-- diario WHERE paciente_id AND data ORDER BY data, hora
+CREATE INDEX IF NOT EXISTS diario_paciente_data_hora_idx ON diario (paciente_id, data, hora);
+
+-- doses_tomadas WHERE paciente_id AND medicamento_id AND dose
+CREATE INDEX IF NOT EXISTS doses_tomadas_paciente_medicamento_dose_idx
+    ON doses_tomadas (paciente_id, medicamento_id, dose);
+
+-- Remoção em cascata a partir de medicamentos
+CREATE INDEX IF NOT EXISTS doses_tomadas_medicamento_idx ON doses_tomadas (medicamento_id);
@@ -0,0 +1,3 @@
+-- Doses confirmadas de um paciente em um dia (estado do Diário Diário)
+
+CREATE INDEX IF NOT EXISTS doses_tomadas_paciente_data_hora_idx ON doses_tomadas (paciente_id, data_hora);
@@ -0,0 +1,8 @@
+-- Valores tipados de cada registro do diário (sinais vitais, líquidos, dor...),
+-- com as chaves definidas em diario_valores.CAMPOS_POR_TIPO.
+-- Registros antigos são preenchidos por backfill_valores.py.
+
+ALTER TABLE diario ADD COLUMN IF NOT EXISTS valores JSONB;
+
+-- Localiza rapidamente os registros que ainda não passaram pelo backfill
+CREATE INDEX IF NOT EXISTS diario_sem_valores_idx ON diario (id) WHERE valores IS NULL;
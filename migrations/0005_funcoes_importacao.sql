@@ -0,0 +1,30 @@
+-- Conversões que devolvem NULL em vez de erro, usadas pela validação em
+-- lote de importacao.py. Só são chamadas em valores que já passaram por
+-- uma expressão regular, então o bloco EXCEPTION raramente é acionado.
+
+CREATE OR REPLACE FUNCTION tenta_converter_data(valor TEXT) RETURNS DATE
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN valor::date;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION tenta_converter_hora(valor TEXT) RETURNS TIME
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN valor::time;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION tenta_converter_timestamp(valor TEXT) RETURNS TIMESTAMP
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN valor::timestamp;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
@@ -0,0 +1,102 @@
+-- Adesão à medicação: doses esperadas x tomadas por medicamento e dia.
+-- adesao_diaria é mantida por adesao.refresh_adherence(): dias novos são
+-- calculados uma vez e, depois disso, só os dias marcados em adesao_pendente
+-- (por gatilhos em doses_tomadas e medicamentos) são recalculados.
+
+-- Dias anteriores à prescrição não contam como doses perdidas
+ALTER TABLE medicamentos ADD COLUMN IF NOT EXISTS criado_em TIMESTAMP;
+UPDATE medicamentos m
+SET criado_em = coalesce((SELECT min(t.data_hora) FROM doses_tomadas t WHERE t.medicamento_id = m.id), now())
+WHERE m.criado_em IS NULL;
+ALTER TABLE medicamentos ALTER COLUMN criado_em SET DEFAULT now();
+ALTER TABLE medicamentos ALTER COLUMN criado_em SET NOT NULL;
+
+CREATE TABLE IF NOT EXISTS adesao_diaria (
+    medicamento_id INTEGER NOT NULL REFERENCES medicamentos (id) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    esperadas INTEGER NOT NULL,
+    tomadas INTEGER NOT NULL,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (medicamento_id, data)
+);
+CREATE INDEX IF NOT EXISTS adesao_diaria_data_paciente_idx ON adesao_diaria (data, paciente_id);
+CREATE INDEX IF NOT EXISTS adesao_diaria_paciente_data_idx ON adesao_diaria (paciente_id, data);
+
+-- Recalcular um dia lê as doses do medicamento naquele dia; substitui o índice só por medicamento
+CREATE INDEX IF NOT EXISTS doses_tomadas_medicamento_data_hora_idx ON doses_tomadas (medicamento_id, data_hora);
+DROP INDEX IF EXISTS doses_tomadas_medicamento_idx;
+
+-- Dias cujas doses mudaram depois de calculados (sem FK: pode citar medicamentos já removidos).
+-- A versão muda a cada nova marcação, então o recálculo só remove as marcações que leu.
+CREATE SEQUENCE IF NOT EXISTS adesao_pendente_versao_seq;
+CREATE TABLE IF NOT EXISTS adesao_pendente (
+    medicamento_id INTEGER NOT NULL,
+    data DATE NOT NULL,
+    versao BIGINT NOT NULL DEFAULT nextval('adesao_pendente_versao_seq'),
+    PRIMARY KEY (medicamento_id, data)
+);
+
+-- Último dia já calculado para todos os medicamentos
+CREATE TABLE IF NOT EXISTS adesao_controle (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    calculado_ate DATE
+);
+INSERT INTO adesao_controle (id, calculado_ate) VALUES (TRUE, NULL) ON CONFLICT DO NOTHING;
+
+-- Gatilhos por comando (com tabelas de transição) para que importações em massa
+-- gerem uma única inserção em adesao_pendente
+CREATE OR REPLACE FUNCTION adesao_marcar_doses_novas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO adesao_pendente (medicamento_id, data)
+    SELECT DISTINCT medicamento_id, data_hora::date FROM novas
+    ON CONFLICT (medicamento_id, data) DO UPDATE SET versao = EXCLUDED.versao;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION adesao_marcar_doses_antigas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO adesao_pendente (medicamento_id, data)
+    SELECT DISTINCT medicamento_id, data_hora::date FROM antigas
+    ON CONFLICT (medicamento_id, data) DO UPDATE SET versao = EXCLUDED.versao;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS adesao_doses_insert ON doses_tomadas;
+CREATE TRIGGER adesao_doses_insert AFTER INSERT ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_novas();
+
+DROP TRIGGER IF EXISTS adesao_doses_update_novas ON doses_tomadas;
+CREATE TRIGGER adesao_doses_update_novas AFTER UPDATE ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_novas();
+
+DROP TRIGGER IF EXISTS adesao_doses_update_antigas ON doses_tomadas;
+CREATE TRIGGER adesao_doses_update_antigas AFTER UPDATE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_antigas();
+
+DROP TRIGGER IF EXISTS adesao_doses_delete ON doses_tomadas;
+CREATE TRIGGER adesao_doses_delete AFTER DELETE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_antigas();
+
+-- Medicamento novo ou com frequência alterada: recalcula o dia corrente
+CREATE OR REPLACE FUNCTION adesao_marcar_medicamento() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO adesao_pendente (medicamento_id, data)
+    VALUES (NEW.id, current_date)
+    ON CONFLICT (medicamento_id, data) DO UPDATE SET versao = EXCLUDED.versao;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS adesao_medicamentos ON medicamentos;
+CREATE TRIGGER adesao_medicamentos AFTER INSERT OR UPDATE OF frequencia ON medicamentos
+    FOR EACH ROW EXECUTE FUNCTION adesao_marcar_medicamento();
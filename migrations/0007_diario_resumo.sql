@@ -0,0 +1,168 @@
+-- Resumo do diário por paciente e dia, lido pelas visões de dia e de período
+-- no lugar dos registros brutos. Mantido pelos gatilhos abaixo a cada gravação
+-- ou remoção no diário; `python diario_resumo.py` o reconstrói por completo.
+
+CREATE TABLE IF NOT EXISTS diario_resumo (
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    registros INTEGER NOT NULL DEFAULT 0,
+    entrada_ml FLOAT8 NOT NULL DEFAULT 0,
+    saida_ml FLOAT8 NOT NULL DEFAULT 0,
+    refeicoes INTEGER NOT NULL DEFAULT 0,
+    -- Ocorrências por subtipo, por exemplo {"Dor": 2, "Febre": 1}
+    ocorrencias JSONB NOT NULL DEFAULT '{}',
+    dor_max FLOAT8,
+    dor_soma FLOAT8 NOT NULL DEFAULT 0,
+    dor_n INTEGER NOT NULL DEFAULT 0,
+    o2_min FLOAT8,
+    o2_max FLOAT8,
+    o2_soma FLOAT8 NOT NULL DEFAULT 0,
+    o2_n INTEGER NOT NULL DEFAULT 0,
+    pa_sistolica_min FLOAT8,
+    pa_sistolica_max FLOAT8,
+    pa_sistolica_soma FLOAT8 NOT NULL DEFAULT 0,
+    pa_sistolica_n INTEGER NOT NULL DEFAULT 0,
+    pa_diastolica_min FLOAT8,
+    pa_diastolica_max FLOAT8,
+    pa_diastolica_soma FLOAT8 NOT NULL DEFAULT 0,
+    pa_diastolica_n INTEGER NOT NULL DEFAULT 0,
+    fc_min FLOAT8,
+    fc_max FLOAT8,
+    fc_soma FLOAT8 NOT NULL DEFAULT 0,
+    fc_n INTEGER NOT NULL DEFAULT 0,
+    temperatura_min FLOAT8,
+    temperatura_max FLOAT8,
+    temperatura_soma FLOAT8 NOT NULL DEFAULT 0,
+    temperatura_n INTEGER NOT NULL DEFAULT 0,
+    glicemia_min FLOAT8,
+    glicemia_max FLOAT8,
+    glicemia_soma FLOAT8 NOT NULL DEFAULT 0,
+    glicemia_n INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (paciente_id, data)
+);
+
+-- Recalcula os dias informados a partir do diário; dias sem registros são removidos.
+-- As linhas de resumo são travadas antes da leitura, de modo que gravações
+-- concorrentes no mesmo dia recalculam em sequência e a última vê todos os registros.
+CREATE OR REPLACE FUNCTION diario_resumo_recalcular(pacientes INTEGER[], datas DATE[]) RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO diario_resumo (paciente_id, data)
+    SELECT DISTINCT k.paciente_id, k.data
+    FROM unnest(pacientes, datas) AS k (paciente_id, data)
+    JOIN pacientes p ON p.id = k.paciente_id
+    ORDER BY 1, 2
+    ON CONFLICT DO NOTHING;
+
+    PERFORM 1
+    FROM diario_resumo r
+    JOIN unnest(pacientes, datas) AS k (paciente_id, data)
+      ON r.paciente_id = k.paciente_id AND r.data = k.data
+    ORDER BY r.paciente_id, r.data
+    FOR UPDATE OF r;
+
+    INSERT INTO diario_resumo AS r (
+        paciente_id, data, registros, entrada_ml, saida_ml, refeicoes, ocorrencias,
+        dor_max, dor_soma, dor_n,
+        o2_min, o2_max, o2_soma, o2_n, pa_sistolica_min, pa_sistolica_max, pa_sistolica_soma, pa_sistolica_n, pa_diastolica_min, pa_diastolica_max, pa_diastolica_soma, pa_diastolica_n, fc_min, fc_max, fc_soma, fc_n, temperatura_min, temperatura_max, temperatura_soma, temperatura_n, glicemia_min, glicemia_max, glicemia_soma, glicemia_n
+    )
+    SELECT d.paciente_id, d.data, count(*),
+           coalesce(sum((d.valores->>'quantidade_ml')::float8) FILTER (WHERE d.tipo = 'Líquidos'), 0),
+           coalesce(sum((d.valores->>'quantidade')::float8)
+                    FILTER (WHERE d.tipo = 'Fisiologia' AND d.valores->>'subtipo' = 'Urina'), 0),
+           count(*) FILTER (WHERE d.tipo = 'Alimentação'),
+           coalesce((SELECT jsonb_object_agg(o.subtipo, o.n)
+                     FROM (SELECT coalesce(o.valores->>'subtipo', 'Outro') AS subtipo, count(*) AS n
+                           FROM diario o
+                           WHERE o.paciente_id = d.paciente_id AND o.data = d.data AND o.tipo = 'Ocorrência'
+                           GROUP BY 1) o), '{}'),
+           max((d.valores->>'intensidade')::float8) FILTER (WHERE d.tipo = 'Ocorrência' AND d.valores->>'subtipo' = 'Dor'),
+           coalesce(sum((d.valores->>'intensidade')::float8) FILTER (WHERE d.tipo = 'Ocorrência' AND d.valores->>'subtipo' = 'Dor'), 0),
+           count(d.valores->>'intensidade') FILTER (WHERE d.tipo = 'Ocorrência' AND d.valores->>'subtipo' = 'Dor'),
+               min((d.valores->>'o2')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'o2')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'o2')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'o2') FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               min((d.valores->>'pa_sistolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'pa_sistolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'pa_sistolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'pa_sistolica') FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               min((d.valores->>'pa_diastolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'pa_diastolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'pa_diastolica')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'pa_diastolica') FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               min((d.valores->>'fc')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'fc')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'fc')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'fc') FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               min((d.valores->>'temperatura')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'temperatura')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'temperatura')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'temperatura') FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               min((d.valores->>'glicemia')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               max((d.valores->>'glicemia')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'),
+               coalesce(sum((d.valores->>'glicemia')::float8) FILTER (WHERE d.tipo = 'Sinais Vitais'), 0),
+               count(d.valores->>'glicemia') FILTER (WHERE d.tipo = 'Sinais Vitais')
+    FROM diario d
+    JOIN (SELECT DISTINCT * FROM unnest(pacientes, datas)) AS k (paciente_id, data)
+      ON d.paciente_id = k.paciente_id AND d.data = k.data
+    GROUP BY d.paciente_id, d.data
+    ON CONFLICT (paciente_id, data) DO UPDATE
+        SET registros = EXCLUDED.registros, entrada_ml = EXCLUDED.entrada_ml, saida_ml = EXCLUDED.saida_ml,
+            refeicoes = EXCLUDED.refeicoes, ocorrencias = EXCLUDED.ocorrencias,
+            dor_max = EXCLUDED.dor_max, dor_soma = EXCLUDED.dor_soma, dor_n = EXCLUDED.dor_n,
+            o2_min = EXCLUDED.o2_min, o2_max = EXCLUDED.o2_max, o2_soma = EXCLUDED.o2_soma, o2_n = EXCLUDED.o2_n,
+            pa_sistolica_min = EXCLUDED.pa_sistolica_min, pa_sistolica_max = EXCLUDED.pa_sistolica_max, pa_sistolica_soma = EXCLUDED.pa_sistolica_soma, pa_sistolica_n = EXCLUDED.pa_sistolica_n,
+            pa_diastolica_min = EXCLUDED.pa_diastolica_min, pa_diastolica_max = EXCLUDED.pa_diastolica_max, pa_diastolica_soma = EXCLUDED.pa_diastolica_soma, pa_diastolica_n = EXCLUDED.pa_diastolica_n,
+            fc_min = EXCLUDED.fc_min, fc_max = EXCLUDED.fc_max, fc_soma = EXCLUDED.fc_soma, fc_n = EXCLUDED.fc_n,
+            temperatura_min = EXCLUDED.temperatura_min, temperatura_max = EXCLUDED.temperatura_max, temperatura_soma = EXCLUDED.temperatura_soma, temperatura_n = EXCLUDED.temperatura_n,
+            glicemia_min = EXCLUDED.glicemia_min, glicemia_max = EXCLUDED.glicemia_max, glicemia_soma = EXCLUDED.glicemia_soma, glicemia_n = EXCLUDED.glicemia_n,
+            atualizado_em = now();
+
+    DELETE FROM diario_resumo r
+    USING unnest(pacientes, datas) AS k (paciente_id, data)
+    WHERE r.paciente_id = k.paciente_id AND r.data = k.data
+      AND NOT EXISTS (SELECT 1 FROM diario d WHERE d.paciente_id = r.paciente_id AND d.data = r.data);
+END;
+$$;
+
+-- Gatilhos por comando (com tabelas de transição): uma importação em massa
+-- recalcula cada dia afetado uma única vez
+CREATE OR REPLACE FUNCTION diario_resumo_novos() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM diario_resumo_recalcular(array_agg(paciente_id), array_agg(data))
+    FROM (SELECT DISTINCT paciente_id, data FROM novos) k;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION diario_resumo_antigos() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM diario_resumo_recalcular(array_agg(paciente_id), array_agg(data))
+    FROM (SELECT DISTINCT paciente_id, data FROM antigos) k;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS diario_resumo_insert ON diario;
+CREATE TRIGGER diario_resumo_insert AFTER INSERT ON diario
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_novos();
+
+DROP TRIGGER IF EXISTS diario_resumo_update_novos ON diario;
+CREATE TRIGGER diario_resumo_update_novos AFTER UPDATE ON diario
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_novos();
+
+DROP TRIGGER IF EXISTS diario_resumo_update_antigos ON diario;
+CREATE TRIGGER diario_resumo_update_antigos AFTER UPDATE ON diario
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_antigos();
+
+DROP TRIGGER IF EXISTS diario_resumo_delete ON diario;
+CREATE TRIGGER diario_resumo_delete AFTER DELETE ON diario
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_antigos();
@@ -0,0 +1,135 @@
+-- Particionamento mensal de diario (por data) e doses_tomadas (por data_hora).
+--
+-- As consultas sempre filtram por paciente e data, então cada uma lê só as
+-- partições do período. Cada tabela tem uma partição padrão que recebe
+-- registros de meses ainda sem partição; criar_particao_mensal() move esses
+-- registros para a partição do mês quando ela é criada. As partições futuras
+-- são criadas por particoes.py, e as antigas são arquivadas em Parquet.
+
+CREATE OR REPLACE FUNCTION criar_particao_mensal(tabela TEXT, coluna TEXT, mes DATE) RETURNS BOOLEAN
+LANGUAGE plpgsql AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fim DATE := (date_trunc('month', mes) + interval '1 month')::date;
+    particao TEXT := tabela || '_' || to_char(mes, 'YYYY_MM');
+BEGIN
+    IF to_regclass(particao) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', particao, tabela);
+    EXECUTE format(
+        'WITH movidos AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM movidos',
+        tabela || '_padrao', coluna, inicio, coluna, fim, particao
+    );
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', tabela, particao, inicio, fim);
+    RETURN TRUE;
+END;
+$$;
+
+-- Cria as partições de todos os meses entre `inicio` e `fim`; retorna quantas foram criadas
+CREATE OR REPLACE FUNCTION criar_particoes_mensais(tabela TEXT, coluna TEXT, inicio DATE, fim DATE) RETURNS INTEGER
+LANGUAGE sql AS $$
+    SELECT count(*) FILTER (WHERE criar_particao_mensal(tabela, coluna, mes::date))::integer
+    FROM generate_series(date_trunc('month', inicio), date_trunc('month', fim), interval '1 month') AS mes;
+$$;
+
+-- diario ------------------------------------------------------------------
+
+ALTER SEQUENCE diario_id_seq OWNED BY NONE;
+ALTER TABLE diario RENAME TO diario_nao_particionado;
+ALTER TABLE diario_nao_particionado RENAME CONSTRAINT diario_pkey TO diario_nao_particionado_pkey;
+DROP INDEX IF EXISTS diario_paciente_data_hora_idx;
+DROP INDEX IF EXISTS diario_sem_valores_idx;
+
+CREATE TABLE diario (
+    id INTEGER NOT NULL DEFAULT nextval('diario_id_seq'),
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    hora TIME NOT NULL,
+    tipo TEXT NOT NULL,
+    detalhes TEXT,
+    valores JSONB,
+    PRIMARY KEY (id, data)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE diario_padrao PARTITION OF diario DEFAULT;
+
+SELECT criar_particoes_mensais(
+    'diario', 'data',
+    coalesce((SELECT min(data) FROM diario_nao_particionado), current_date),
+    (current_date + interval '3 months')::date
+);
+
+INSERT INTO diario (id, paciente_id, data, hora, tipo, detalhes, valores)
+SELECT id, paciente_id, data, hora, tipo, detalhes, valores FROM diario_nao_particionado;
+
+DROP TABLE diario_nao_particionado;
+ALTER SEQUENCE diario_id_seq OWNED BY diario.id;
+
+CREATE INDEX diario_paciente_data_hora_idx ON diario (paciente_id, data, hora);
+CREATE INDEX diario_sem_valores_idx ON diario (id) WHERE valores IS NULL;
+
+-- doses_tomadas -----------------------------------------------------------
+
+ALTER SEQUENCE doses_tomadas_id_seq OWNED BY NONE;
+ALTER TABLE doses_tomadas RENAME TO doses_tomadas_nao_particionado;
+ALTER TABLE doses_tomadas_nao_particionado RENAME CONSTRAINT doses_tomadas_pkey TO doses_tomadas_nao_particionado_pkey;
+DROP INDEX IF EXISTS doses_tomadas_paciente_medicamento_dose_idx;
+DROP INDEX IF EXISTS doses_tomadas_paciente_data_hora_idx;
+DROP INDEX IF EXISTS doses_tomadas_medicamento_data_hora_idx;
+
+CREATE TABLE doses_tomadas (
+    id INTEGER NOT NULL DEFAULT nextval('doses_tomadas_id_seq'),
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    medicamento_id INTEGER NOT NULL REFERENCES medicamentos (id) ON DELETE CASCADE,
+    dose INTEGER NOT NULL,
+    data_hora TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, data_hora)
+) PARTITION BY RANGE (data_hora);
+
+CREATE TABLE doses_tomadas_padrao PARTITION OF doses_tomadas DEFAULT;
+
+SELECT criar_particoes_mensais(
+    'doses_tomadas', 'data_hora',
+    coalesce((SELECT min(data_hora)::date FROM doses_tomadas_nao_particionado), current_date),
+    (current_date + interval '3 months')::date
+);
+
+INSERT INTO doses_tomadas (id, paciente_id, medicamento_id, dose, data_hora)
+SELECT id, paciente_id, medicamento_id, dose, data_hora FROM doses_tomadas_nao_particionado;
+
+DROP TABLE doses_tomadas_nao_particionado;
+ALTER SEQUENCE doses_tomadas_id_seq OWNED BY doses_tomadas.id;
+
+CREATE INDEX doses_tomadas_paciente_medicamento_dose_idx ON doses_tomadas (paciente_id, medicamento_id, dose);
+CREATE INDEX doses_tomadas_paciente_data_hora_idx ON doses_tomadas (paciente_id, data_hora);
+CREATE INDEX doses_tomadas_medicamento_data_hora_idx ON doses_tomadas (medicamento_id, data_hora);
+
+-- Gatilhos dos resumos (0006 e 0007), recriados na tabela particionada.
+-- Os dados copiados acima já estavam refletidos nos resumos.
+
+CREATE TRIGGER diario_resumo_insert AFTER INSERT ON diario
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_novos();
+CREATE TRIGGER diario_resumo_update_novos AFTER UPDATE ON diario
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_novos();
+CREATE TRIGGER diario_resumo_update_antigos AFTER UPDATE ON diario
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_antigos();
+CREATE TRIGGER diario_resumo_delete AFTER DELETE ON diario
+    REFERENCING OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_antigos();
+
+CREATE TRIGGER adesao_doses_insert AFTER INSERT ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_novas();
+CREATE TRIGGER adesao_doses_update_novas AFTER UPDATE ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_novas();
+CREATE TRIGGER adesao_doses_update_antigas AFTER UPDATE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_antigas();
+CREATE TRIGGER adesao_doses_delete AFTER DELETE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_antigas();
@@ -0,0 +1,158 @@
+-- Agenda de doses: horários previstos de cada dose, calculados a partir do
+-- horário da primeira dose e do intervalo entre doses do medicamento.
+-- agenda_doses cobre de alguns dias atrás até um horizonte móvel à frente,
+-- estendido por agenda.extend_schedule(); tomada_em é mantida por gatilhos em
+-- doses_tomadas, para que as doses pendentes da ala saiam de um único índice.
+
+ALTER TABLE medicamentos ADD COLUMN IF NOT EXISTS horario_inicio TIME NOT NULL DEFAULT '08:00';
+-- NULL distribui as doses igualmente pelo dia (24 h / frequência)
+ALTER TABLE medicamentos ADD COLUMN IF NOT EXISTS intervalo_horas NUMERIC(5, 2)
+    CHECK (intervalo_horas > 0);
+
+CREATE TABLE IF NOT EXISTS agenda_doses (
+    medicamento_id INTEGER NOT NULL REFERENCES medicamentos (id) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    dose INTEGER NOT NULL,
+    paciente_id INTEGER NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    previsto_para TIMESTAMP NOT NULL,
+    tomada_em TIMESTAMP,
+    PRIMARY KEY (medicamento_id, data, dose)
+);
+-- Doses pendentes da ala em uma janela de horário: uma varredura de intervalo neste índice
+CREATE INDEX IF NOT EXISTS agenda_doses_pendentes_idx ON agenda_doses (previsto_para)
+    INCLUDE (paciente_id, medicamento_id, dose) WHERE tomada_em IS NULL;
+CREATE INDEX IF NOT EXISTS agenda_doses_paciente_data_idx ON agenda_doses (paciente_id, data);
+
+-- Último dia já gerado para todos os medicamentos
+CREATE TABLE IF NOT EXISTS agenda_controle (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    gerado_ate DATE
+);
+INSERT INTO agenda_controle (id, gerado_ate) VALUES (TRUE, NULL) ON CONFLICT DO NOTHING;
+
+-- Gera (ou corrige) os horários de `inicio` a `fim` para os medicamentos `ids` (NULL = todos)
+CREATE OR REPLACE FUNCTION agenda_doses_gerar(inicio DATE, fim DATE, ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    gerados INTEGER;
+BEGIN
+    -- Doses além da frequência atual deixam de ser esperadas
+    DELETE FROM agenda_doses a
+    USING medicamentos m
+    WHERE a.medicamento_id = m.id AND a.data BETWEEN inicio AND fim
+      AND (ids IS NULL OR m.id = ANY (ids)) AND a.dose > m.frequencia;
+
+    INSERT INTO agenda_doses (medicamento_id, data, dose, paciente_id, previsto_para, tomada_em)
+    SELECT m.id, d.data, k.dose, m.paciente_id,
+           d.data + m.horario_inicio
+               + (k.dose - 1) * coalesce(m.intervalo_horas * interval '1 hour', interval '24 hours' / m.frequencia),
+           (SELECT min(t.data_hora) FROM doses_tomadas t
+            WHERE t.medicamento_id = m.id AND t.dose = k.dose
+              AND t.data_hora >= d.data AND t.data_hora < d.data + 1)
+    FROM medicamentos m
+    CROSS JOIN LATERAL (
+        SELECT g::date AS data FROM generate_series(greatest(inicio, m.criado_em::date), fim, interval '1 day') g
+    ) d
+    CROSS JOIN LATERAL generate_series(1, m.frequencia) AS k (dose)
+    WHERE ids IS NULL OR m.id = ANY (ids)
+    ON CONFLICT (medicamento_id, data, dose) DO UPDATE
+        SET previsto_para = EXCLUDED.previsto_para
+        WHERE agenda_doses.previsto_para IS DISTINCT FROM EXCLUDED.previsto_para;
+    GET DIAGNOSTICS gerados = ROW_COUNT;
+    RETURN gerados;
+END;
+$$;
+
+-- Recalcula tomada_em (primeira confirmação) das doses informadas
+CREATE OR REPLACE FUNCTION agenda_doses_atualizar_tomadas(medicamentos INTEGER[], datas DATE[], doses INTEGER[])
+RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE agenda_doses a
+    SET tomada_em = (SELECT min(t.data_hora) FROM doses_tomadas t
+                     WHERE t.medicamento_id = a.medicamento_id AND t.dose = a.dose
+                       AND t.data_hora >= a.data AND t.data_hora < a.data + 1)
+    FROM (SELECT DISTINCT * FROM unnest(medicamentos, datas, doses)) AS k (medicamento_id, data, dose)
+    WHERE a.medicamento_id = k.medicamento_id AND a.data = k.data AND a.dose = k.dose;
+END;
+$$;
+
+-- Gatilhos por comando (com tabelas de transição), como os de adesao e diario_resumo
+CREATE OR REPLACE FUNCTION agenda_doses_tomadas_novas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM agenda_doses_atualizar_tomadas(array_agg(medicamento_id), array_agg(data), array_agg(dose))
+    FROM (SELECT DISTINCT medicamento_id, data_hora::date AS data, dose FROM novas) k;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION agenda_doses_tomadas_antigas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM agenda_doses_atualizar_tomadas(array_agg(medicamento_id), array_agg(data), array_agg(dose))
+    FROM (SELECT DISTINCT medicamento_id, data_hora::date AS data, dose FROM antigas) k;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS agenda_doses_insert ON doses_tomadas;
+CREATE TRIGGER agenda_doses_insert AFTER INSERT ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_tomadas_novas();
+
+DROP TRIGGER IF EXISTS agenda_doses_update_novas ON doses_tomadas;
+CREATE TRIGGER agenda_doses_update_novas AFTER UPDATE ON doses_tomadas
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_tomadas_novas();
+
+DROP TRIGGER IF EXISTS agenda_doses_update_antigas ON doses_tomadas;
+CREATE TRIGGER agenda_doses_update_antigas AFTER UPDATE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_tomadas_antigas();
+
+DROP TRIGGER IF EXISTS agenda_doses_delete ON doses_tomadas;
+CREATE TRIGGER agenda_doses_delete AFTER DELETE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_tomadas_antigas();
+
+-- Medicamentos novos ou com horário, intervalo ou frequência alterados: refaz a
+-- agenda de hoje até o horizonte já gerado (os dias passados ficam como estavam).
+-- FOR SHARE espera uma extensão do horizonte em andamento (que trava a linha de
+-- agenda_controle), para que nenhum medicamento fique sem os dias novos.
+CREATE OR REPLACE FUNCTION agenda_doses_medicamentos_novos() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM agenda_doses_gerar(current_date, c.gerado_ate, ARRAY (SELECT id FROM novos))
+    FROM agenda_controle c
+    WHERE c.gerado_ate >= current_date
+    FOR SHARE OF c;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION agenda_doses_medicamentos_alterados() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM agenda_doses_gerar(current_date, c.gerado_ate, ARRAY (
+        SELECT n.id FROM novos n JOIN antigos a ON a.id = n.id
+        WHERE (n.frequencia, n.horario_inicio, n.intervalo_horas)
+              IS DISTINCT FROM (a.frequencia, a.horario_inicio, a.intervalo_horas)
+    ))
+    FROM agenda_controle c
+    WHERE c.gerado_ate >= current_date
+    FOR SHARE OF c;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS agenda_doses_medicamentos_insert ON medicamentos;
+CREATE TRIGGER agenda_doses_medicamentos_insert AFTER INSERT ON medicamentos
+    REFERENCING NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_medicamentos_novos();
+
+DROP TRIGGER IF EXISTS agenda_doses_medicamentos_update ON medicamentos;
+CREATE TRIGGER agenda_doses_medicamentos_update AFTER UPDATE ON medicamentos
+    REFERENCING NEW TABLE AS novos OLD TABLE AS antigos
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_medicamentos_alterados();
@@ -0,0 +1,10 @@
+-- Chaves de idempotência das escritas enviadas pela fila local (fila_escritas.py).
+-- Cada lote registra aqui as chaves na mesma transação dos dados, e só aplica
+-- as escritas cujas chaves ainda não existiam; reenviar um lote não duplica linhas.
+
+CREATE TABLE IF NOT EXISTS escritas_aplicadas (
+    chave UUID PRIMARY KEY,
+    aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+);
+-- Limpeza das chaves antigas (fila_escritas.prune_keys)
+CREATE INDEX IF NOT EXISTS escritas_aplicadas_aplicada_em_idx ON escritas_aplicadas (aplicada_em);
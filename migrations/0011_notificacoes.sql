@@ -0,0 +1,84 @@
+-- Notificações de alteração para as sessões abertas (notificacoes.py). Cada
+-- comando em diario, doses_tomadas, medicamentos ou pacientes emite um NOTIFY
+-- no canal medtrack_alteracoes com a tabela, os pacientes afetados e o nome da
+-- aplicação que gravou. O NOTIFY só é entregue no COMMIT, e notificações
+-- iguais na mesma transação são entregues uma vez.
+
+CREATE OR REPLACE FUNCTION notificar_alteracao(tabela TEXT, pacientes INTEGER[])
+RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF pacientes IS NULL THEN
+        RETURN;  -- Comando sem linhas afetadas
+    END IF;
+    -- A carga útil do NOTIFY é limitada a 8000 bytes: muitos pacientes (cargas e
+    -- importações) viram "todos" (null)
+    PERFORM pg_notify('medtrack_alteracoes', json_build_object(
+        'tabela', tabela,
+        'pacientes', CASE WHEN cardinality(pacientes) <= 500 THEN to_json(pacientes) END,
+        'origem', current_setting('application_name')
+    )::text);
+END;
+$$;
+
+-- Gatilhos por comando, como os de adesao e agenda_doses; TG_ARGV[0] é a coluna do paciente
+CREATE OR REPLACE FUNCTION notificar_novas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    pacientes INTEGER[];
+BEGIN
+    EXECUTE format('SELECT array_agg(DISTINCT %I) FROM novas', TG_ARGV[0]) INTO pacientes;
+    PERFORM notificar_alteracao(TG_TABLE_NAME, pacientes);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION notificar_antigas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    pacientes INTEGER[];
+BEGIN
+    EXECUTE format('SELECT array_agg(DISTINCT %I) FROM antigas', TG_ARGV[0]) INTO pacientes;
+    PERFORM notificar_alteracao(TG_TABLE_NAME, pacientes);
+    RETURN NULL;
+END;
+$$;
+
+-- Atualizações avisam os pacientes de antes e de depois (ex.: registro movido de paciente)
+CREATE OR REPLACE FUNCTION notificar_alteradas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    pacientes INTEGER[];
+BEGIN
+    EXECUTE format('SELECT array_agg(DISTINCT p) FROM (SELECT %1$I AS p FROM novas UNION SELECT %1$I FROM antigas) t',
+                   TG_ARGV[0]) INTO pacientes;
+    PERFORM notificar_alteracao(TG_TABLE_NAME, pacientes);
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    alvo RECORD;
+BEGIN
+    FOR alvo IN
+        SELECT * FROM (VALUES ('diario', 'paciente_id'), ('doses_tomadas', 'paciente_id'),
+                              ('medicamentos', 'paciente_id'), ('pacientes', 'id')) AS t (tabela, coluna)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', alvo.tabela || '_notificar_insert', alvo.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION notificar_novas(%L)',
+                       alvo.tabela || '_notificar_insert', alvo.tabela, alvo.coluna);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', alvo.tabela || '_notificar_update', alvo.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS novas OLD TABLE AS antigas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION notificar_alteradas(%L)',
+                       alvo.tabela || '_notificar_update', alvo.tabela, alvo.coluna);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', alvo.tabela || '_notificar_delete', alvo.tabela);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS antigas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION notificar_antigas(%L)',
+                       alvo.tabela || '_notificar_delete', alvo.tabela, alvo.coluna);
+    END LOOP;
+END;
+$$;
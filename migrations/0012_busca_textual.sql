@@ -0,0 +1,38 @@
+-- Busca textual em português no diário (tipo e detalhes) e nos medicamentos
+-- (nome e observações), com índices GIN sobre colunas tsvector.
+--
+-- Em diario (particionada) a coluna é mantida por um gatilho por linha, e não
+-- gerada: as partições mensais são criadas com LIKE e recebem as linhas da
+-- partição padrão com SELECT *, o que uma coluna gerada não aceitaria.
+-- Registros antigos são preenchidos por `python busca.py --preencher`.
+
+CREATE OR REPLACE FUNCTION diario_busca_vetor(tipo TEXT, detalhes TEXT) RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('portuguese', coalesce(tipo, '')), 'A')
+        || setweight(to_tsvector('portuguese', coalesce(detalhes, '')), 'B');
+$$;
+
+ALTER TABLE diario ADD COLUMN IF NOT EXISTS busca tsvector;
+
+CREATE OR REPLACE FUNCTION diario_busca_atualizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.busca := diario_busca_vetor(NEW.tipo, NEW.detalhes);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS diario_busca ON diario;
+CREATE TRIGGER diario_busca BEFORE INSERT OR UPDATE OF tipo, detalhes ON diario
+    FOR EACH ROW EXECUTE FUNCTION diario_busca_atualizar();
+
+CREATE INDEX IF NOT EXISTS diario_busca_idx ON diario USING gin (busca);
+-- Localiza os registros que ainda não passaram pelo preenchimento
+CREATE INDEX IF NOT EXISTS diario_sem_busca_idx ON diario (id) WHERE busca IS NULL;
+
+ALTER TABLE medicamentos ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('portuguese', coalesce(nome, '')), 'A')
+    || setweight(to_tsvector('portuguese', coalesce(observacoes, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS medicamentos_busca_idx ON medicamentos USING gin (busca);
@@ -0,0 +1,21 @@
+-- Um único gatilho de UPDATE no diário, com as duas tabelas de transição:
+-- recalcula uma vez a união dos dias de antes e de depois da alteração, em vez
+-- de um recálculo para os registros novos e outro para os antigos.
+
+CREATE OR REPLACE FUNCTION diario_resumo_alterados() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM diario_resumo_recalcular(array_agg(paciente_id), array_agg(data))
+    FROM (SELECT paciente_id, data FROM antigos
+          UNION
+          SELECT paciente_id, data FROM novos) k;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS diario_resumo_update_novos ON diario;
+DROP TRIGGER IF EXISTS diario_resumo_update_antigos ON diario;
+DROP TRIGGER IF EXISTS diario_resumo_update ON diario;
+CREATE TRIGGER diario_resumo_update AFTER UPDATE ON diario
+    REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+    FOR EACH STATEMENT EXECUTE FUNCTION diario_resumo_alterados();
@@ -0,0 +1,23 @@
+-- Conversões numéricas que devolvem NULL em vez de erro, como as de 0005.
+-- Valores que passam pelas expressões regulares de importacao.py ainda podem
+-- não caber na coluna (idade=99999999999 em INTEGER, altura=99999 em
+-- NUMERIC(5, 1)); com elas, a linha é rejeitada em vez de abortar a importação.
+
+CREATE OR REPLACE FUNCTION tenta_converter_inteiro(valor TEXT) RETURNS INTEGER
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN valor::integer;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+-- Medidas de pacientes (altura, peso): NUMERIC(5, 1), com vírgula ou ponto decimal
+CREATE OR REPLACE FUNCTION tenta_converter_medida(valor TEXT) RETURNS NUMERIC
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN replace(valor, ',', '.')::numeric(5, 1);
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
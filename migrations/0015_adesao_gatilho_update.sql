@@ -0,0 +1,22 @@
+-- Um único gatilho de UPDATE em doses_tomadas para a adesão, com as duas
+-- tabelas de transição: marca uma vez a união dos dias de antes e de depois
+-- da alteração, como o gatilho do resumo do diário (0013).
+
+CREATE OR REPLACE FUNCTION adesao_marcar_doses_alteradas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO adesao_pendente (medicamento_id, data)
+    SELECT medicamento_id, data_hora::date FROM antigas
+    UNION
+    SELECT medicamento_id, data_hora::date FROM novas
+    ON CONFLICT (medicamento_id, data) DO UPDATE SET versao = EXCLUDED.versao;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS adesao_doses_update_novas ON doses_tomadas;
+DROP TRIGGER IF EXISTS adesao_doses_update_antigas ON doses_tomadas;
+DROP TRIGGER IF EXISTS adesao_doses_update ON doses_tomadas;
+CREATE TRIGGER adesao_doses_update AFTER UPDATE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION adesao_marcar_doses_alteradas();
@@ -0,0 +1,21 @@
+-- Um único gatilho de UPDATE em doses_tomadas para a agenda, com as duas
+-- tabelas de transição: recalcula uma vez as doses de antes e de depois da
+-- alteração, como o gatilho do resumo do diário (0013).
+
+CREATE OR REPLACE FUNCTION agenda_doses_tomadas_alteradas() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM agenda_doses_atualizar_tomadas(array_agg(medicamento_id), array_agg(data), array_agg(dose))
+    FROM (SELECT medicamento_id, data_hora::date AS data, dose FROM antigas
+          UNION
+          SELECT medicamento_id, data_hora::date AS data, dose FROM novas) k;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS agenda_doses_update_novas ON doses_tomadas;
+DROP TRIGGER IF EXISTS agenda_doses_update_antigas ON doses_tomadas;
+DROP TRIGGER IF EXISTS agenda_doses_update ON doses_tomadas;
+CREATE TRIGGER agenda_doses_update AFTER UPDATE ON doses_tomadas
+    REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION agenda_doses_tomadas_alteradas();
@@ -0,0 +1,145 @@
+"""
+Atualização das sessões abertas a partir das notificações do banco.
+
+Os gatilhos da migração 0011 emitem um NOTIFY no canal CANAL a cada comando
+em diario, doses_tomadas, medicamentos e pacientes, com os pacientes
+afetados. Uma única thread por processo escuta o canal em uma conexão própria
+e invalida no cache só as tags da seção alterada desses pacientes.
+
+As páginas que mostram um paciente chamam `watch()`, que guarda na sessão as
+versões das tags exibidas e desenha um fragmento que as compara a cada
+NOTIFICACAO_INTERVALO segundos, sem consultar o banco. Só as sessões que
+exibem um paciente afetado reexecutam, e na reexecução só a seção invalidada
+é relida; as demais continuam vindo do cache.
+
+Gravações do próprio processo já invalidam o cache ao gravar; as notificações
+delas são ignoradas (o application_name da conexão identifica a origem).
+"""
+import json
+import os
+import select
+import threading
+import time
+
+import streamlit as st
+
+from cache import invalidate, query_cache
+from db import PROCESS_NAME, get_connection
+from metricas import metrics
+
+
+CANAL = "medtrack_alteracoes"
+NOTIFICACOES = os.environ.get("MEDTRACK_NOTIFICACOES", "1") == "1"
+NOTIFICACAO_INTERVALO = float(os.environ.get("MEDTRACK_NOTIFICACAO_INTERVALO", 2.0))
+# Espera antes de reabrir a conexão de escuta depois de uma falha
+RECONEXAO = 5.0
+
+# Tabela -> (seção das tags por paciente, tags globais afetadas)
+TABELAS = {
+    "diario": ("diario", (("busca",),)),
+    "doses_tomadas": ("doses", (("agenda",),)),
+    "medicamentos": ("medicamentos", (("agenda",), ("busca",))),
+    "pacientes": ("paciente", (("pacientes",), ("busca",))),
+}
+SECOES = ("paciente", "medicamentos", "doses", "diario")
+
+
+def apply_notification(payload, origem_local=PROCESS_NAME):
+    """
+    Invalida as tags afetadas por uma notificação. Retorna as tags invalidadas
+    (vazio para notificações do próprio processo ou de tabelas desconhecidas).
+    """
+    try:
+        dados = json.loads(payload)
+    except ValueError:
+        return []
+    if dados.get("origem") == origem_local or dados.get("tabela") not in TABELAS:
+        return []
+
+    secao, globais = TABELAS[dados["tabela"]]
+    pacientes = dados.get("pacientes")
+    if pacientes is None:
+        # Pacientes demais para a notificação: a seção inteira fica inválida
+        query_cache.invalidate_section(secao)
+        pacientes = []
+    tags = [(secao, pid) for pid in pacientes] + list(globais)
+    invalidate(*tags)
+    return tags
+
+
+def _listen():
+    conectado_antes = False
+    while True:
+        conn = get_connection()
+        if conn is None:
+            time.sleep(RECONEXAO)
+            continue
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CANAL};")
+            if conectado_antes:
+                # Notificações perdidas enquanto a conexão esteve fora
+                query_cache.clear()
+            conectado_antes = True
+
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    apply_notification(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"Erro na escuta de notificações (reconectando em {RECONEXAO:.0f}s): {e}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        time.sleep(RECONEXAO)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener():
+    """
+    Inicia, uma vez por processo, a thread que escuta as notificações do banco.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="medtrack-notificacoes", daemon=True)
+            _listener.start()
+    return _listener
+
+
+def seen(paciente_id, secoes):
+    """
+    Registra na sessão as versões das tags que um painel vai exibir; chamada
+    no início dos fragmentos, que reexecutam sem passar por `watch()`.
+    """
+    tags = [(secao, paciente_id) for secao in secoes]
+    vistas = st.session_state.setdefault("notificacoes_vistas", {})
+    vistas.update(zip(tags, query_cache.versions(tags)))
+
+
+@metrics.fragment(run_every=NOTIFICACAO_INTERVALO)
+def _watcher(paciente_id, secoes):
+    tags = [(secao, paciente_id) for secao in secoes]
+    vistas = st.session_state.get("notificacoes_vistas", {})
+    if any(vistas.get(tag) != versao for tag, versao in zip(tags, query_cache.versions(tags))):
+        st.rerun()
+
+
+def watch(paciente_id, secoes=SECOES):
+    """
+    Reexecuta a página quando outra sessão ou processo alterar as seções
+    `secoes` do paciente.
+    """
+    if not NOTIFICACOES:
+        return
+    start_listener()
+    seen(paciente_id, secoes)
+    _watcher(paciente_id, tuple(secoes))
@@ -0,0 +1,327 @@
+"""
+Manutenção das partições mensais de diario e doses_tomadas (migração 0008).
+
+- Cria com antecedência as partições dos próximos meses e as dos meses que
+  receberam registros na partição padrão (importações de dados antigos).
+- Arquiva as partições mais antigas que o período de retenção: a partição é
+  desanexada, gravada em Parquet (zstd) em ARCHIVE_DIR/<tabela>/ e removida.
+  Os arquivos continuam legíveis pela exportação e pela visualização.
+
+    python particoes.py --criar --meses 3
+    python particoes.py --arquivar --reter 24
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import psycopg2.extensions
+
+from db import connection, get_connection
+
+
+ARCHIVE_DIR = Path(os.environ.get("MEDTRACK_ARCHIVE_DIR", "arquivo"))
+MESES_A_FRENTE = int(os.environ.get("MEDTRACK_PARTICOES_A_FRENTE", 3))
+MESES_RETIDOS = int(os.environ.get("MEDTRACK_MESES_RETIDOS", 24))
+CHUNK_SIZE = 50000
+
+# Tabelas particionadas: coluna de partição e colunas arquivadas (nome, tipo, expressão SQL).
+# Os arquivos são ordenados por paciente, então as estatísticas de cada row group
+# permitem pular blocos inteiros ao filtrar por paciente.
+TABELAS = {
+    "diario": {
+        "coluna": "data",
+        "colunas": [("id", "int", "id"), ("paciente_id", "int", "paciente_id"), ("data", "date", "data"),
+                    ("hora", "time", "hora"), ("tipo", "str", "tipo"), ("detalhes", "str", "detalhes"),
+                    ("valores", "str", "valores::text")],
+        "ordem": "paciente_id, data, hora",
+    },
+    "doses_tomadas": {
+        "coluna": "data_hora",
+        "colunas": [("id", "int", "id"), ("paciente_id", "int", "paciente_id"),
+                    ("medicamento_id", "int", "medicamento_id"), ("dose", "int", "dose"),
+                    ("data_hora", "datetime", "data_hora")],
+        "ordem": "paciente_id, data_hora",
+    },
+}
+
+_garantidas = False
+_garantidas_lock = threading.Lock()
+
+
+def _month(nome, tabela):
+    """
+    Mês de uma partição ou arquivo a partir do nome (<tabela>_AAAA_MM, com um
+    sufixo _N opcional nos arquivos), ou None se não for mensal.
+    """
+    match = re.fullmatch(rf"{tabela}_(\d{{4}})_(\d{{2}})(?:_\d+)?", nome)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _next_day(dia):
+    return datetime.combine(dia + timedelta(days=1), datetime.min.time())
+
+
+def _add_months(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def ensure_partitions(conn, meses_a_frente=MESES_A_FRENTE):
+    """
+    Cria as partições do mês atual até `meses_a_frente` meses adiante e as dos
+    meses com registros na partição padrão. Retorna quantas foram criadas.
+    """
+    criadas = 0
+    with conn.cursor() as cursor:
+        for tabela, definicao in TABELAS.items():
+            coluna = definicao["coluna"]
+            cursor.execute(
+                f"""
+                SELECT criar_particoes_mensais(
+                    %(tabela)s, %(coluna)s,
+                    least(current_date, (SELECT min({coluna})::date FROM {tabela}_padrao)),
+                    (current_date + make_interval(months => %(meses)s))::date
+                ) AS criadas;
+                """,
+                {"tabela": tabela, "coluna": coluna, "meses": meses_a_frente}
+            )
+            criadas += cursor.fetchone()['criadas']
+    conn.commit()
+    return criadas
+
+
+def ensure_partitions_once():
+    """
+    Garante as partições futuras uma vez por processo, na inicialização do aplicativo.
+    """
+    global _garantidas
+    with _garantidas_lock:
+        if _garantidas:
+            return
+        _garantidas = True
+    with connection() as conn:
+        if conn:
+            try:
+                ensure_partitions(conn)
+            except Exception as e:
+                conn.rollback()
+                print(f"Erro ao criar partições: {e}")
+
+
+def list_partitions(conn, tabela):
+    """
+    Partições mensais de uma tabela como {nome: (mês, anexada)}, incluindo as
+    desanexadas por um arquivamento interrompido.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname AS nome, i.inhparent IS NOT NULL AS anexada
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+            WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace
+              AND c.relname ~ %s;
+            """,
+            (rf"^{tabela}_\d{{4}}_\d{{2}}$",)
+        )
+        registros = cursor.fetchall()
+    conn.commit()
+    return {r['nome']: (_month(r['nome'], tabela), r['anexada']) for r in registros}
+
+
+def archive_path(tabela, mes, destino=ARCHIVE_DIR, parte=1):
+    sufixo = "" if parte == 1 else f"_{parte}"
+    return Path(destino) / tabela / f"{tabela}_{mes:%Y_%m}{sufixo}.parquet"
+
+
+def _arrow_schema(tabela):
+    import pyarrow as pa
+
+    tipos = {
+        "int": pa.int64(), "str": pa.string(), "date": pa.date32(),
+        "time": pa.time64("us"), "datetime": pa.timestamp("us"),
+    }
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo, _ in TABELAS[tabela]["colunas"]])
+
+
+def archive_partition(conn, tabela, particao, mes, anexada=True, destino=ARCHIVE_DIR):
+    """
+    Desanexa uma partição, grava suas linhas em Parquet e a remove. Retorna as linhas arquivadas.
+
+    O arquivo é escrito com outro nome e renomeado no fim, e a tabela só é
+    removida depois disso; uma execução interrompida é retomada na próxima.
+    Um mês arquivado de novo (por exemplo, após importar dados antigos) ganha
+    um arquivo adicional, <tabela>_AAAA_MM_2.parquet.
+    """
+    import pyarrow.parquet as pq
+
+    if anexada:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao};")
+        conn.commit()
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) AS linhas FROM {particao};")
+        linhas = cursor.fetchone()['linhas']
+    conn.commit()
+
+    parte = 1
+    while archive_path(tabela, mes, destino, parte).exists():
+        caminho = archive_path(tabela, mes, destino, parte)
+        if not anexada and pq.ParquetFile(caminho).metadata.num_rows == linhas:
+            # Arquivo gravado por uma execução interrompida antes do DROP
+            parte = None
+            break
+        parte += 1
+
+    if parte is None:
+        total = linhas
+    else:
+        total = _write_partition(conn, tabela, particao, archive_path(tabela, mes, destino, parte))
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {particao};")
+    conn.commit()
+    return total
+
+
+def _write_partition(conn, tabela, particao, caminho):
+    """
+    Grava as linhas de uma partição desanexada em `caminho`, ordenadas por paciente.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    definicao = TABELAS[tabela]
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(".parquet.tmp")
+    schema = _arrow_schema(tabela)
+    selecao = ", ".join(expressao for _, _, expressao in definicao["colunas"])
+    total = 0
+    with pq.ParquetWriter(temporario, schema, compression="zstd") as writer:
+        with conn.cursor(name=f"arquivo_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.itersize = CHUNK_SIZE
+            cursor.execute(f"SELECT {selecao} FROM {particao} ORDER BY {definicao['ordem']};")
+            while True:
+                bloco = cursor.fetchmany(CHUNK_SIZE)
+                if not bloco:
+                    break
+                colunas = list(zip(*bloco))
+                writer.write_batch(pa.record_batch(
+                    [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, schema)],
+                    schema=schema
+                ))
+                total += len(bloco)
+        conn.commit()
+    temporario.replace(caminho)
+    return total
+
+
+def archive_old_partitions(conn, meses_retidos=MESES_RETIDOS, destino=ARCHIVE_DIR, verbose=True):
+    """
+    Arquiva as partições de meses anteriores ao período de retenção.
+    Retorna {partição: linhas arquivadas}.
+    """
+    limite = _add_months(date.today().replace(day=1), -meses_retidos)
+    arquivadas = {}
+    for tabela in TABELAS:
+        for particao, (mes, anexada) in sorted(list_partitions(conn, tabela).items()):
+            if mes >= limite:
+                continue
+            arquivadas[particao] = archive_partition(conn, tabela, particao, mes, anexada, destino)
+            if verbose:
+                print(f"{particao}: {arquivadas[particao]} linhas arquivadas")
+    return arquivadas
+
+
+def archived_files(tabela, inicio=None, fim=None, destino=ARCHIVE_DIR):
+    """
+    Arquivos Parquet de uma tabela cujos meses se sobrepõem ao período.
+    """
+    arquivos = []
+    for caminho in sorted((Path(destino) / tabela).glob(f"{tabela}_*.parquet")):
+        mes = _month(caminho.stem, tabela)
+        if mes is None:
+            continue
+        if inicio is not None and _add_months(mes, 1) <= inicio:
+            continue
+        if fim is not None and mes > fim:
+            continue
+        arquivos.append(caminho)
+    return arquivos
+
+
+def iter_archived(tabela, paciente_ids=None, inicio=None, fim=None, colunas=None,
+                  tamanho_bloco=CHUNK_SIZE, destino=ARCHIVE_DIR):
+    """
+    Lê as linhas arquivadas de uma tabela em blocos (pyarrow.RecordBatch), filtrando
+    por pacientes e período. Só abre os arquivos dos meses do período, e os filtros
+    são aplicados com as estatísticas de cada row group.
+    """
+    arquivos = archived_files(tabela, inicio, fim, destino)
+    if not arquivos:
+        return
+    import pyarrow.dataset as ds
+
+    campo_data = ds.field(TABELAS[tabela]["coluna"])
+    filtro = None
+    condicoes = []
+    if paciente_ids is not None:
+        condicoes.append(ds.field("paciente_id").isin(list(paciente_ids)))
+    if inicio is not None:
+        condicoes.append(campo_data >= inicio)
+    if fim is not None:
+        condicoes.append(campo_data <= fim if tabela == "diario" else campo_data < _next_day(fim))
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+
+    dataset = ds.dataset([str(a) for a in arquivos], schema=_arrow_schema(tabela), format="parquet")
+    yield from dataset.to_batches(columns=colunas, filter=filtro, batch_size=tamanho_bloco)
+
+
+def fetch_archived_diary(paciente_id, inicio, fim):
+    """
+    Registros arquivados do diário de um paciente no período, no formato das páginas.
+    """
+    registros = []
+    for bloco in iter_archived("diario", [paciente_id], inicio, fim, ["data", "hora", "tipo", "detalhes"]):
+        registros.extend(bloco.to_pylist())
+    return registros
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cria partições futuras e arquiva partições antigas.")
+    parser.add_argument("--criar", action="store_true", help="Cria as partições dos próximos meses.")
+    parser.add_argument("--meses", type=int, default=MESES_A_FRENTE, help="Meses criados com antecedência.")
+    parser.add_argument("--arquivar", action="store_true", help="Arquiva as partições antigas em Parquet.")
+    parser.add_argument("--reter", type=int, default=MESES_RETIDOS, help="Meses mantidos no banco.")
+    parser.add_argument("--destino", type=Path, default=ARCHIVE_DIR, help="Diretório dos arquivos Parquet.")
+    args = parser.parse_args(argv)
+    if not (args.criar or args.arquivar):
+        parser.error("informe --criar e/ou --arquivar")
+
+    conn = get_connection()
+    if conn is None:
+        return 1
+    try:
+        if args.criar:
+            print(f"Partições criadas: {ensure_partitions(conn, args.meses)}")
+        if args.arquivar:
+            arquivadas = archive_old_partitions(conn, args.reter, args.destino)
+            print(f"Partições arquivadas: {len(arquivadas)}")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro na manutenção das partições: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Situação das réplicas de leitura e do roteamento de leituras (db.read_connection).
+
+Para cada réplica configurada em MEDTRACK_DB_REPLICAS, mostra o atraso em
+segundos e em bytes de WAL em relação ao primário e se está no rodízio (ou por
+que não está: fora de recuperação, receptor de WAL desconectado etc.). Em
+seguida faz três leituras pelo cache e diz qual servidor respondeu a cada uma:
+
+- uma consulta sem gravação recente (deve ir a uma réplica disponível);
+- a mesma consulta logo depois de invalidar sua tag (deve ir ao primário);
+- uma leitura com primario=True.
+
+    python replicas.py
+"""
+import sys
+
+from cache import cached_fetchall, invalidate
+from db import DB_CONFIG, READ_YOUR_WRITES_WINDOW, REPLICA_MAX_LAG, get_replicas, read_connection
+
+
+_SERVIDOR = "SELECT inet_server_addr()::text AS endereco, inet_server_port() AS porta, " \
+            "pg_is_in_recovery() AS replica, %s AS chamada;"
+
+
+def _describe(linhas):
+    if not linhas:
+        return "sem conexão"
+    linha = linhas[0]
+    papel = "réplica" if linha['replica'] else "primário"
+    return f"{papel} ({linha['endereco'] or 'socket local'}:{linha['porta']})"
+
+
+def main(argv=None):
+    replicas = get_replicas()
+    primario = DB_CONFIG.get("dsn") or f"{DB_CONFIG['host']}:{DB_CONFIG['port']}"
+    print(f"Primário: {primario}")
+    print(f"Atraso máximo: {REPLICA_MAX_LAG:.1f}s | leituras após gravação no primário por "
+          f"{READ_YOUR_WRITES_WINDOW:.1f}s")
+    if not replicas:
+        print("Nenhuma réplica configurada (MEDTRACK_DB_REPLICAS).")
+
+    for replica in replicas:
+        replica.check(forcar=True)
+        descricao = f"Réplica {replica.nome}: "
+        if replica.atraso is None:
+            print(descricao + f"fora do rodízio ({replica.erro})")
+            continue
+        print(descricao + f"atraso {replica.atraso:.2f}s, {replica.atraso_bytes:.0f} bytes de WAL; "
+              + ("no rodízio" if replica.disponivel else "fora do rodízio"))
+
+    tags = [("replicas_verificacao",)]
+    print(f"Leitura comum: {_describe(cached_fetchall(_SERVIDOR, ('comum',), tags))}")
+    invalidate(*tags)
+    print(f"Leitura logo após gravação: {_describe(cached_fetchall(_SERVIDOR, ('apos_gravacao',), tags))}")
+    with read_connection(primario=True) as conn:
+        if conn is None:
+            return 1
+        with conn.cursor() as cursor:
+            cursor.execute(_SERVIDOR, ("primario",))
+            print(f"Leitura com primario=True: {_describe(cursor.fetchall())}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+from datetime import date, datetime, time, timedelta
+
+import streamlit as st
+
+from cache import cached_fetchall
+
+
+# Partes do resumo, cada uma uma subconsulta com agregação JSON
+SNAPSHOT_SECTIONS = {
+    "paciente": """(
+            SELECT json_build_object('id', p.id, 'nome', p.nome, 'idade', p.idade, 'sexo', p.sexo,
+                                     'altura', p.altura, 'peso', p.peso)
+            FROM pacientes p
+            WHERE p.id = %(paciente_id)s
+        )""",
+    "medicamentos": """coalesce((
+            SELECT json_agg(json_build_object('id', m.id, 'nome', m.nome, 'frequencia', m.frequencia,
+                                              'categoria', m.categoria, 'observacoes', m.observacoes,
+                                              'horario_inicio', m.horario_inicio,
+                                              'intervalo_horas', m.intervalo_horas)
+                            ORDER BY m.id)
+            FROM medicamentos m
+            WHERE m.paciente_id = %(paciente_id)s
+        ), '[]'::json)""",
+    "doses": """coalesce((
+            SELECT json_agg(json_build_object('medicamento_id', t.medicamento_id, 'dose', t.dose,
+                                              'data_hora', t.data_hora)
+                            ORDER BY t.data_hora)
+            FROM doses_tomadas t
+            WHERE t.paciente_id = %(paciente_id)s
+              AND t.data_hora >= %(data)s AND t.data_hora < %(dia_seguinte)s
+        ), '[]'::json)""",
+    "diario": """coalesce((
+            SELECT json_agg(json_build_object('tipo', d.tipo, 'data', d.data, 'hora', d.hora,
+                                              'detalhes', d.detalhes, 'valores', d.valores)
+                            ORDER BY d.data, d.hora)
+            FROM diario d
+            WHERE d.paciente_id = %(paciente_id)s
+              AND d.data BETWEEN %(inicio_diario)s AND %(data)s
+        ), '[]'::json)""",
+    "resumo_dia": """(
+            SELECT row_to_json(r)
+            FROM diario_resumo r
+            WHERE r.paciente_id = %(paciente_id)s AND r.data = %(data)s
+        )""",
+}
+
+# Tag de cache de que cada parte depende (o paciente_id é acrescentado, exceto em "pacientes")
+SECTION_TAGS = {
+    "paciente": "pacientes",
+    "medicamentos": "medicamentos",
+    "doses": "doses",
+    "diario": "diario",
+    "resumo_dia": "diario",
+}
+
+
+
+def _empty(secao):
+    return {"paciente": None, "medicamentos": [], "doses": {}, "diario": [], "resumo_dia": None}[secao]
+
+
+def snapshot_sql(secoes=tuple(SNAPSHOT_SECTIONS)):
+    """
+    Monta a consulta única que traz as partes `secoes` do resumo.
+    """
+    partes = ",\n        ".join(f"'{secao}', {SNAPSHOT_SECTIONS[secao]}" for secao in secoes)
+    return f"""
+    SELECT json_build_object(
+        {partes}
+    ) AS resumo;
+"""
+
+
+SNAPSHOT_SQL = snapshot_sql()
+
+
+def snapshot_tags(paciente_id, secoes=tuple(SNAPSHOT_SECTIONS)):
+    """
+    Tags de cache das quais as partes `secoes` dependem.
+    """
+    tags = []
+    for secao in secoes:
+        tag = ("pacientes",) if SECTION_TAGS[secao] == "pacientes" else (SECTION_TAGS[secao], paciente_id)
+        if tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _snapshot_from_json(resumo):
+    """
+    Converte datas e horas do JSON de volta para objetos do Python.
+    """
+    convertido = dict(resumo)
+    if "medicamentos" in resumo:
+        convertido["medicamentos"] = [
+            {**m, "horario_inicio": time.fromisoformat(m["horario_inicio"])}
+            for m in resumo["medicamentos"]
+        ]
+    if "doses" in resumo:
+        convertido["doses"] = {
+            (d["medicamento_id"], d["dose"]): datetime.fromisoformat(d["data_hora"])
+            for d in resumo["doses"]
+        }
+    if "diario" in resumo:
+        convertido["diario"] = [
+            {**r, "data": date.fromisoformat(r["data"]), "hora": time.fromisoformat(r["hora"])}
+            for r in resumo["diario"]
+        ]
+    return convertido
+
+
+def fetch_patient_snapshot(paciente_id, data=None, dias_diario=1, secoes=None):
+    """
+    Obtém, em uma única ida ao banco, o resumo de um paciente:
+
+    - "paciente": dados cadastrais (None se o paciente não existir);
+    - "medicamentos": lista de medicamentos;
+    - "doses": doses confirmadas no dia `data`, como {(medicamento_id, dose): data_hora};
+    - "diario": registros dos `dias_diario` dias que terminam em `data`;
+    - "resumo_dia": linha de diario_resumo do dia `data` (None se não houver registros).
+
+    `secoes` restringe a consulta a algumas dessas partes, e o cache à invalidação
+    só das tags delas (ex.: o painel de doses não é relido quando o diário muda).
+    """
+    secoes = tuple(secoes or SNAPSHOT_SECTIONS)
+    data = data or datetime.now().date()
+    parametros = {
+        "paciente_id": paciente_id,
+        "data": data,
+        "dia_seguinte": data + timedelta(days=1),
+        "inicio_diario": data - timedelta(days=dias_diario - 1),
+    }
+    try:
+        registros = cached_fetchall(
+            snapshot_sql(secoes), parametros, tags=snapshot_tags(paciente_id, secoes)
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar dados do paciente: {e}")
+        registros = []
+    if not registros:
+        return {secao: _empty(secao) for secao in secoes}
+    return _snapshot_from_json(registros[0]['resumo'])
@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import psycopg2.extensions
+import streamlit as st
+
+from diario_resumo import fetch_daily_summaries
+from diario_valores import VITAIS
+
+
+# Granularidade -> (regra de resample do pandas, períodos da média móvel)
+GRANULARIDADES = {
+    "Diária": ("D", 7),
+    "Semanal": ("W-MON", 4),
+    "Mensal": ("MS", 3),
+}
+
+# Cursor que devolve tuplas, para montar os DataFrames sem passar por dicionários
+_TUPLE_CURSOR = psycopg2.extensions.cursor
+
+# Colunas de diario_resumo usadas por cada gráfico
+COLUNAS_VITAIS = [f"{chave}_{medida}" for chave in VITAIS for medida in ("soma", "n")]
+COLUNAS_LIQUIDOS = ["entrada_ml", "saida_ml"]
+COLUNAS_DOR = ["intensidade_max", "intensidade_soma", "intensidade_n"]
+
+
+def fetch_daily_summary(paciente_id, inicio, fim):
+    """
+    Totais diários de sinais vitais, líquidos e dor, lidos de diario_resumo
+    (uma linha por dia com registros) e indexados pela data.
+    """
+    selecao = COLUNAS_VITAIS + COLUNAS_LIQUIDOS + [
+        "dor_max AS intensidade_max", "dor_soma AS intensidade_soma", "dor_n AS intensidade_n"
+    ]
+    registros = fetch_daily_summaries(paciente_id, inicio, fim, selecao, cursor_factory=_TUPLE_CURSOR)
+    df = pd.DataFrame.from_records(registros, columns=["data"] + COLUNAS_VITAIS + COLUNAS_LIQUIDOS + COLUNAS_DOR)
+    df["data"] = pd.to_datetime(df["data"])
+    return df.set_index("data").astype("float64")
+
+
+def _calendar(df, inicio, fim):
+    """
+    Reindexa um DataFrame diário para todos os dias do intervalo.
+    """
+    return df.reindex(pd.date_range(inicio, fim, freq="D"))
+
+
+def vital_trends(diario_vitais, inicio, fim, granularidade="Diária"):
+    """
+    Média de cada sinal vital por período e sua média móvel.
+    Retorna um DataFrame com colunas "<chave>" e "<chave>_movel".
+    """
+    regra, janela = GRANULARIDADES[granularidade]
+    periodos = _calendar(diario_vitais, inicio, fim).fillna(0.0).resample(regra).sum()
+
+    tendencias = pd.DataFrame(index=periodos.index)
+    for chave in VITAIS:
+        soma = periodos[f"{chave}_soma"].to_numpy()
+        n = periodos[f"{chave}_n"].to_numpy()
+        media = np.divide(soma, n, out=np.full_like(soma, np.nan), where=n > 0)
+        # Média móvel ponderada pela quantidade de medições de cada período
+        soma_movel = pd.Series(soma, index=periodos.index).rolling(janela, min_periods=1).sum().to_numpy()
+        n_movel = pd.Series(n, index=periodos.index).rolling(janela, min_periods=1).sum().to_numpy()
+        tendencias[chave] = media
+        tendencias[f"{chave}_movel"] = np.divide(soma_movel, n_movel, out=np.full_like(soma_movel, np.nan), where=n_movel > 0)
+    return tendencias
+
+
+def fluid_balance(diario_liquidos, inicio, fim, granularidade="Diária"):
+    """
+    Totais de entrada e saída de líquidos por período, com balanço e média móvel do balanço.
+    """
+    regra, janela = GRANULARIDADES[granularidade]
+    totais = _calendar(diario_liquidos, inicio, fim).fillna(0.0).resample(regra).sum()
+    totais["balanco_ml"] = totais["entrada_ml"].to_numpy() - totais["saida_ml"].to_numpy()
+    totais["balanco_movel"] = totais["balanco_ml"].rolling(janela, min_periods=1).mean()
+    return totais
+
+
+def pain_curve(diario_dor, inicio, fim, granularidade="Diária"):
+    """
+    Intensidade máxima e média da dor por período.
+    """
+    regra, _ = GRANULARIDADES[granularidade]
+    calendario = _calendar(diario_dor, inicio, fim)
+    periodos = pd.DataFrame({
+        "intensidade_max": calendario["intensidade_max"].resample(regra).max(),
+        "intensidade_soma": calendario["intensidade_soma"].fillna(0.0).resample(regra).sum(),
+        "intensidade_n": calendario["intensidade_n"].fillna(0.0).resample(regra).sum(),
+    })
+    soma = periodos["intensidade_soma"].to_numpy()
+    n = periodos["intensidade_n"].to_numpy()
+    periodos["intensidade_media"] = np.divide(soma, n, out=np.full_like(soma, np.nan), where=n > 0)
+    return periodos[["intensidade_max", "intensidade_media"]]
+
+
+def _line(fig, x, y, nome, tracejado=False):
+    fig.add_trace(go.Scatter(
+        x=x, y=y, name=nome, mode="lines" if tracejado else "lines+markers",
+        line={"dash": "dash"} if tracejado else None, connectgaps=tracejado
+    ))
+
+
+def trends_options():
+    """
+    Seletores de período e agrupamento da seção de tendências. Retorna
+    (inicio, fim, granularidade), ou None enquanto o período estiver incompleto.
+    """
+    hoje = datetime.now().date()
+    col_periodo, col_granularidade = st.columns([0.7, 0.3])
+    with col_periodo:
+        periodo = st.date_input(
+            "Período", value=(hoje - timedelta(days=30), hoje), key="tendencias_periodo"
+        )
+    with col_granularidade:
+        granularidade = st.selectbox("Agrupar por", list(GRANULARIDADES), key="tendencias_granularidade")
+
+    if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+        st.info("Selecione a data inicial e a final.")
+        return None
+    return periodo[0], periodo[1], granularidade
+
+
+def load_trends(paciente_id, inicio, fim):
+    """
+    Totais diários da seção de tendências; None (com o erro exibido) se a leitura falhar.
+    """
+    try:
+        return fetch_daily_summary(paciente_id, inicio, fim)
+    except Exception as e:
+        st.error(f"Erro ao calcular tendências: {e}")
+    return None
+
+
+def render_trends(paciente_id, opcoes=None, resumo=None):
+    """
+    Seção de tendências de sinais vitais, balanço hídrico e dor de um paciente.
+    `opcoes` (de trends_options) e `resumo` (de load_trends) podem vir já lidos,
+    quando a página faz as leituras em paralelo.
+    """
+    if opcoes is None:
+        opcoes = trends_options()
+        if opcoes is None:
+            return
+    inicio, fim, granularidade = opcoes
+    if resumo is None:
+        resumo = load_trends(paciente_id, inicio, fim)
+        if resumo is None:
+            return
+
+    try:
+        vitais = vital_trends(resumo[COLUNAS_VITAIS], inicio, fim, granularidade)
+        liquidos = fluid_balance(resumo[COLUNAS_LIQUIDOS], inicio, fim, granularidade)
+        dor = pain_curve(resumo[COLUNAS_DOR], inicio, fim, granularidade)
+    except Exception as e:
+        st.error(f"Erro ao calcular tendências: {e}")
+        return
+
+    # Sinais vitais
+    selecionados = st.multiselect(
+        "Sinais vitais", list(VITAIS), default=["o2", "fc", "temperatura"],
+        format_func=VITAIS.get, key="tendencias_vitais"
+    )
+    for chave in selecionados:
+        if vitais[chave].isna().all():
+            st.caption(f"{VITAIS[chave]}: sem medições no período.")
+            continue
+        fig = go.Figure()
+        _line(fig, vitais.index, vitais[chave], "Média")
+        _line(fig, vitais.index, vitais[f"{chave}_movel"], "Média móvel", tracejado=True)
+        fig.update_layout(title=VITAIS[chave], height=300, margin={"t": 40, "b": 20})
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Balanço hídrico
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=liquidos.index, y=liquidos["entrada_ml"], name="Entrada (ml)"))
+    fig.add_trace(go.Bar(x=liquidos.index, y=-liquidos["saida_ml"], name="Saída - urina (ml)"))
+    _line(fig, liquidos.index, liquidos["balanco_movel"], "Balanço (média móvel)", tracejado=True)
+    fig.update_layout(title="Balanço Hídrico", barmode="relative", height=350, margin={"t": 40, "b": 20})
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Dor
+    if dor["intensidade_max"].isna().all():
+        st.caption("Nenhum registro de dor no período.")
+    else:
+        fig = go.Figure()
+        _line(fig, dor.index, dor["intensidade_max"], "Intensidade máxima")
+        _line(fig, dor.index, dor["intensidade_media"], "Intensidade média", tracejado=True)
+        fig.update_layout(title="Intensidade da Dor (0-10)", yaxis={"range": [0, 10]}, height=300, margin={"t": 40, "b": 20})
+        st.plotly_chart(fig, use_container_width=True)
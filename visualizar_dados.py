@@ -1,102 +1,114 @@
 import streamlit as st
 import pandas as pd
-from db import get_connection  # Função para conexão ao banco de dados
-from datetime import datetime
-
-def fetch_patients():
-    """
-    Obtém a lista de pacientes do banco de dados.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT id, nome FROM pacientes;")
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar pacientes: {e}")
-        finally:
-            conn.close()
-    return []
-
-def fetch_medications(paciente_id):
-    """
-    Obtém a lista de medicamentos para um paciente específico.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT nome AS Nome, frequencia AS Frequência, categoria AS Categoria, observacoes AS Observações
-                    FROM medicamentos
-                    WHERE paciente_id = %s;
-                    """,
-                    (paciente_id,)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar medicamentos: {e}")
-        finally:
-            conn.close()
-    return []
-
-def fetch_diary_entries(paciente_id):
-    """
-    Obtém os registros do diário para um paciente específico.
-    """
-    conn = get_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT data, tipo, detalhes, hora
-                    FROM diario
-                    WHERE paciente_id = %s
-                    ORDER BY data, hora;
-                    """,
-                    (paciente_id,)
-                )
-                return cursor.fetchall()
-        except Exception as e:
-            st.error(f"Erro ao buscar registros do diário: {e}")
-        finally:
-            conn.close()
-    return []
+from tendencias import load_trends, render_trends, trends_options
+from exportacao import render_export
+from resumo_paciente import fetch_patient_snapshot
+from adesao import patient_adherence, period_input, render_patient_adherence, render_ward_adherence, ward_adherence
+from agenda import prefetch_due_doses, render_due_doses
+from datetime import datetime, timedelta
+from particoes import fetch_archived_diary
+from diretorio_pacientes import patient_selector
+from notificacoes import watch
+from concorrencia import fetch_concurrently
 
 def view_data():
     """
     Interface para visualizar os dados de pacientes, medicamentos e diário.
+    Os seletores são desenhados primeiro; as leituras independentes da página
+    são feitas em paralelo e os resultados preenchem as seções em seguida.
     """
-    # Buscar pacientes do banco
-    pacientes = fetch_patients()
-    lista_pacientes = [f"{p['id']} - {p['nome']}" for p in pacientes]
+    # Adesão de todos os pacientes
+    with st.expander("Adesão à Medicação da Ala"):
+        periodo_ala = period_input("adesao_ala_periodo")
+        secao_adesao_ala = st.container()
+    secao_doses_ala = st.expander("Doses Atrasadas e Previstas da Ala")
 
-    if lista_pacientes:
-        paciente_selecionado = st.selectbox("Selecione o Paciente", lista_pacientes)
-        paciente_id = int(paciente_selecionado.split(" - ")[0])
+    leituras = {"doses_ala": (prefetch_due_doses,)}
+    if periodo_ala is not None:
+        leituras["adesao_ala"] = (ward_adherence, *periodo_ala)
+
+    paciente_id = patient_selector("visualizar_paciente")
+    if paciente_id is not None:
+        dias_diario = st.selectbox(
+            "Período do diário (dias)", [7, 30, 90, 365], index=1, key="visualizar_dias_diario"
+        )
+        secao_paciente = st.container()
 
-        # Exibir informações do paciente
-        st.subheader(f"Informações do Paciente: {paciente_selecionado.split(' - ')[1]}")
-        
         # Medicamentos
         st.subheader("Medicamentos")
-        medicamentos = fetch_medications(paciente_id)
-        if medicamentos:
-            medicamentos_df = pd.DataFrame(medicamentos)
-            st.dataframe(medicamentos_df)
-        else:
-            st.warning("Nenhum medicamento cadastrado para este paciente.")
+        secao_medicamentos = st.container()
+
+        # Adesão
+        st.subheader("Adesão à Medicação")
+        periodo_paciente = period_input("adesao_paciente_periodo")
+        secao_adesao = st.container()
+
+        # Tendências
+        st.subheader("Tendências")
+        opcoes_tendencias = trends_options()
+        secao_tendencias = st.container()
+
+        # Cadastro, medicamentos e diário recente em uma única consulta; meses
+        # já arquivados em Parquet complementam os registros do banco
+        hoje = datetime.now().date()
+        leituras["resumo"] = (fetch_patient_snapshot, paciente_id, None, dias_diario)
+        leituras["arquivo"] = (fetch_archived_diary, paciente_id, hoje - timedelta(days=dias_diario - 1), hoje)
+        if periodo_paciente is not None:
+            leituras["adesao"] = (patient_adherence, paciente_id, *periodo_paciente)
+        if opcoes_tendencias is not None:
+            leituras["tendencias"] = (load_trends, paciente_id, *opcoes_tendencias[:2])
+
+    lidos = dict(zip(leituras, fetch_concurrently(*leituras.values())))
+
+    if periodo_ala is not None:
+        with secao_adesao_ala:
+            render_ward_adherence(periodo_ala, lidos["adesao_ala"])
+    with secao_doses_ala:
+        render_due_doses()
+
+    if paciente_id is not None:
+        resumo = lidos["resumo"]
+        paciente = resumo['paciente']
+        registros_diario = lidos["arquivo"] + resumo['diario']
+
+        # Exibir informações do paciente
+        if paciente:
+            with secao_paciente:
+                st.subheader(f"Informações do Paciente: {paciente['nome']}")
+                st.write(
+                    f"**Idade:** {paciente['idade']} | **Sexo:** {paciente['sexo']} | "
+                    f"**Altura:** {paciente['altura']} cm | **Peso:** {paciente['peso']} kg"
+                )
+
+        with secao_medicamentos:
+            if resumo['medicamentos']:
+                medicamentos_df = pd.DataFrame(resumo['medicamentos']).rename(columns={
+                    "nome": "Nome", "frequencia": "Frequência", "categoria": "Categoria", "observacoes": "Observações"
+                })
+                st.dataframe(medicamentos_df[["Nome", "Frequência", "Categoria", "Observações"]])
+            else:
+                st.warning("Nenhum medicamento cadastrado para este paciente.")
+
+        if periodo_paciente is not None:
+            with secao_adesao:
+                render_patient_adherence(paciente_id, periodo_paciente, lidos["adesao"])
+
+        # Sem resumo, o erro da leitura já foi exibido
+        if lidos.get("tendencias") is not None:
+            with secao_tendencias:
+                render_trends(paciente_id, opcoes_tendencias, lidos["tendencias"])
 
         # Diário
-        st.subheader("Diário")
-        registros_diario = fetch_diary_entries(paciente_id)
+        st.subheader(f"Diário (últimos {dias_diario} dias)")
         if registros_diario:
             diario_df = pd.DataFrame(registros_diario)
-            st.dataframe(diario_df)
+            st.dataframe(diario_df[["data", "tipo", "detalhes", "hora"]])
         else:
-            st.warning("Nenhum registro no diário para este paciente.")
-    else:
-        st.warning("Nenhum paciente cadastrado.")
+            st.warning("Nenhum registro no diário para este paciente no período.")
+
+        # Exportação
+        st.subheader("Exportar Dados")
+        render_export(paciente_id)
+
+        # Alterações de outras sessões neste paciente reexecutam a página
+        watch(paciente_id, ("paciente", "medicamentos", "diario"))